@@ -136,15 +136,8 @@ subroutine analysis(Far,tol, dmax,sc_size,xR2_list,xR3_list,alat, tau, tensor,we
     !
     end do
     !
-    if ( .not. Found ) then
-            write(*,*) " "
-            write(*,*) " ERROR: no nonzero triplets found during centering,      "
-            write(*,*) "        the execution stops here.                        "
-            write(*,*) "        Relax the constraint imposed                     "
-            write(*,*) "        on the maximum distance allowed (nneigh)         " 
-            write(*,*) " "
-            stop    
-    end if
+    ! NOTE: if no triplet is found (.not. Found) all the weights are zero.
+    ! The check is done by the caller, as this subroutine can be called on a chunk of blocks.
     !
 end subroutine analysis
 !=================================================================================
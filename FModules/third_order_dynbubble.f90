@@ -16,6 +16,7 @@ subroutine compute_static_bubble(T,freq,is_gamma,D3,n_mod,bubble)
     !
     real(kind=DP) :: Lambda_23,q2(n_mod,3),q3(n_mod,3)
     integer :: i, rho2, rho3, nu,mu
+    complex(kind=DP), allocatable :: D3_conj(:,:,:), D3_lambda(:,:,:)
 
     
     ! 
@@ -43,23 +44,28 @@ subroutine compute_static_bubble(T,freq,is_gamma,D3,n_mod,bubble)
     call bose_freq(T, n_mod, freq(:,3), q3(:,3))        
 
     !
-    bubble=(0.0_dp,0.0_dp)
+    ! bubble(mu,nu) = sum_{rho2,rho3} CONJG(D3(mu,rho2,rho3))*Lambda_23*D3(nu,rho2,rho3)
+    ! D3 is seen as a (n_mod, n_mod**2) matrix, Lambda is contracted in its columns
+    ! and the sum is performed by a single ZGEMM
+    !
+    allocate(D3_conj(n_mod,n_mod,n_mod), D3_lambda(n_mod,n_mod,n_mod))
+    D3_conj = CONJG(D3)
     !
     DO rho3=1,n_mod
     DO rho2=1,n_mod
             !
             call Lambda(T,q2(rho2,:),q3(rho3,:),Lambda_23)
             !
-            DO nu = 1,n_mod
-            DO mu = 1,n_mod
-                   bubble(mu,nu) = bubble(mu,nu) +  & 
-                                     CONJG(D3(mu,rho2,rho3))*Lambda_23*D3(nu,rho2,rho3)
-            END DO
-            END DO 
+            D3_lambda(:,rho2,rho3) = Lambda_23*D3(:,rho2,rho3)
             !
     END DO
     END DO    
     !
+    call ZGEMM('N', 'T', n_mod, n_mod, n_mod**2, (1.0_dp,0.0_dp), D3_conj, n_mod, &
+               D3_lambda, n_mod, (0.0_dp,0.0_dp), bubble, n_mod)
+    !
+    deallocate(D3_conj, D3_lambda)
+    !
 end subroutine compute_static_bubble
 !
 !
@@ -83,8 +89,9 @@ subroutine compute_dynamic_bubble(energies,sigma,static_limit,T,freq,is_gamma,D3
     integer, intent(IN) :: n_mod
     !
     real(kind=DP)    :: q2(n_mod,3),q3(n_mod,3)
-    complex(kind=DP) :: Lambda_23(ne,nsig)    
-    integer :: i, rho2, rho3, nu,mu
+    integer :: i, rho2, rho3, nu,mu, ie, isig, ipoint
+    complex(kind=DP), allocatable :: Lambda_23(:,:,:,:), D3_conj(:,:,:), D3_lambda(:,:,:)
+    complex(kind=DP), allocatable :: D3_abs2(:,:,:), bubble_diag(:,:,:), bubble_point(:,:)
 
     
     ! 
@@ -111,39 +118,83 @@ subroutine compute_dynamic_bubble(energies,sigma,static_limit,T,freq,is_gamma,D3
     call bose_freq(T, n_mod, freq(:,2), q2(:,3))
     call bose_freq(T, n_mod, freq(:,3), q3(:,3))        
     !
-    bubble=(0.0_dp,0.0_dp)
+    ! The Lambda for all the energies, smearings and (rho2, rho3) couples
+    !
+    allocate(Lambda_23(ne,nsig,n_mod,n_mod))
     !
+    !$OMP PARALLEL DO PRIVATE(rho2) COLLAPSE(2)
     DO rho3=1,n_mod
     DO rho2=1,n_mod
+            call Lambda_dynamic(ne,energies,nsig,sigma,T,static_limit,q2(rho2,:),q3(rho3,:),Lambda_23(:,:,rho2,rho3))
+    END DO
+    END DO    
+    !$OMP END PARALLEL DO
+    !
+    bubble=(0.0_dp,0.0_dp)
+    !
+    if (diag_approx) then
+        !
+        ! bubble(:,:,nu,nu) = sum_{rho2,rho3} Lambda_23(:,:,rho2,rho3) * |D3(nu,rho2,rho3)|**2
+        ! is the product of the (ne*nsig, n_mod**2) and the (n_mod**2, n_mod) matrices
+        !
+        allocate(D3_abs2(n_mod,n_mod,n_mod), bubble_diag(ne,nsig,n_mod))
+        D3_abs2 = CONJG(D3)*D3
+        !
+        call ZGEMM('N', 'T', ne*nsig, n_mod, n_mod**2, (1.0_dp,0.0_dp), Lambda_23, ne*nsig, &
+                   D3_abs2, n_mod, (0.0_dp,0.0_dp), bubble_diag, ne*nsig)
+        !
+        DO nu = 1,n_mod
+            bubble(:,:,nu,nu) = bubble_diag(:,:,nu)
+        END DO
+        !
+        deallocate(D3_abs2, bubble_diag)
+    else
+        !
+        ! For each energy and smearing:
+        ! bubble(ie,isig,mu,nu) = sum_{rho2,rho3} CONJG(D3(mu,rho2,rho3))*Lambda_23(ie,isig,rho2,rho3)*D3(nu,rho2,rho3)
+        ! is a ZGEMM of the (n_mod, n_mod**2) matrices, with Lambda contracted in D3
+        !
+        allocate(D3_conj(n_mod,n_mod,n_mod))
+        D3_conj = CONJG(D3)
+        !
+        !$OMP PARALLEL PRIVATE(ie, isig, rho2, rho3, D3_lambda, bubble_point)
+        allocate(D3_lambda(n_mod,n_mod,n_mod), bubble_point(n_mod,n_mod))
+        !$OMP DO
+        DO ipoint = 1, ne*nsig
+            ie = MOD(ipoint-1, ne) + 1
+            isig = (ipoint-1)/ne + 1
             !
-            call Lambda_dynamic(ne,energies,nsig,sigma,T,static_limit,q2(rho2,:),q3(rho3,:),Lambda_23)
+            DO rho3=1,n_mod
+            DO rho2=1,n_mod
+                D3_lambda(:,rho2,rho3) = Lambda_23(ie,isig,rho2,rho3)*D3(:,rho2,rho3)
+            END DO
+            END DO
             !
-            if (diag_approx) then
-                DO nu = 1,n_mod
-                    bubble(:,:,nu,nu) = bubble(:,:,nu,nu) +  & 
-                                        CONJG(D3(nu,rho2,rho3))*Lambda_23(:,:)*D3(nu,rho2,rho3)
-                END DO
-            else
-                DO nu = 1,n_mod
-                DO mu = 1,n_mod
-                    bubble(:,:,mu,nu) = bubble(:,:,mu,nu) +  & 
-                                        CONJG(D3(mu,rho2,rho3))*Lambda_23(:,:)*D3(nu,rho2,rho3)
-                END DO
-                END DO
-            end if
+            call ZGEMM('N', 'T', n_mod, n_mod, n_mod**2, (1.0_dp,0.0_dp), D3_conj, n_mod, &
+                       D3_lambda, n_mod, (0.0_dp,0.0_dp), bubble_point, n_mod)
             !
-    END DO
-    END DO    
+            bubble(ie,isig,:,:) = bubble_point
+        END DO
+        !$OMP END DO
+        deallocate(D3_lambda, bubble_point)
+        !$OMP END PARALLEL
+        !
+        deallocate(D3_conj)
+    end if
+    !
+    deallocate(Lambda_23)
     !
 end subroutine compute_dynamic_bubble
 !
 !
 !                                      
-subroutine compute_diag_dynamic_bubble(ne,energies,nsig,sigma,T,freq,is_gamma,D3,n_mod,bubble)
+subroutine compute_diag_dynamic_bubble(ne,energies,nsig,sigma,T,freq,is_gamma,D3,n_mod,n_sel,bubble)
     implicit none
     INTEGER, PARAMETER :: DP = selected_real_kind(14,200)
     !
-    complex(kind=DP), dimension(ne,nsig,n_mod),intent(OUT) :: bubble
+    ! The first index of D3 runs only on the n_sel selected modes of q
+    !
+    complex(kind=DP), dimension(ne,nsig,n_sel),intent(OUT) :: bubble
     !
     integer, intent(IN)       :: ne
     real(kind=DP), intent(IN) :: energies(ne)    
@@ -152,8 +203,8 @@ subroutine compute_diag_dynamic_bubble(ne,energies,nsig,sigma,T,freq,is_gamma,D3
     real(kind=DP), intent(IN) :: T
     real(kind=DP), intent(IN) :: freq(n_mod,3)
     logical      , intent(IN) :: is_gamma(3)
-    complex(kind=DP), dimension(n_mod,n_mod,n_mod), intent(IN) :: D3
-    integer, intent(IN) :: n_mod
+    complex(kind=DP), dimension(n_sel,n_mod,n_mod), intent(IN) :: D3
+    integer, intent(IN) :: n_mod, n_sel
     !
     real(kind=DP)    :: q2(n_mod,3),q3(n_mod,3)
     complex(kind=DP) :: Lambda_23(ne,nsig)   
@@ -192,7 +243,7 @@ subroutine compute_diag_dynamic_bubble(ne,energies,nsig,sigma,T,freq,is_gamma,D3
             !
             call Lambda_dynamic(ne,energies,nsig,sigma,T,static_limit,q2(rho2,:),q3(rho3,:),Lambda_23)           
             !
-            DO mu = 1,n_mod
+            DO mu = 1,n_sel
                    ! 
                    bubble(:,:,mu) = bubble(:,:,mu) +  & 
                                      CONJG(D3(mu,rho2,rho3))*Lambda_23(:,:)*D3(mu,rho2,rho3)
@@ -206,22 +257,26 @@ end subroutine compute_diag_dynamic_bubble
 !
 !
 !                                      
-subroutine compute_perturb_selfnrg(nsig,sigma,T,freq,is_gamma,D3,n_mod,selfnrg)
+subroutine compute_perturb_selfnrg(nsig,sigma,T,freq,is_gamma,D3,modes,n_mod,n_sel,selfnrg)
     implicit none
     INTEGER, PARAMETER :: DP = selected_real_kind(14,200)
     !
-    complex(kind=DP), dimension(n_mod,nsig),intent(OUT)     :: selfnrg
+    ! The first index of D3 runs only on the n_sel modes of q
+    ! listed in modes (indices starting from 1)
+    !
+    complex(kind=DP), dimension(n_sel,nsig),intent(OUT)     :: selfnrg
     !
     integer, intent(IN)       :: nsig    
     real(kind=DP), intent(IN) :: sigma(nsig)
     real(kind=DP), intent(IN) :: T
     real(kind=DP), intent(IN) :: freq(n_mod,3)
     logical      , intent(IN) :: is_gamma(3)
-    complex(kind=DP), dimension(n_mod,n_mod,n_mod), intent(IN) :: D3
-    integer, intent(IN) :: n_mod
+    complex(kind=DP), dimension(n_sel,n_mod,n_mod), intent(IN) :: D3
+    integer, intent(IN) :: modes(n_sel)
+    integer, intent(IN) :: n_mod, n_sel
     !
-    real(kind=DP)    :: q2(n_mod,3),q3(n_mod,3)
-    complex(kind=DP) :: Lambda_23_freq(n_mod,nsig)    
+    real(kind=DP)    :: q2(n_mod,3),q3(n_mod,3),w_sel(n_sel)
+    complex(kind=DP) :: Lambda_23_freq(n_sel,nsig)    
     integer :: i, rho2, rho3, nu,mu
     ! 
 !     do i = 1,n_mod
@@ -247,6 +302,7 @@ subroutine compute_perturb_selfnrg(nsig,sigma,T,freq,is_gamma,D3,n_mod,selfnrg)
     call bose_freq(T, n_mod, freq(:,2), q2(:,3))
     call bose_freq(T, n_mod, freq(:,3), q3(:,3))        
 
+    w_sel(:)=freq(modes,1)
     !
     selfnrg=(0.0_dp,0.0_dp)
     !
@@ -254,9 +310,9 @@ subroutine compute_perturb_selfnrg(nsig,sigma,T,freq,is_gamma,D3,n_mod,selfnrg)
     DO rho3=1,n_mod
     DO rho2=1,n_mod
             !
-            call Lambda_dynamic_value(n_mod,freq(:,1),nsig,sigma,T,q2(rho2,:),q3(rho3,:),Lambda_23_freq) 
+            call Lambda_dynamic_value(n_sel,w_sel,nsig,sigma,T,q2(rho2,:),q3(rho3,:),Lambda_23_freq) 
             !
-            DO mu = 1,n_mod
+            DO mu = 1,n_sel
             
                    selfnrg(mu,:)  = selfnrg(mu,:) + & 
                                      CONJG(D3(mu,rho2,rho3))*Lambda_23_freq(mu,:)*D3(mu,rho2,rho3)
@@ -319,27 +375,26 @@ subroutine compute_spectralf(smear_id,ener,d2,Pi,notransl,spectralf,mass,nat,ne,
 end subroutine compute_spectralf
 !
 !
-subroutine compute_spectralf_diag(smear_id,ener,d2_freq,selfnrg,nat,ne,nsmear,spectralf)
+subroutine compute_spectralf_diag(smear_id,ener,d2_freq,selfnrg,n_mod,ne,nsmear,spectralf)
     implicit none
     INTEGER, PARAMETER           :: DP = selected_real_kind(14,200)
     real(kind=dp),parameter      :: pi = 3.141592653589793_dp
     !
     real(kind=dp), intent(in)    :: ener(ne)
     real(kind=dp), intent(in)    :: smear_id(nsmear)    
-    integer, intent(in)          :: ne,nsmear,nat
-    real(kind=dp), intent(in)    :: d2_freq(3*nat)
-    complex(kind=dp), intent(in) :: selfnrg(ne,nsmear,3*nat)
+    integer, intent(in)          :: ne,nsmear,n_mod
+    real(kind=dp), intent(in)    :: d2_freq(n_mod)
+    complex(kind=dp), intent(in) :: selfnrg(ne,nsmear,n_mod)
     !
-    real(kind=dp), intent(out)   :: spectralf(ne,3*nat,nsmear)
+    real(kind=dp), intent(out)   :: spectralf(ne,n_mod,nsmear)
     !
-    integer                      :: nat3,mu,ismear,ie
+    integer                      :: mu,ismear,ie
     real(kind=dp)                :: a,b,denom,num
     !
-    nat3=3*nat
     spectralf=0.0_dp
     !
     DO ismear = 1,nsmear
-      DO mu = 1,nat3
+      DO mu = 1,n_mod
         DO ie = 1, ne
 
           a = ener(ie)**2-smear_id(ismear)**2-d2_freq(mu)**2-DBLE(selfnrg(ie,ismear,mu))
@@ -6,16 +6,18 @@ import cellconstructor.Phonons as Phonons
 import cellconstructor.Methods as Methods 
 import cellconstructor.symmetries as symmetries
 import cellconstructor.Units as Units
+import cellconstructor.Structure as Structure
 
 import cellconstructor.Settings as Settings
 from cellconstructor.Settings import ParallelPrint as print 
 
 
 import numpy as np
-import scipy, scipy.signal, scipy.interpolate
+import scipy, scipy.signal, scipy.interpolate, scipy.sparse
 
 import symph
 import time
+import json
 import itertools
 import thirdorder
 import secondorder
@@ -27,6 +29,61 @@ in periodic bondary systems, interpolate and multiply between
 them
 """
 
+# The dtype of the stored third order tensor for each precision (see Tensor3.SetPrecision)
+__PRECISIONS__ = {"double" : np.double, "single" : np.float32}
+
+
+def get_supercell_atom_table(unitcell_structure, supercell_structure, supercell_size, itau = None):
+    """
+    GET THE SUPERCELL ATOM TABLE
+    ============================
+
+    Build the table that gives the index of the atom in the supercell
+    from the lattice vector (cell) and the index of the atom in the unit cell.
+    The cells are ordered as in Methods.one_to_three_len, the lattice vectors are
+    considered modulo the supercell.
+
+    Parameters
+    ----------
+        unitcell_structure : Structure()
+            The structure in the unit cell
+        supercell_structure : Structure()
+            The structure in the supercell
+        supercell_size : list of 3 int
+            The dimension of the supercell
+        itau : ndarray(nat_sc, dtype = int), optional
+            The correspondance between the supercell atoms and the unit cell (starting from 0).
+            If None it is computed.
+
+    Results
+    -------
+        table : ndarray(size = (n_sup, nat), dtype = int)
+            table[i_cell, na] is the index in the supercell of the atom na in the cell i_cell.
+    """
+
+    nat = unitcell_structure.N_atoms
+    nat_sc = supercell_structure.N_atoms
+    n_sup = np.prod(supercell_size)
+
+    if itau is None:
+        itau = supercell_structure.get_itau(unitcell_structure) - 1
+    itau = np.array(itau, dtype = int)
+
+    # Get the lattice vector of each atom of the supercell in crystal coordinates
+    R_cryst = Methods.covariant_coordinates(unitcell_structure.unit_cell, 
+                                            supercell_structure.coords - unitcell_structure.coords[itau, :])
+    x_cell = np.rint(R_cryst).astype(int) % np.array(supercell_size)
+    i_cell = (x_cell[:, 0] * supercell_size[1] + x_cell[:, 1]) * supercell_size[2] + x_cell[:, 2]
+
+    table = np.zeros((n_sup, nat), dtype = int)
+    table[i_cell, itau] = np.arange(nat_sc)
+
+    # Check that each couple (cell, atom) is present only once
+    if len(np.unique(i_cell * nat + itau)) != nat_sc or nat_sc != n_sup * nat:
+        raise ValueError("Error, the supercell structure is not compatible with the unit cell and the supercell {}".format(supercell_size))
+
+    return table
+
 
 class GenericTensor:
     """
@@ -171,20 +228,21 @@ class Tensor2(GenericTensor):
         if self.verbose:
             print("Generating Real space force constant matrix...")
 
-        # TODO: we could use the fft to speedup this
-        # fc_q = dyn.GetMatrixFFT()
-        # fc_real_space = np.conj(np.fft.fftn(np.conj(fc_q), axes = (0,1,2))) / np.prod(current_dyn.GetSupercell())
-        # fc_real_space is already in tensor form (first three indices the R_2 components, or maybe -R_2) in crystalline coordinates)
-        # It must be just rearranged in the correct tensor 
-        super_dyn = current_dyn.GenerateSupercellDyn(phonons.GetSupercell(), img_thr  =1e-6)
+        # Go in real space with the FFT, directly in the tensor form
+        # (first index the R_2 block in crystalline coordinates)
+        assert np.prod(phonons.GetSupercell()) == self.n_R, "Error, the supercell of the phonons does not match the tensor"
+        fc_blocks, x_r_vectors = Phonons.GetRealSpaceFCBlocksFFT(np.array(current_dyn.dynmats), 
+                                                                 np.array(current_dyn.q_tot),
+                                                                 self.unitcell_structure.unit_cell,
+                                                                 self.supercell_size, 
+                                                                 img_thr = 1e-6 / np.sqrt(self.n_R))
+        self.tensor[:, :, :] = fc_blocks
+        self.x_r_vector2[:, :] = x_r_vectors.T
+        self.r_vector2[:, :] = self.unitcell_structure.unit_cell.T.dot(self.x_r_vector2)
         time4 = time.time()
 
         if self.verbose:
             print("Time to generate the real space force constant matrix: {} s".format(time4 - time3))
-            print("TODO: the last time could be speedup with the FFT algorithm.")
-
-        # Setup from the supercell dynamical matrix
-        self.SetupFromTensor(super_dyn.dynmats[0])
 
 
     def SetupFromTensor(self, tensor):
@@ -219,26 +277,26 @@ class Tensor2(GenericTensor):
 
         nat = self.unitcell_structure.N_atoms
         nat_sc = nat * self.n_R
-            
-        for i_x in range(self.supercell_size[0]):
-            for i_y in range(self.supercell_size [1]):
-                for i_z in range(self.supercell_size[2]):
-                    i_block = self.supercell_size[1] * self.supercell_size[2] * i_x
-                    i_block += self.supercell_size[2] * i_y 
-                    i_block += i_z 
-                    self.x_r_vector2[:, i_block] = np.array([i_x, i_y, i_z])
-                    self.r_vector2[:, i_block] = self.unitcell_structure.unit_cell.T.dot(self.x_r_vector2[:, i_block])
-
-                    for na1 in range(nat):
-                        for na2 in range(nat):
-                            # Get the atom in the supercell corresponding to the one in the unit cell
-                            na2_vect = self.unitcell_structure.coords[na2, :] + self.r_vector2[:, i_block]
-                            nat2_sc = np.argmin( [np.sum( (self.supercell_structure.coords[k, :] - na2_vect)**2) for k in range(nat_sc)])
-                            
-                            self.tensor[i_block, 3*na1:3*na1+3, 3*na2: 3*na2+3] = tensor[3*na1 : 3*na1+3, 3*nat2_sc : 3*nat2_sc + 3]
 
+        # The lattice vectors in crystal coordinates of each block
+        x_cells = np.array([Methods.one_to_three_len(i, v_min = [0,0,0], v_len = self.supercell_size) for i in range(self.n_R)])
+        self.x_r_vector2[:, :] = x_cells.T
+        self.r_vector2[:, :] = self.unitcell_structure.unit_cell.T.dot(self.x_r_vector2)
+
+        # Get the index of each atom of the supercell
+        table = get_supercell_atom_table(self.unitcell_structure, self.supercell_structure, self.supercell_size, self.itau)
+
+        # Pick the blocks (na1 in the first cell, na2 in the i_block cell)
+        tensor_sc = np.reshape(tensor, (nat_sc, 3, nat_sc, 3))
+        tensor_sc = np.take(tensor_sc, table[0, :], axis = 0)
+        tensor_sc = np.take(tensor_sc, table, axis = 2)
 
-    def SetupFromFile(self, fname,file_format='Phonopy'):
+        # Go from (na1, a, i_block, na2, b) to (i_block, na1, a, na2, b)
+        tensor_sc = np.transpose(tensor_sc, axes = [2, 0, 1, 3, 4])
+        self.tensor[:, :, :] = tensor_sc.reshape((self.n_R, 3*nat, 3*nat))
+
+
+    def SetupFromFile(self, fname,file_format='Phonopy', memmap = False):
         """
         Setup the second order force constant form 2nd order tensor written in a file
         
@@ -254,27 +312,69 @@ class Tensor2(GenericTensor):
             fname : string
                 The file name
             file_format : string
-                The format of the file
+                The format of the file ('Phonopy', 'D3Q' or 'binary').
+                The binary format is the one written by WriteOnFile (see save_tensor_binary),
+                fname is the prefix of the files.
+            memmap : bool
+                Only for the binary format. If True the tensor is memory mapped (read-only)
+                by each process instead of being broadcasted.
         """        
         
+        if file_format.lower() == 'binary':
+            load_tensor_binary(fname, self, memmap = memmap)
+            return
         
         if Settings.am_i_the_master():
             
             if file_format == 'Phonopy':      
                 
-                print("  ")
-                print(" FC2 Phonopy reading format: TODO" )
-                print("  ")      
-                exit()
+                if self.verbose:
+                    print("  ")
+                    print(" Reading FC2 from "+fname)
+                    print(" (Phonopy format) " )
+                    print("  ")
+
+                # Read all the file at once
+                with open(fname, "r") as f:
+                    data = np.fromstring(f.read(), dtype = np.double, sep = " ")
+
+                n_blocks = int(data[0])
+                nat2 = self.nat**2
+                self.n_R = n_blocks // nat2
+
+                # Each block is: index, R2, atoms and 9 lines (x, y, value)
+                block_size = 1 + 3 + 2 + 9 * 3
+                if len(data) - 1 != n_blocks * block_size:
+                    raise ValueError("Error, the file {} is not a valid Phonopy FC2 file.".format(fname))
+                data = data[1:].reshape((n_blocks, block_size))
+
+                id_block = np.rint(data[:, 0]).astype(int) - 1
+                total_lat_vec = id_block // nat2
+
+                self.tensor = np.zeros((self.n_R, 3*self.nat, 3*self.nat), dtype = np.double)
+                self.r_vector2 = np.zeros((3, self.n_R), dtype = np.double, order = "F")
+                self.r_vector2[:, total_lat_vec] = data[:, 1:4].T
+                self.x_r_vector2 = np.zeros((3, self.n_R), dtype = np.intc, order = "F")
+                self.x_r_vector2[:, :] = np.rint(Methods.covariant_coordinates(self.unitcell_structure.unit_cell, self.r_vector2.T)).T
+
+                # Scatter all the elements in the tensor
+                atoms = np.rint(data[:, 4:6]).astype(int) - 1
+                elements = data[:, 6:].reshape((n_blocks, 9, 3))
+                xy = np.rint(elements[:, :, :2]).astype(int) - 1
+
+                i_R = np.tile(total_lat_vec[:, np.newaxis], (1, 9))
+                i1 = 3 * atoms[:, 0, np.newaxis] + xy[:, :, 0]
+                i2 = 3 * atoms[:, 1, np.newaxis] + xy[:, :, 1]
+                self.tensor[i_R, i1, i2] = elements[:, :, 2]
 
             elif file_format == 'D3Q': 
             
-                print("  ")
-                print(" Reading FC2 from "+fname)
-                print(" (D3Q format) " )
-                print("  ")
+                if self.verbose:
+                    print("  ")
+                    print(" Reading FC2 from "+fname)
+                    print(" (D3Q format) " )
+                    print("  ")
                 
-                first_nR_read = True
                 with open(fname, "r") as f:            
                 # ============== Skip header, if present ===
                     if len(f.readline().split()) ==4:
@@ -286,36 +386,32 @@ class Tensor2(GenericTensor):
                                 break
                         f.readline()
                 # ===========================================                   
-                    for nat1 in range(self.nat):
-                        for nat2 in range(self.nat):
-                                for alpha in range(3):
-                                    for beta in range(3):
-                                            [alpha_read,beta_read,
-                                            nat1_read, nat2_read]=[int(l)-1 for l in f.readline().split()]
-                                            
-                                            assert ([nat1,nat2,alpha,beta]==[nat1_read,nat2_read,
-                                                                                        alpha_read,beta_read])
-                                        
-
-                                            nR_read=int(f.readline().split()[0])
-                                            
-                                            if (first_nR_read) :
-                                                self.n_R=nR_read
-                                                self.tensor=np.zeros((self.n_R,3*self.nat,3*self.nat),dtype=np.float64)
-                                                self.x_r_vector2=np.zeros((3,self.n_R),dtype=np.int16)
-                                                first_nR_read = False
-                                            else :
-                                                assert ( nR_read == self.n_R ), " Format unknown - different blocks size "
-                                    
-                                            for iR in range(self.n_R):
-                                                    
-                                                    res=[l for l in f.readline().split()] 
-                                                    
-                                                    [self.x_r_vector2[0, iR],
-                                                    self.x_r_vector2[1, iR],
-                                                    self.x_r_vector2[2, iR]]=[int(l) for l in res[:-1]] 
-                                                    
-                                                    self.tensor[iR, 3*nat1 + alpha, 3*nat2 + beta]=np.double(res[-1])
+                    data = np.fromstring(f.read(), dtype = np.double, sep = " ")
+
+                # Each element is: alpha, beta, nat1, nat2, n_R and n_R lines (R2, value)
+                self.n_R = int(data[4])
+                n_elements = 9 * self.nat**2
+                element_size = 5 + 4 * self.n_R
+                if len(data) != n_elements * element_size:
+                    raise ValueError(" Format unknown - different blocks size ")
+                data = data.reshape((n_elements, element_size))
+
+                # Check the order of the elements
+                indices = np.rint(data[:, :4]).astype(int) - 1
+                expected = np.array([[alpha, beta, nat1, nat2] for nat1, nat2, alpha, beta in 
+                                     itertools.product(range(self.nat), range(self.nat), range(3), range(3))])
+                assert (indices == expected).all(), " Format unknown - wrong order of the elements "
+                assert (np.rint(data[:, 4]).astype(int) == self.n_R).all(), " Format unknown - different blocks size "
+
+                elements = data[:, 5:].reshape((n_elements, self.n_R, 4))
+
+                self.x_r_vector2 = np.zeros((3, self.n_R), dtype = np.int16)
+                self.x_r_vector2[:, :] = np.rint(elements[0, :, 0:3]).T
+
+                # Go from (nat1, nat2, alpha, beta, R) to (R, nat1, alpha, nat2, beta)
+                values = elements[:, :, 3].reshape((self.nat, self.nat, 3, 3, self.n_R))
+                values = np.transpose(values, axes = [4, 0, 2, 1, 3])
+                self.tensor = np.ascontiguousarray(values).reshape((self.n_R, 3*self.nat, 3*self.nat))
                                                     
                 self.r_vector2=self.unitcell_structure.unit_cell.T.dot(self.x_r_vector2)
         
@@ -656,9 +752,15 @@ class Tensor2(GenericTensor):
         ----------
             fname : string
                 Path to the file on which you want to save the tensor.
+            file_format : string
+                'Phonopy', 'D3Q' or 'binary'. 
+                The binary format writes fname.npy and fname.json (see save_tensor_binary).
         """
 
-        if  file_format == 'Phonopy':
+        if file_format.lower() == 'binary':
+            save_tensor_binary(fname, self)
+
+        elif  file_format == 'Phonopy':
             
             print("  ")
             print(" Writing FC2 on "+fname )
@@ -839,6 +941,141 @@ class Tensor2(GenericTensor):
         return final_fc
 
     
+    def Interpolate_many(self, q_array, asr = False, verbose = False, asr_range = None, q_direct = None):
+        """
+        INTERPOLATE MANY
+        ================
+
+        Perform the Fourier interpolation on a whole list of q points at once.
+        It is equivalent to calling Interpolate on each q point, but the phase matrix
+        exp(-2 pi i q.R) is built only once and contracted with the tensor
+        with a single matrix-matrix multiplication.
+        Also the ASR projector and the f(q) function are computed only once for the whole batch.
+
+        Parameters
+        ----------
+            q_array : ndarray(size = (nq, 3))
+                The list of q vectors in 2pi/A
+            asr : bool
+                If true, apply the acousitc sum rule
+            verbose : bool
+                Print some debugging info
+            asr_range : float, optional
+                If it is given, then use a gaussian as a activation function
+                for the asr, with asr_range equal to sigma.
+                Otherwise, a sin(Nq)/(Nsin(q)) will be used, equal to apply the sum rule on a
+                grid.
+            q_direct : ndarray(dtype = 3)
+                If a q point is gamma and effective charges are present, this vector is used
+                to pick the direction of the nonanalitical correction to apply.
+                If it is not initialized, a random versor will be chosen.
+
+        Results
+        -------
+            phi2 : ndarray(size = (nq, 3*nat, 3*nat), dtype = np.complex128)
+                The second order force constant at each q point. Atomic indices runs over the unit cell
+        """
+
+        q_array = np.array(q_array, dtype = np.double)
+        if len(q_array.shape) == 1:
+            q_array = np.expand_dims(q_array, axis = 0)
+
+        nq = q_array.shape[0]
+        nat = self.nat
+
+        # Build the phase matrix (nq, n_R) and contract it with the tensor
+        phases = np.exp(np.complex128(-1j) * 2 * np.pi * q_array.dot(self.r_vector2))
+        final_fc = phases.dot(self.tensor.reshape((self.n_R, 9*nat*nat)))
+        final_fc = final_fc.reshape((nq, 3*nat, 3*nat))
+
+        # If effective charges are present, then add the nonanalitic part
+        if self.effective_charges is not None:
+            # Go in the (3,3,nat,nat) layout for all the q points
+            dynq_all = np.einsum("qiajb -> qabij", final_fc.reshape((nq, nat, 3, nat, 3)))
+            QE_itau = np.arange(nat) + 1
+
+            for iq in range(nq):
+                dynq = np.asfortranarray(dynq_all[iq, :, :, :, :])
+
+                # Add the nonanalitic part back
+                QE_q = -q_array[iq, :] * self.QE_alat / Units.A_TO_BOHR
+                symph.rgd_blk(0, 0, 0, dynq, QE_q, self.QE_tau, self.dielectric_tensor, self.QE_zeu, self.QE_bg, self.QE_omega, self.QE_alat, 0, +1.0, nat)
+
+                # Check if the vector is gamma
+                if np.max(np.abs(q_array[iq, :])) < 1e-12:
+                    q_vect = np.zeros(3, dtype = np.double)
+                    if q_direct is not None:
+                        # the - to take into account the difference between QE convension and our
+                        q_vect[:] = -q_direct / np.sqrt(q_direct.dot(q_direct))
+                    else:
+                        q_vect[:] = np.random.normal(size = 3)
+                        q_vect /= np.sqrt(q_vect.dot(q_vect))
+
+                    # Apply the nonanal contribution at gamma
+                    symph.nonanal(QE_itau, self.dielectric_tensor, q_vect, self.QE_zeu, self.QE_omega, dynq, nat, nat)
+
+                dynq_all[iq, :, :, :, :] = dynq
+
+            # Copy in the final fc the result
+            final_fc[:, :, :] = np.einsum("qabij -> qiajb", dynq_all).reshape((nq, 3*nat, 3*nat))
+
+        # Apply the acoustic sum rule
+        if asr:
+            # Get the reciprocal lattice vectors
+            bg = Methods.get_reciprocal_vectors(self.unitcell_structure.unit_cell) / (2*np.pi)
+
+            # Create the ASR projector
+            Q_proj = np.zeros((3*nat, 3*nat), dtype = np.double)
+            for i in range(3):
+                v1 = np.zeros(nat*3, dtype = np.double)
+                v1[3*np.arange(nat) + i] = 1
+                v1 /= np.sqrt(v1.dot(v1))
+
+                Q_proj += np.outer(v1,v1)
+
+            N_i = np.array([2*x + 1 for x in self.supercell_size], dtype = np.intc)
+
+            # We check if they are even, in that case we add 1
+            # f(q) is real only if we sum on odd cells
+            for ik in range(3):
+                if (N_i[ik] % 2 == 0):
+                    N_i[ik] += 1
+
+            if verbose:
+                print("Supercell all odd:", N_i)
+
+            # We compute the f(q) function for all the q points
+            at = self.unitcell_structure.unit_cell
+
+            __tol__ = 1e-8
+            if asr_range is None:
+                # The (nq, 3) array of the q.a products
+                qa = q_array.dot(at.T) * np.pi
+                f_qi = np.ones((nq, 3), dtype = np.double)
+
+                # We use mask to avoid division by 0,
+                # As we know that the 0/0 limit is 1 in this case
+                mask = np.abs(np.sin(qa)) > __tol__
+                N_i_all = np.tile(N_i, (nq, 1))
+                f_qi[mask] = np.sin(N_i_all[mask] * qa[mask]) / (N_i_all[mask] * np.sin(qa[mask]))
+                f_q = np.prod(f_qi, axis = 1)
+            else:
+                f_q = np.zeros(nq, dtype = np.double)
+                for iq in range(nq):
+                    closest_q = Methods.get_closest_vector(bg * 2 * np.pi, q_array[iq, :])
+                    f_q[iq] = np.exp( - np.linalg.norm(closest_q)**2 / (2 * asr_range**2))
+
+            if verbose:
+                print("The fq:")
+                print(f_q)
+
+            # Now we can impose the acustic sum rule
+            final_fc -= np.einsum("qai, bi-> qab", final_fc, Q_proj) * f_q[:, np.newaxis, np.newaxis]
+            final_fc -= np.einsum("qib, ai-> qab", final_fc, Q_proj) * f_q[:, np.newaxis, np.newaxis]
+
+        return final_fc
+
+
 
 
     # def GenerateSupercellTensor(self, supercell):
@@ -979,9 +1216,9 @@ class Tensor2(GenericTensor):
         dynmat.dynmats = []
 
         # Interpolate over the q points
+        dynq_all = np.conj(self.Interpolate_many(np.array(q_vectors), asr = asr))
         for i, q_vector in enumerate(q_vectors):
-            dynq = np.conj(self.Interpolate(q_vector, asr = asr))
-            dynmat.dynmats.append(dynq)
+            dynmat.dynmats.append(dynq_all[i, :, :])
 
         # Adjust the q star according to symmetries
         dynmat.AdjustQStar()
@@ -1121,6 +1358,14 @@ class Tensor3():
         self.unitcell_structure = unitcell_structure
         self.supercell_structure = supercell_structure
 
+        # The sparse representation of the tensor (see SetupSparse)
+        self.tensor_sparse = None
+
+        # How the tensor is stored among the MPI processes (see Distribute)
+        self.parallel_storage = "copy"
+        self.shard_range = None
+        self.shared_window = None
+
         self.verbose = True
         
     def SetupFromTensor(self, tensor=None):
@@ -1152,42 +1397,31 @@ class Tensor3():
         supercell_structure = self.supercell_structure
         unitcell_structure = self.unitcell_structure
 
-                                           
-            
-        for index_cell2 in range(n_sup):                
-            n_cell_x2,n_cell_y2,n_cell_z2=Methods.one_to_three_len(index_cell2,v_min=[0,0,0],
-                                                                   v_len=supercell_size)
-            for index_cell3 in range(n_sup):
-                n_cell_x3,n_cell_y3,n_cell_z3=Methods.one_to_three_len(index_cell3,v_min=[0,0,0],
-                                                                       v_len=supercell_size)      
-                #
-                total_index_cell = index_cell3 + n_sup * index_cell2
-                #
-                self.x_r_vector2[:, total_index_cell] = (n_cell_x2, n_cell_y2, n_cell_z2)
-                self.r_vector2[:, total_index_cell] = unitcell_structure.unit_cell.T.dot(self.x_r_vector2[:,total_index_cell])
-                self.x_r_vector3[:, total_index_cell] =  n_cell_x3, n_cell_y3, n_cell_z3
-                self.r_vector3[:, total_index_cell] = unitcell_structure.unit_cell.T.dot(self.x_r_vector3[:, total_index_cell])
-                                        
-                for na1 in range(nat):
-                    #
-                    for na2 in range(nat):
-                        # Get the atom in the supercell corresponding to the one in the unit cell
-                        na2_vect = unitcell_structure.coords[na2, :] + self.r_vector2[:, total_index_cell]
-                        nat2_sc = np.argmin( [np.sum( (supercell_structure.coords[k, :] - na2_vect)**2) for k in range(nat_sc)])
-                        #
-                        for na3 in range(nat):
-                            # Get the atom in the supercell corresponding to the one in the unit cell
-                            na3_vect = unitcell_structure.coords[na3, :] + self.r_vector3[:, total_index_cell]
-                            nat3_sc = np.argmin( [np.sum( (supercell_structure.coords[k, :] - na3_vect)**2) for k in range(nat_sc)])
-                            #
-                            self.tensor[total_index_cell, 
-                                        3*na1 : 3*na1+3, 
-                                        3*na2 : 3*na2+3, 
-                                        3*na3 : 3*na3+3] = tensor[3*na1 : 3*na1 +3, 
-                                                                3*nat2_sc : 3*nat2_sc + 3,
-                                                                3*nat3_sc : 3*nat3_sc + 3]
+        self.tensor_sparse = None
 
-    def SetupFromFile(self, fname,file_format='Phonopy'):
+        # The lattice vectors in crystal coordinates of each cell
+        x_cells = np.array([Methods.one_to_three_len(i, v_min = [0,0,0], v_len = supercell_size) for i in range(n_sup)])
+
+        # total_index_cell = index_cell3 + n_sup * index_cell2
+        self.x_r_vector2[:, :] = np.repeat(x_cells, n_sup, axis = 0).T
+        self.x_r_vector3[:, :] = np.tile(x_cells, (n_sup, 1)).T
+        self.r_vector2[:, :] = unitcell_structure.unit_cell.T.dot(self.x_r_vector2)
+        self.r_vector3[:, :] = unitcell_structure.unit_cell.T.dot(self.x_r_vector3)
+
+        # Get the index of each atom of the supercell
+        table = get_supercell_atom_table(unitcell_structure, supercell_structure, supercell_size, self.itau)
+
+        # Pick the blocks (na1 in the first cell, na2 in cell2, na3 in cell3)
+        tensor_sc = np.reshape(tensor, (nat_sc, 3, nat_sc, 3, nat_sc, 3))
+        tensor_sc = np.take(tensor_sc, table[0, :], axis = 0)
+        tensor_sc = np.take(tensor_sc, table, axis = 2)
+        tensor_sc = np.take(tensor_sc, table, axis = 5)
+
+        # Go from (na1, a, cell2, na2, b, cell3, na3, c) to (cell2, cell3, na1, a, na2, b, na3, c)
+        tensor_sc = np.transpose(tensor_sc, axes = [2, 5, 0, 1, 3, 4, 6, 7])
+        self.tensor[:, :, :, :] = tensor_sc.reshape((n_R, 3*nat, 3*nat, 3*nat))
+
+    def SetupFromFile(self, fname,file_format='Phonopy', memmap = False):
         """
         Setup the third order force constant form 3rd order tensor written in a file
         
@@ -1197,78 +1431,83 @@ class Tensor3():
             fname : string
                 The file name
             file_format : string
-                The format of the file
+                The format of the file ('Phonopy', 'D3Q' or 'binary').
+                The binary format is the one written by WriteOnFile (see save_tensor_binary),
+                fname is the prefix of the files.
+            memmap : bool
+                Only for the binary format. If True the tensor is memory mapped (read-only)
+                by each process instead of being broadcasted.
         """
+        if file_format.lower() == 'binary':
+            # With the shared or sharded storage the file is mapped, 
+            # and only the data of the master is distributed
+            distribute = not memmap and self.parallel_storage != "copy"
+            load_tensor_binary(fname, self, memmap = memmap or distribute)
+            if distribute:
+                self.broadcast_tensor()
+            else:
+                Settings.free_shared(self.shared_window)
+                self.shared_window = None
+                self.shard_range = None
+            return
+
         if Settings.am_i_the_master():
             
             if file_format == 'Phonopy':    
                 
-                print("  ")
-                print(" Reading FC3 from " + fname)
-                print(" (Phonopy format) " )
-                print("  ")
-                        
-                f = open(fname, "r")
-                lines = [l.strip() for l in f.readlines()]
-                f.close()
-                
-                n_blocks = int(lines[0])
-                self.n_R = n_blocks/self.nat**3
-                
-                
-                id_block = 0
-                total_lat_vec = 0
-                lat_vect_2 = 0
-                lat_vect_3 = 0
-                nat1 = 0
-                nat2 = 0
-                nat3 = 0
-                reading_lat2 = False
-                reading_lat3 = False 
-                reading_atoms = False
-                for i, line in enumerate(lines):
-                    if i == 0:
-                        continue
-                    
-                    data = line.split()
-                    if len(data) == 0:
-                        continue
-                    
-                    if len(data) == 1:
-                        id_block = int(data[0]) - 1
-                        total_lat_vec = id_block // self.nat**3
-                        nat_id = id_block % self.nat**3
-                        reading_lat2 = True
-                        continue
-                    
-                    if reading_lat2:
-                        self.r_vector2[:, total_lat_vec] = [float(x) for x in data]
-                        self.x_r_vector2[:, total_lat_vec] = Methods.covariant_coordinates(self.unitcell_structure.unit_cell, self.r_vector2[:, total_lat_vec])
-                        reading_lat2 = False
-                        reading_lat3 = True
-                    elif reading_lat3:
-                        self.r_vector3[:, total_lat_vec] = [float(x) for x in data]
-                        self.x_r_vector3[:, total_lat_vec] = Methods.covariant_coordinates(self.unitcell_structure.unit_cell, self.r_vector3[:, total_lat_vec])
-                        reading_lat3 = False
-                        reading_atoms = True
-                    elif reading_atoms:
-                        nat1, nat2, nat3 = [int(x) - 1 for x in data]
-                        reading_atoms = False
-                        print("Reading the vectors: ", self.r_vector2[:, total_lat_vec], self.r_vector3[:, total_lat_vec], total_lat_vec)
-                    
-                    if len(data) == 4:
-                        xx, yy, zz = [int(x)-1 for x in data[:3]]
+                if self.verbose:
+                    print("  ")
+                    print(" Reading FC3 from " + fname)
+                    print(" (Phonopy format) " )
+                    print("  ")
                         
-                        self.tensor[total_lat_vec, 3*nat1+xx, 3*nat2+yy, 3*nat3+zz] = np.double(data[-1])     
+                # Read all the file at once
+                with open(fname, "r") as f:
+                    data = np.fromstring(f.read(), dtype = np.double, sep = " ")
+
+                n_blocks = int(data[0])
+                nat3 = self.nat**3
+                self.n_R = n_blocks // nat3
+
+                # Each block is: index, R2, R3, atoms and 27 lines (x, y, z, value)
+                block_size = 1 + 3 + 3 + 3 + 27 * 4
+                if len(data) - 1 != n_blocks * block_size:
+                    raise ValueError("Error, the file {} is not a valid Phonopy FC3 file.".format(fname))
+                data = data[1:].reshape((n_blocks, block_size))
+
+                id_block = np.rint(data[:, 0]).astype(int) - 1
+                total_lat_vec = id_block // nat3
+
+                self.tensor = np.zeros((self.n_R, 3*self.nat, 3*self.nat, 3*self.nat), dtype = np.double)
+                self.r_vector2 = np.zeros((3, self.n_R), dtype = np.double, order = "F")
+                self.r_vector3 = np.zeros((3, self.n_R), dtype = np.double, order = "F")
+                self.r_vector2[:, total_lat_vec] = data[:, 1:4].T
+                self.r_vector3[:, total_lat_vec] = data[:, 4:7].T
+
+                self.x_r_vector2 = np.zeros((3, self.n_R), dtype = np.intc, order = "F")
+                self.x_r_vector3 = np.zeros((3, self.n_R), dtype = np.intc, order = "F")
+                self.x_r_vector2[:, :] = np.rint(Methods.covariant_coordinates(self.unitcell_structure.unit_cell, self.r_vector2.T)).T
+                self.x_r_vector3[:, :] = np.rint(Methods.covariant_coordinates(self.unitcell_structure.unit_cell, self.r_vector3.T)).T
+
+                # Scatter all the elements in the tensor
+                atoms = np.rint(data[:, 7:10]).astype(int) - 1
+                elements = data[:, 10:].reshape((n_blocks, 27, 4))
+                xyz = np.rint(elements[:, :, :3]).astype(int) - 1
+
+                i_R = np.tile(total_lat_vec[:, np.newaxis], (1, 27))
+                i1 = 3 * atoms[:, 0, np.newaxis] + xyz[:, :, 0]
+                i2 = 3 * atoms[:, 1, np.newaxis] + xyz[:, :, 1]
+                i3 = 3 * atoms[:, 2, np.newaxis] + xyz[:, :, 2]
+                self.tensor[i_R, i1, i2, i3] = elements[:, :, 3]
         
             elif file_format == 'D3Q': 
                 
-                print("  ")
-                print(" Reading FC3 from "+ fname )
-                print(" (D3Q format) " )            
-                print("  ")            
+                if self.verbose:
+                    print("  ")
+                    print(" Reading FC3 from "+ fname )
+                    print(" (D3Q format) " )            
+                    print("  ")            
                 
-                first_nR_read = True
                 with open(fname, "r") as f:
                 # ============ Skip the header, if present ====================
                     if len(f.readline().split()) ==6:
@@ -1280,49 +1519,41 @@ class Tensor3():
                                 break
                         f.readline()
                 # =============================================================                    
-                    for nat1 in range(self.nat):
-                        for nat2 in range(self.nat):
-                            for nat3 in range(self.nat):
-                                for alpha in range(3):
-                                    for beta in range(3):
-                                        for gamma in range(3):
-                                            [alpha_read,beta_read,
-                                            gamma_read,nat1_read, 
-                                            nat2_read, nat3_read]=[int(l)-1 for l in f.readline().split()]
-                                            
-                                            assert ([nat1,nat2,nat3,alpha,beta,gamma]==[nat1_read,nat2_read,nat3_read,
-                                                                                        alpha_read,beta_read,gamma_read])
-                                        
-                                            nR_read=int(f.readline().split()[0])
-                                            
-                                            if (first_nR_read) :
-                                                self.n_R=nR_read
-                                                self.tensor=np.zeros((self.n_R,3*self.nat,3*self.nat,3*self.nat),dtype=np.float64)
-                                                self.x_r_vector2=np.zeros((3,self.n_R),dtype=np.int16)
-                                                self.x_r_vector3=np.zeros((3,self.n_R),dtype=np.int16)
-                                                first_nR_read = False
-                                            else :
-                                                assert ( nR_read == self.n_R ), " Format unknown - different blocks size "
-                                    
-                                            for iR in range(self.n_R):
-                                                    
-                                                    res=[l for l in f.readline().split()] 
+                    data = np.fromstring(f.read(), dtype = np.double, sep = " ")
+
+                # Each element is: alpha, beta, gamma, nat1, nat2, nat3, n_R and n_R lines (R2, R3, value)
+                self.n_R = int(data[6])
+                n_elements = 27 * self.nat**3
+                element_size = 7 + 7 * self.n_R
+                if len(data) != n_elements * element_size:
+                    raise ValueError(" Format unknown - different blocks size ")
+                data = data.reshape((n_elements, element_size))
+
+                # Check the order of the elements
+                indices = np.rint(data[:, :6]).astype(int) - 1
+                expected = np.array([[alpha, beta, gamma, nat1, nat2, nat3] for nat1, nat2, nat3, alpha, beta, gamma in 
+                                     itertools.product(range(self.nat), range(self.nat), range(self.nat), range(3), range(3), range(3))])
+                assert (indices == expected).all(), " Format unknown - wrong order of the elements "
+                assert (np.rint(data[:, 6]).astype(int) == self.n_R).all(), " Format unknown - different blocks size "
+
+                elements = data[:, 7:].reshape((n_elements, self.n_R, 7))
+
+                self.x_r_vector2 = np.zeros((3, self.n_R), dtype = np.int16)
+                self.x_r_vector3 = np.zeros((3, self.n_R), dtype = np.int16)
+                self.x_r_vector2[:, :] = np.rint(elements[0, :, 0:3]).T
+                self.x_r_vector3[:, :] = np.rint(elements[0, :, 3:6]).T
+
+                # Go from (nat1, nat2, nat3, alpha, beta, gamma, R) to (R, nat1, alpha, nat2, beta, nat3, gamma)
+                values = elements[:, :, 6].reshape((self.nat, self.nat, self.nat, 3, 3, 3, self.n_R))
+                values = np.transpose(values, axes = [6, 0, 3, 1, 4, 2, 5])
+                self.tensor = np.ascontiguousarray(values).reshape((self.n_R, 3*self.nat, 3*self.nat, 3*self.nat))
                                                     
-                                                    [self.x_r_vector2[0, iR],
-                                                    self.x_r_vector2[1, iR],
-                                                    self.x_r_vector2[2, iR],
-                                                    self.x_r_vector3[0, iR],
-                                                    self.x_r_vector3[1, iR],
-                                                    self.x_r_vector3[2, iR]]=[int(l) for l in res[:6]] 
-                                                    
-                                                    self.tensor[iR, 3*nat1 + alpha, 3*nat2 + beta, 3*nat3 + gamma]=np.double(res[6])
-                                                    
-                    self.r_vector2=self.unitcell_structure.unit_cell.T.dot(self.x_r_vector2)
-                    self.r_vector3=self.unitcell_structure.unit_cell.T.dot(self.x_r_vector3)    
+                self.r_vector2=self.unitcell_structure.unit_cell.T.dot(self.x_r_vector2)
+                self.r_vector3=self.unitcell_structure.unit_cell.T.dot(self.x_r_vector3)    
                     
         # Broadcast            
                     
-        self.tensor = Settings.broadcast(self.tensor)
+        self.broadcast_tensor()
         self.x_r_vector2 = Settings.broadcast(self.x_r_vector2)
         self.x_r_vector3 = Settings.broadcast(self.x_r_vector3)
         self.r_vector2 = Settings.broadcast(self.r_vector2)
@@ -1347,9 +1578,14 @@ class Tensor3():
                 It could be either 'phonopy' or 'd3q' (not case sensitive)
                 'd3q' is the file format used in the thermal.x espresso package, while phonopy is the one
                 used in phono3py. 
+                It can also be 'binary': the tensor is saved in fname.npy and the header in fname.json
+                (see save_tensor_binary). This can be read much faster, also memory mapped.
         """
         
-        if file_format.lower() == 'phonopy':
+        if file_format.lower() == 'binary':
+            save_tensor_binary(fname, self)
+
+        elif file_format.lower() == 'phonopy':
             
             print("  ")
             print(" Writing FC3 on "+ fname)
@@ -1401,7 +1637,7 @@ class Tensor3():
                                             f.write("{:>6d} {:>6d} {:>6d} {:>6d} {:>6d} {:>6d} {:16.8e}\n".format(self.x_r_vector2[0, r_block],self.x_r_vector2[1, r_block],self.x_r_vector2[2, r_block],self.x_r_vector3[0, r_block],self.x_r_vector3[1, r_block],self.x_r_vector3[2, r_block], self.tensor[r_block, 3*nat1 + alpha, 3*nat2 + beta, 3*nat3 + gamma]))
                                             
 
-    def Center(self, nneigh=None, Far=1,tol=1.0e-5):
+    def Center(self, nneigh=None, Far=1,tol=1.0e-5, max_memory = 1.0):
         """
         CENTERING 
         =========
@@ -1443,10 +1679,16 @@ class Tensor3():
             
                     In the centering, supercell equivalent atoms are considered within 
                     -Far,+Far multiples of the super-lattice vectors
+
+            - max_memory [default= 1.0]: float
+
+                    The memory (in Gb) used for the candidate replicas. 
+                    The blocks are centered in chunks that fit in this memory, 
+                    so the peak memory is dominated by the centered tensor.
         """    
 
-        
-        
+        # The full tensor is needed by the master
+        self.gather_tensor()
         
         if Settings.am_i_the_master():
             
@@ -1574,41 +1816,91 @@ class Tensor3():
             xRmax=np.max(self.x_r_vector3,1) 
             xRlen=xRmax-xRmin+np.ones((3,),dtype=int)
                                
-            tensor= np.transpose(self.tensor,axes=[1,2,3,0])
             self.n_sup = np.prod(xRlen)
 
             # to the Fortran routine the xR3 (faster than xR2) goes on the rightmost place 
             # which is the place after the reshape in python
 
             alat=self.unitcell_structure.unit_cell
-            
-            weight,xR2,xR3 =thirdorder.third_order_centering.analysis(Far,tol,dist_range,xRlen,
-                                                                      self.x_r_vector2,self.x_r_vector3,
-                                                                      alat,
-                                                                      self.tau, tensor,self.nat,self.n_R)  
-            
-            
-            mask= weight >0 
-            mask=np.repeat(mask[np.newaxis,...], (2*Far+1)*(2*Far+1)*(2*Far+1), axis=0)
-            
-            xR2_reshaped=xR2[:,mask]
-            xR3_reshaped=xR3[:,mask]
-            xR23 = np.unique(np.vstack((xR2_reshaped,xR3_reshaped)),axis=1)
-            nblocks_old=self.n_R
-            #
-            self.n_R=xR23.shape[1]
-            self.x_r_vector2,self.x_r_vector3 = np.vsplit(xR23,2)
+
+            nat = self.nat
+            n_rep = (2*Far+1)**3
+            nblocks_old = self.n_R
+
+            # The blocks are analyzed in chunks, so that the replicas of the chunk fit in max_memory
+            bytes_per_block = 4 * nat**3 * (6 * n_rep + 1) + 48 * nat**3 * n_rep
+            n_chunk = max(1, int(max_memory * 1024.**3 / bytes_per_block))
+
+            tensor_blocks = self.tensor.reshape((nblocks_old, nat, 3, nat, 3, nat, 3))
+
+            # Hash table of the new (R2, R3) blocks, with their index in the centered tensor
+            block_index = {}
+            centered = np.zeros((nblocks_old, nat, 3, nat, 3, nat, 3), dtype = np.double)
+            total_weight = 0
+
+            for j_start in range(0, nblocks_old, n_chunk):
+                j_end = min(j_start + n_chunk, nblocks_old)
+
+                tensor_chunk = np.transpose(self.tensor[j_start:j_end, :, :, :], axes=[1,2,3,0])
+                weight,xR2,xR3 =thirdorder.third_order_centering.analysis(Far,tol,dist_range,xRlen,
+                                                                          self.x_r_vector2[:, j_start:j_end],
+                                                                          self.x_r_vector3[:, j_start:j_end],
+                                                                          alat,
+                                                                          self.tau, tensor_chunk,self.nat,j_end - j_start)  
+                total_weight += np.sum(weight)
+
+                # Get all the (replica, s, t, u, block) with a non zero weight
+                mask = np.arange(n_rep)[:, np.newaxis, np.newaxis, np.newaxis, np.newaxis] < weight[np.newaxis, ...]
+                h, at1, at2, at3, j_block = np.nonzero(mask)
+                if len(h) == 0:
+                    continue
+
+                xR23 = np.vstack((xR2[:, h, at1, at2, at3, j_block], xR3[:, h, at1, at2, at3, j_block]))
+
+                # Deduplicate the new lattice vectors
+                xR23_unique, inverse = np.unique(xR23, axis = 1, return_inverse = True)
+                new_index = np.zeros(xR23_unique.shape[1], dtype = int)
+                for i in range(xR23_unique.shape[1]):
+                    key = tuple(xR23_unique[:, i])
+                    if not key in block_index:
+                        block_index[key] = len(block_index)
+                    new_index[i] = block_index[key]
+                i_new = new_index[np.ravel(inverse)]
+
+                # Enlarge the centered tensor if needed
+                if len(block_index) > centered.shape[0]:
+                    new_size = max(len(block_index), 2 * centered.shape[0])
+                    centered = np.concatenate((centered, np.zeros((new_size - centered.shape[0],) + centered.shape[1:], dtype = np.double)))
+
+                # Split the block between the equivalent triplets
+                w = weight[at1, at2, at3, j_block].astype(np.double)
+                centered[i_new, at1, :, at2, :, at3, :] = tensor_blocks[j_block + j_start, at1, :, at2, :, at3, :] / w[:, np.newaxis, np.newaxis, np.newaxis]
+
+            if total_weight == 0:
+                print(" ")
+                print(" ERROR: no nonzero triplets found during centering,      ")
+                print("        the execution stops here.                        ")
+                print("        Relax the constraint imposed                     ")
+                print("        on the maximum distance allowed (nneigh)         ")
+                print(" ")
+                raise ValueError("Error, no nonzero triplets found during centering")
+
+            # Sort the blocks as the lattice vectors
+            self.n_R = len(block_index)
+            xR23 = np.zeros((6, self.n_R), dtype = np.intc)
+            for key, i in block_index.items():
+                xR23[:, i] = key
+            order = np.lexsort(xR23[::-1, :])
+
+            self.x_r_vector2 = np.array(xR23[:3, order], dtype = np.intc, order = "F")
+            self.x_r_vector3 = np.array(xR23[3:, order], dtype = np.intc, order = "F")
             self.r_vector2=self.unitcell_structure.unit_cell.T.dot(self.x_r_vector2)
             self.r_vector3=self.unitcell_structure.unit_cell.T.dot(self.x_r_vector3)
-    
-            centered=thirdorder.third_order_centering.center(tensor,weight,
-                                                             self.x_r_vector2,xR2,
-                                                             self.x_r_vector3,xR3,
-                                                             Far,self.nat,
-                                                             self.n_R,nblocks_old)
+
+            centered = centered[order, ...].reshape((self.n_R, 3*nat, 3*nat, 3*nat))
             t2 = time.time() 
             
-            self.tensor = np.transpose(centered, axes=[3,0,1,2])
+            self.tensor = centered
           
             if self.verbose:               
                 print(" Time elapsed for computing the centering: {} s".format( t2 - t1)) 
@@ -1616,7 +1908,7 @@ class Tensor3():
                 print(" ")
                 print(" ====================================================================")
 
-        self.tensor = Settings.broadcast(self.tensor)
+        self.broadcast_tensor()
         self.x_r_vector2 = Settings.broadcast(self.x_r_vector2)
         self.x_r_vector3 = Settings.broadcast(self.x_r_vector3)
         self.r_vector2 = Settings.broadcast(self.r_vector2)
@@ -1662,6 +1954,8 @@ class Tensor3():
                variation of the phi after the imposition of the permutation symmetry (both divided by sum |phi|)
         """    
 
+        # The full tensor is needed by the master
+        self.gather_tensor()
         
         if Settings.am_i_the_master():
         
@@ -1704,7 +1998,142 @@ class Tensor3():
 
 
 
-        self.tensor = Settings.broadcast(self.tensor)
+        self.broadcast_tensor()
+
+
+    def Distribute(self, mode = "shared"):
+        """
+        DISTRIBUTE THE TENSOR
+        =====================
+
+        Choose how the tensor is stored among the MPI processes,
+        and redistribute the tensor of the master accordingly.
+        The choice is kept by Center, Apply_ASR and SetupFromFile.
+        It must be called by all the processes.
+
+        Parameters
+        ----------
+            mode : string
+                - "copy" : each process has its own copy of the tensor.
+                - "shared" : only one copy for each node, in a MPI-3 shared memory window.
+                  The tensor must not be modified in place.
+                - "sharded" : each process keeps only a contiguous slice of the lattice blocks.
+                  Interpolate, Interpolate_many and prepare_for_q reduce the partial sums 
+                  of all the processes, so they must be called by all the processes together.
+                  Center and Apply_ASR collect the full tensor on the master,
+                  the other methods that read the tensor (like WriteOnFile) need the "copy" or "shared" storage.
+        """
+
+        if not mode in ["copy", "shared", "sharded"]:
+            raise ValueError("Error, unknown parallel storage '{}', use 'copy', 'shared' or 'sharded'".format(mode))
+
+        self.gather_tensor()
+        self.parallel_storage = mode
+        self.broadcast_tensor()
+
+    def broadcast_tensor(self):
+        """
+        Send the tensor of the master to all the processes, 
+        as specified by the parallel_storage attribute (see Distribute).
+        The sparse tensor is reset.
+        """
+
+        old_window = self.shared_window
+        self.shared_window = None
+        self.shard_range = None
+        self.tensor_sparse = None
+
+        # The tensor of the master may live in the old shared window, that is freed below
+        if old_window is not None and Settings.am_i_the_master():
+            self.tensor = np.array(self.tensor)
+
+        if self.parallel_storage == "shared":
+            self.tensor, self.shared_window = Settings.broadcast_shared(self.tensor)
+        elif self.parallel_storage == "sharded":
+            self.tensor, start, end = Settings.scatter_blocks(self.tensor)
+            self.shard_range = (start, end)
+        else:
+            self.tensor = Settings.broadcast(self.tensor)
+
+        Settings.free_shared(old_window)
+
+    def gather_tensor(self):
+        """
+        If the tensor is sharded, collect the full tensor on the master 
+        (the other processes get None until the next broadcast_tensor).
+        """
+
+        if self.shard_range is not None:
+            self.tensor = Settings.gather_blocks(self.tensor)
+            self.shard_range = None
+            self.tensor_sparse = None
+
+    def get_local_blocks(self):
+        """
+        Get the range of the lattice blocks stored by this process.
+        
+        Results
+        -------
+            start, end : int
+                The local tensor contains the blocks from start to end (excluded)
+        """
+        if self.shard_range is None:
+            return 0, self.n_R
+        return self.shard_range
+
+    def SetPrecision(self, precision = "double"):
+        """
+        SET THE PRECISION
+        =================
+
+        Choose the precision of the stored tensor and of the interpolation.
+        In single precision the tensor is stored as float32 and Interpolate,
+        Interpolate_many and prepare_for_q work in complex64:
+        the memory and the bandwidth of the interpolation are halved.
+        The phases are always computed in double precision before the conversion.
+        The relative error on the interpolated tensor is of the order of 1e-6,
+        enough for the linewidths and the spectral functions.
+
+        Center, Apply_ASR and the Setup methods create a double precision tensor,
+        so call this method after them. It must be called by all the processes.
+
+        Parameters
+        ----------
+            precision : string
+                - "double" : float64 tensor, complex128 interpolation (default).
+                - "single" : float32 tensor, complex64 interpolation.
+        """
+
+        if not precision in __PRECISIONS__:
+            raise ValueError("Error, unknown precision '{}', use {}".format(precision, " or ".join(["'{}'".format(x) for x in __PRECISIONS__])))
+
+        if self.get_precision() == precision:
+            return
+        dtype = np.dtype(__PRECISIONS__[precision])
+
+        tensor_sparse = self.tensor_sparse
+        self.gather_tensor()
+        if self.tensor is not None:
+            self.tensor = np.array(self.tensor, dtype = dtype)
+        self.broadcast_tensor()
+
+        # The sparse tensor keeps the same blocks
+        if tensor_sparse is not None:
+            self.tensor_sparse = tensor_sparse.astype(dtype)
+
+    def get_precision(self):
+        """
+        The precision of the stored tensor, "double" or "single" (see SetPrecision).
+        """
+        if self.tensor.dtype == np.float32:
+            return "single"
+        return "double"
+
+    def get_complex_dtype(self):
+        """
+        The dtype of the interpolated tensor: complex128, or complex64 in single precision.
+        """
+        return np.result_type(self.tensor.dtype, np.complex64)
 
 
 
@@ -1731,94 +2160,105 @@ class Tensor3():
                 atomic indices runs over the unit cell
         """
         
-        final_fc = np.zeros((3*self.nat, 3*self.nat, 3*self.nat), 
-                            dtype = np.complex128)
-        for i in range(self.n_R):
-            arg = 2  * np.pi * (q2.dot(self.r_vector2[:, i]) + 
-                                q3.dot(self.r_vector3[:, i]))            
-            phase =  np.exp(np.complex128(-1j) * arg)
-            final_fc += phase * self.tensor[i, :, :, :]
+        nat3 = 3*self.nat
+        start, end = self.get_local_blocks()
+
+        # Contract the phases with all the blocks at once
+        arg = 2  * np.pi * (q2.dot(self.r_vector2[:, start:end]) + 
+                            q3.dot(self.r_vector3[:, start:end]))            
+        phase =  np.exp(np.complex128(-1j) * arg).astype(self.get_complex_dtype(), copy = False)
+        if self.tensor_sparse is not None:
+            final_fc = self.tensor_sparse.T.dot(phase)
+        else:
+            final_fc = phase.dot(self.tensor[:end - start, :, :, :].reshape((end - start, nat3**3)))
+
+        # Sum the contributions of all the shards
+        if self.shard_range is not None:
+            final_fc = Settings.all_reduce(final_fc, in_place = True)
+        final_fc = final_fc.reshape((nat3, nat3, nat3))
 
         # Apply the acoustic sum rule if necessary
         if asr:
-            # Get the reciprocal lattice vectors
-            bg = Methods.get_reciprocal_vectors(self.unitcell_structure.unit_cell) / (2* np.pi)
+            final_fc = self.apply_asr_q(final_fc, q2, q3, verbose = verbose)
 
-            nat = self.unitcell_structure.N_atoms
+        return final_fc
 
-            # Create the projector on the orthonormal space to the ASR
-            Q_proj = np.zeros((3*nat, 3*nat), dtype = np.double)
-            for i in range(3):
-                v1 = np.zeros(nat*3, dtype = np.double)
-                v1[3*np.arange(nat) + i] = 1
-                v1 /= np.sqrt(v1.dot(v1))
-                
-                Q_proj += np.outer(v1, v1)
-            
-            # Get the N_i in the centered cell
-            # First we get the list of vectors in crystal coordinates
-            xR_list=np.unique(self.x_r_vector3, axis = 1)
-          
-            # We pick the minimum and maximum values of the lattice vectors
-            # in crystal coordinates
-            xRmin=np.min(xR_list, axis = 1)
-            xRmax=np.max(xR_list, axis = 1)
 
-            # Now we can obtain the dimension of the cell along each direction.
-            N_i = xRmax-xRmin+np.ones((3,),dtype=int)
+    def Interpolate_many(self, q2_array, q3_array, asr = False, verbose = False, max_memory = 1.0):
+        """
+        INTERPOLATE MANY
+        ================
 
-            if verbose:
-                print("Centered supercell: ", N_i)
+        Interpolate the third order on a list of (q2, q3) couples.
+        It is equivalent to calling Interpolate on each couple, but the phase matrix
+        of a chunk of couples is contracted with the tensor in a single matrix-matrix multiplication.
 
-            # We check if they are even, in that case we add 1
-            # f(q) is real only if we sum on odd cells
-            for ik in range(3):
-                if (N_i[ik] % 2 == 0):
-                    N_i[ik] += 1
-            
-            if verbose:
-                print("Supercell all odd:", N_i)
+        Parameters
+        ----------
+            q2_array, q3_array : ndarray(size = (nq, 3))
+                The list of q points
+            asr : bool
+                If true, the Acoustic sum rule is applied directly in q space
+            verbose : bool
+                If true print debugging info
+            max_memory : float
+                The memory (in Gb) allowed for the phases and the result of each chunk.
 
-            
-            # We compute the f(q) function
-            at = self.unitcell_structure.unit_cell
+        Results
+        -------
+            Phi3 : ndarray(size = (nq, 3*nat, 3*nat, 3*nat), dtype = np.complex128)
+                The third order force constant in the defined q points.
+                atomic indices runs over the unit cell
+                (complex64 if the tensor is in single precision, see SetPrecision)
+        """
 
-            __tol__ = 1e-8
-            f_q3i = np.ones(3, dtype = np.double)
-            f_q2i = np.ones(3, dtype = np.double)
-            f_q1i = np.ones(3, dtype = np.double)
+        q2_array = np.array(q2_array, dtype = np.double)
+        q3_array = np.array(q3_array, dtype = np.double)
+        if len(q2_array.shape) == 1:
+            q2_array = np.expand_dims(q2_array, axis = 0)
+        if len(q3_array.shape) == 1:
+            q3_array = np.expand_dims(q3_array, axis = 0)
 
-            # We use mask to avoid division by 0,
-            # As we know that the 0/0 limit is 1 in this case
+        assert q2_array.shape == q3_array.shape, "Error, q2 and q3 must have the same shape"
 
-            mask3 = np.abs(np.sin(at.dot(q3) * np.pi)) > __tol__ 
-            f_q3i[mask3] = np.sin(N_i[mask3] * at[mask3,:].dot(q3) * np.pi) / (N_i[mask3] * np.sin(at[mask3,:].dot(q3) * np.pi))
-            f_q3 = np.prod(f_q3i)
+        nq = q2_array.shape[0]
+        nat3 = 3*self.nat
+        start, end = self.get_local_blocks()
+        n_R = end - start
 
-            mask2 = np.abs(np.sin(at.dot(q2) * np.pi)) > __tol__
-            f_q2i[mask2] = np.sin(N_i[mask2] * at[mask2,:].dot(q2) * np.pi) / (N_i[mask2] * np.sin(at[mask2,:].dot(q2) * np.pi))
-            f_q2 = np.prod(f_q2i)
+        # Get the number of couples that fits in the memory
+        complex_dtype = self.get_complex_dtype()
+        bytes_per_q = complex_dtype.itemsize * (n_R + nat3**3)
+        n_chunk = max(1, int(max_memory * 1024.**3 / bytes_per_q))
 
-            q1 = -q2 - q3
-            mask1 = np.abs(np.sin(at.dot(q1) * np.pi)) > __tol__
-            f_q1i[mask1] = np.sin(N_i[mask1] * at[mask1,:].dot(q1) * np.pi) / (N_i[mask1] * np.sin(at[mask1,:].dot(q1) * np.pi))
-            f_q1 = np.prod(f_q1i)
+        tensor_reshaped = self.tensor[:n_R, :, :, :].reshape((n_R, nat3**3))
+        final_fc = np.zeros((nq, nat3**3), dtype = complex_dtype)
 
-            if verbose:
-                print("The fq factors:")
-                print("{:16.8f} {:16.8f} {:16.8f}".format(f_q1, f_q2, f_q3))
-                print("q1 = ", Methods.covariant_coordinates(bg * 2 * np.pi, q1))
-                print("q2 = ", Methods.covariant_coordinates(bg * 2 * np.pi, q2))
-                print("q3 = ", Methods.covariant_coordinates(bg * 2 * np.pi, q3))
+        for i_start in range(0, nq, n_chunk):
+            i_end = min(i_start + n_chunk, nq)
 
-            # Now we can impose the acustic sum rule
-            final_fc -= np.einsum("abi, ci-> abc", final_fc, Q_proj) * f_q3 
-            final_fc -= np.einsum("aic, bi-> abc", final_fc, Q_proj) * f_q2
-            final_fc -= np.einsum("ibc, ai-> abc", final_fc, Q_proj) * f_q1 
+            arg = 2 * np.pi * (q2_array[i_start:i_end, :].dot(self.r_vector2[:, start:end]) +
+                               q3_array[i_start:i_end, :].dot(self.r_vector3[:, start:end]))
+            phases = np.exp(np.complex128(-1j) * arg).astype(complex_dtype, copy = False)
+            if self.tensor_sparse is not None:
+                final_fc[i_start:i_end, :] = self.tensor_sparse.T.dot(phases.T).T
+            else:
+                final_fc[i_start:i_end, :] = phases.dot(tensor_reshaped)
 
+            # Sum the contributions of all the shards
+            if self.shard_range is not None:
+                final_fc[i_start:i_end, :] = Settings.all_reduce(final_fc[i_start:i_end, :], in_place = True)
 
+            if verbose:
+                print("Interpolated {} / {} q points".format(i_end, nq))
+
+        final_fc = final_fc.reshape((nq, nat3, nat3, nat3))
+
+        # Apply the acoustic sum rule if necessary
+        if asr:
+            for iq in range(nq):
+                final_fc[iq, :, :, :] = self.apply_asr_q(final_fc[iq, :, :, :], q2_array[iq, :], q3_array[iq, :], verbose = verbose)
 
-        
         return final_fc
 
 
@@ -1845,6 +2285,125 @@ class Tensor3():
 
 
 
+
+
+
+    def apply_asr_q(self, phi3, q2, q3, verbose = False):
+        """
+        Impose the acoustic sum rule on the third order force constant
+        interpolated in the q2 and q3 points.
+
+        Parameters
+        ----------
+            phi3 : ndarray(size = (3*nat, 3*nat, 3*nat), dtype = np.complex128)
+                The third order force constant in q space
+            q2, q3 : ndarray(3)
+                The q points
+            verbose : bool
+                If true print debugging info
+
+        Results
+        -------
+            Phi3 : ndarray(size = (3*nat, 3*nat, 3*nat))
+                The third order force constant with the acoustic sum rule
+        """
+
+        final_fc = phi3.copy()
+
+        # Get the reciprocal lattice vectors
+        bg = Methods.get_reciprocal_vectors(self.unitcell_structure.unit_cell) / (2* np.pi)
+
+        nat = self.unitcell_structure.N_atoms
+
+        # Create the projector on the orthonormal space to the ASR
+        Q_proj = np.zeros((3*nat, 3*nat), dtype = np.double)
+        for i in range(3):
+            v1 = np.zeros(nat*3, dtype = np.double)
+            v1[3*np.arange(nat) + i] = 1
+            v1 /= np.sqrt(v1.dot(v1))
+            
+            Q_proj += np.outer(v1, v1)
+        
+        # Get the N_i in the centered cell
+        # First we get the list of vectors in crystal coordinates
+        xR_list=np.unique(self.x_r_vector3, axis = 1)
+      
+        # We pick the minimum and maximum values of the lattice vectors
+        # in crystal coordinates
+        xRmin=np.min(xR_list, axis = 1)
+        xRmax=np.max(xR_list, axis = 1)
+
+        # Now we can obtain the dimension of the cell along each direction.
+        N_i = xRmax-xRmin+np.ones((3,),dtype=int)
+
+        if verbose:
+            print("Centered supercell: ", N_i)
+
+        # We check if they are even, in that case we add 1
+        # f(q) is real only if we sum on odd cells
+        for ik in range(3):
+            if (N_i[ik] % 2 == 0):
+                N_i[ik] += 1
+        
+        if verbose:
+            print("Supercell all odd:", N_i)
+
+        
+        # We compute the f(q) function
+        at = self.unitcell_structure.unit_cell
+
+        __tol__ = 1e-8
+        f_q3i = np.ones(3, dtype = np.double)
+        f_q2i = np.ones(3, dtype = np.double)
+        f_q1i = np.ones(3, dtype = np.double)
+
+        # We use mask to avoid division by 0,
+        # As we know that the 0/0 limit is 1 in this case
+
+        mask3 = np.abs(np.sin(at.dot(q3) * np.pi)) > __tol__ 
+        f_q3i[mask3] = np.sin(N_i[mask3] * at[mask3,:].dot(q3) * np.pi) / (N_i[mask3] * np.sin(at[mask3,:].dot(q3) * np.pi))
+        f_q3 = np.prod(f_q3i)
+
+        mask2 = np.abs(np.sin(at.dot(q2) * np.pi)) > __tol__
+        f_q2i[mask2] = np.sin(N_i[mask2] * at[mask2,:].dot(q2) * np.pi) / (N_i[mask2] * np.sin(at[mask2,:].dot(q2) * np.pi))
+        f_q2 = np.prod(f_q2i)
+
+        q1 = -q2 - q3
+        mask1 = np.abs(np.sin(at.dot(q1) * np.pi)) > __tol__
+        f_q1i[mask1] = np.sin(N_i[mask1] * at[mask1,:].dot(q1) * np.pi) / (N_i[mask1] * np.sin(at[mask1,:].dot(q1) * np.pi))
+        f_q1 = np.prod(f_q1i)
+
+        if verbose:
+            print("The fq factors:")
+            print("{:16.8f} {:16.8f} {:16.8f}".format(f_q1, f_q2, f_q3))
+            print("q1 = ", Methods.covariant_coordinates(bg * 2 * np.pi, q1))
+            print("q2 = ", Methods.covariant_coordinates(bg * 2 * np.pi, q2))
+            print("q3 = ", Methods.covariant_coordinates(bg * 2 * np.pi, q3))
+
+        # Now we can impose the acustic sum rule
+        final_fc -= np.einsum("abi, ci-> abc", final_fc, Q_proj) * f_q3 
+        final_fc -= np.einsum("aic, bi-> abc", final_fc, Q_proj) * f_q2
+        final_fc -= np.einsum("ibc, ai-> abc", final_fc, Q_proj) * f_q1
+
+        return final_fc
+
+
+    def prepare_for_q(self, q):
+        """
+        Prepare the interpolation of the third order force constant in (k, -q-k)
+        for a fixed q and many k points.
+
+        Parameters
+        ----------
+            q : ndarray(3)
+                The fixed q point
+
+        Results
+        -------
+            tensor3_q : Tensor3QFixed()
+                The object that performs the interpolation at each k point.
+        """
+        return Tensor3QFixed(self, q)
 
 
 
@@ -1880,7 +2439,7 @@ class Tensor3():
                                 x = xyz // 9
                                 f.write("{:>2d} {:>2d} {:>2d} {:>20.10e}\n".format(x+1,y+1,z+1, self.tensor[self.r_blocks_sparse_list[i_block], 3*nat[0] + x, 3*nat[1] + y, 3*nat[2] + z]))
        
-    def Center_sparse(self, Far=1,tol=1.0e-5):
+    def Center_sparse(self, Far=1,tol=1.0e-5, max_memory = 1.0):
         """
         CENTERING 
         =========
@@ -1892,86 +2451,92 @@ class Tensor3():
         the same perimeter, the tensor will be equally subdivided between equivalent triplets of atoms. 
 
         This function should be called before performing the Fourier interpolation.
+
+        The centering is performed by Center, then the list of the non-zero 3x3x3 blocks
+        is stored and used to setup the sparse tensor (see SetupSparse).
         """    
 
-        t1 = time.time()
-        
-        
-        if Settings.am_i_the_master():
-        
-            if self.verbose:
-                print(" ")
-                print(" ======================= Centering ==========================")
-                print(" ")         
+        # Center the tensor (in chunks of blocks)
+        self.Center(Far = Far, tol = tol, max_memory = max_memory)
 
-            # The supercell total size
-            #
-            nq0=self.supercell_size[0]
-            nq1=self.supercell_size[1]
-            nq2=self.supercell_size[2]
-            
-            n_sup = np.prod(self.supercell_size)
-            tensor_reshaped = np.transpose(self.tensor.reshape((n_sup, n_sup, 
-                                                                3*self.nat, 3*self.nat, 3*self.nat)),axes=[2,3,4,0,1])
-            alat=self.unitcell_structure.unit_cell
-            
-            weight,xR2,xR3 =thirdorder.third_order_centering.analysis(Far,
-                                        nq0,nq1,nq2,tol, 
-                                        self.unitcell_structure.unit_cell, self.tau, tensor_reshaped,self.nat)  
-            
-            
-            xR2_reshaped=np.reshape(xR2,(3,(2*Far+1)*(2*Far+1)*(2*Far+1)*n_sup*self.nat*self.nat*self.nat*n_sup*n_sup))
-            xR3_reshaped=np.reshape(xR3,(3,(2*Far+1)*(2*Far+1)*(2*Far+1)*n_sup*self.nat*self.nat*self.nat*n_sup*n_sup))
-            xR23 = np.unique(np.vstack((xR2_reshaped,xR3_reshaped)),axis=1)
-            
-            self.n_R=xR23.shape[1]
-            self.x_r_vector2,self.x_r_vector3 = np.vsplit(xR23,2)
-            self.r_vector2=self.unitcell_structure.unit_cell.T.dot(self.x_r_vector2)
-            self.r_vector3=self.unitcell_structure.unit_cell.T.dot(self.x_r_vector3)
-    
-            centered,self.n_R_sparse,x_r_vector2_sparse,x_r_vector3_sparse,atom_sparse,r_blocks_sparse_list=thirdorder.third_order_centering.center_sparse(tensor_reshaped,weight,
-                                self.x_r_vector2,xR2,self.x_r_vector3,xR3,
-                                Far,self.nat,n_sup,self.n_R)
-            
+        # Get the list of the non zero blocks (only the local ones if the tensor is sharded)
+        nat = self.nat
+        start, end = self.get_local_blocks()
+        tensor_blocks = self.tensor[:end - start].reshape((end - start, nat, 3, nat, 3, nat, 3))
+        mask = np.max(np.abs(tensor_blocks), axis = (2, 4, 6)) > 1.0e-7
+        r_blocks, at1, at2, at3 = np.nonzero(mask)
+        r_blocks += start
 
-             
-            self.x_r_vector2_sparse=x_r_vector2_sparse[:,0:self.n_R_sparse] 
-            self.x_r_vector3_sparse=x_r_vector3_sparse[:,0:self.n_R_sparse]            
-            self.atom_sparse=atom_sparse[:,0:self.n_R_sparse]         
-            self.r_blocks_sparse_list=r_blocks_sparse_list[0:self.n_R_sparse]             
-            self.r_vector2_sparse=self.unitcell_structure.unit_cell.T.dot(self.x_r_vector2_sparse)
-            self.r_vector3_sparse=self.unitcell_structure.unit_cell.T.dot(self.x_r_vector3_sparse)
-            
-            t2 = time.time() 
-            
-            self.tensor = np.transpose(centered, axes=[3,0,1,2])
-            
-            
-            if self.verbose:               
-                print("Time elapsed for computing the centering: {} s".format( t2 - t1)) 
-                #print("Memory required for the not centered tensor {} Gb".format(self.tensor.nbytes / 1024.**3))
-                print("Memory required for the centered tensor: {} Gb".format(centered.nbytes / 1024.**3))
-                #print("Memory required after removing zero elements: {} Gb".format(self.tensor.nbytes / 1024.**3))
-                print(" ")
-                print(" ============================================================")
+        self.n_R_sparse = len(r_blocks)
+        self.r_blocks_sparse_list = r_blocks
+        self.atom_sparse = np.array([at1, at2, at3], dtype = np.intc)
+        self.x_r_vector2_sparse = self.x_r_vector2[:, r_blocks]
+        self.x_r_vector3_sparse = self.x_r_vector3[:, r_blocks]
+        self.r_vector2_sparse = self.unitcell_structure.unit_cell.T.dot(self.x_r_vector2_sparse)
+        self.r_vector3_sparse = self.unitcell_structure.unit_cell.T.dot(self.x_r_vector3_sparse)
 
-           
-        
-        self.tensor = Settings.broadcast(self.tensor)
-        self.x_r_vector2 = Settings.broadcast(self.x_r_vector2)
-        self.x_r_vector3 = Settings.broadcast(self.x_r_vector3)
-        self.r_vector2 = Settings.broadcast(self.r_vector2)
-        self.r_vector3 = Settings.broadcast(self.r_vector3)
-        self.n_R = Settings.broadcast(self.n_R)
-        self.n_sup = Settings.broadcast(self.n_sup)
-        #
-        self.x_r_vector2_sparse = Settings.broadcast(self.x_r_vector2_sparse)
-        self.x_r_vector3_sparse = Settings.broadcast(self.x_r_vector3_sparse)
-        self.r_vector2_sparse = Settings.broadcast(self.r_vector2_sparse)
-        self.r_vector3_sparse = Settings.broadcast(self.r_vector3_sparse)
-        self.n_R_sparse = Settings.broadcast(self.n_R_sparse)
-        self.atom_sparse = Settings.broadcast(self.atom_sparse)
-        self.r_blocks_sparse_list = Settings.broadcast(self.r_blocks_sparse_list)    
+        # Prepare the sparse representation for the interpolation
+        self.SetupSparse(block_list = (self.r_blocks_sparse_list, self.atom_sparse))
+
+
+    def SetupSparse(self, block_list = None, threshold = 0):
+        """
+        SETUP THE SPARSE TENSOR
+        =======================
+
+        Store the tensor in a sparse CSR layout: each row is a lattice block (R2, R3),
+        and only the non-zero 3x3x3 blocks of each atomic triplet are kept.
+        After this call, Interpolate, Interpolate_many and prepare_for_q run only over the non-zero elements.
+        It must be called again if the tensor is modified (it is reset by Center and Apply_ASR).
+
+        Parameters
+        ----------
+            block_list : (ndarray(n_blocks), ndarray(3, n_blocks)), optional
+                The index of the lattice block and the atomic triplet of each non-zero block,
+                as the r_blocks_sparse_list and atom_sparse computed by Center_sparse.
+                If None, the non-zero blocks are identified from the tensor.
+            threshold : float
+                If block_list is None, the blocks whose elements are all below this threshold
+                (in absolute value) are discarded.
+        """
+
+        nat = self.nat
+        nat3 = 3 * nat
+
+        # Only the local blocks are stored if the tensor is sharded
+        start, end = self.get_local_blocks()
+        n_R = end - start
+
+        if block_list is None:
+            tensor_blocks = self.tensor[:n_R, :, :, :].reshape((n_R, nat, 3, nat, 3, nat, 3))
+            mask = np.max(np.abs(tensor_blocks), axis = (2, 4, 6)) > threshold
+            r_blocks, at1, at2, at3 = np.nonzero(mask)
+        else:
+            r_blocks = np.array(block_list[0], dtype = int)
+            at1, at2, at3 = np.array(block_list[1], dtype = int)
+
+            local = (r_blocks >= start) & (r_blocks < end)
+            r_blocks = r_blocks[local] - start
+            at1, at2, at3 = at1[local], at2[local], at3[local]
+
+        n_blocks = len(r_blocks)
+
+        # Get the indices of the 27 elements of each block
+        xyz = np.array(list(itertools.product(range(3), repeat = 3)), dtype = int)
+        i1 = 3 * at1[:, np.newaxis] + xyz[np.newaxis, :, 0]
+        i2 = 3 * at2[:, np.newaxis] + xyz[np.newaxis, :, 1]
+        i3 = 3 * at3[:, np.newaxis] + xyz[np.newaxis, :, 2]
+        rows = np.tile(r_blocks[:, np.newaxis], (1, 27))
+
+        values = self.tensor[rows, i1, i2, i3]
+        cols = (i1 * nat3 + i2) * nat3 + i3
+
+        self.tensor_sparse = scipy.sparse.csr_matrix((values.ravel(), (rows.ravel(), cols.ravel())), 
+                                                     shape = (n_R, nat3**3))
+
+        if self.verbose:
+            print("Sparse tensor: {} non-zero blocks out of {}".format(n_blocks, n_R * nat**3))
+            print("Memory required for the sparse tensor: {} Gb".format((self.tensor_sparse.data.nbytes + self.tensor_sparse.indices.nbytes) / 1024.**3))
     
     
     
@@ -2054,6 +2619,7 @@ class Tensor3():
  
  
         self.tensor = Settings.broadcast(self.tensor)
+        self.tensor_sparse = None
 
 
 
@@ -2143,6 +2709,7 @@ class Tensor3():
            
         
         self.tensor = Settings.broadcast(self.tensor)
+        self.tensor_sparse = None
         self.x_r_vector2 = Settings.broadcast(self.x_r_vector2)
         self.x_r_vector3 = Settings.broadcast(self.x_r_vector3)
         self.r_vector2 = Settings.broadcast(self.r_vector2)
@@ -2236,6 +2803,8 @@ class Tensor3():
 
            
         
+        self.tensor_sparse = None
+
         #self.tensor = Settings.broadcast(self.tensor)
         #self.x_r_vector2 = Settings.broadcast(self.x_r_vector2)
         #self.x_r_vector3 = Settings.broadcast(self.x_r_vector3)
@@ -2700,6 +3269,7 @@ class Tensor3():
            
         
         self.tensor = Settings.broadcast(self.tensor)
+        self.tensor_sparse = None
         self.x_r_vector2 = Settings.broadcast(self.x_r_vector2)
         self.x_r_vector3 = Settings.broadcast(self.x_r_vector3)
         self.r_vector2 = Settings.broadcast(self.r_vector2)
@@ -2799,6 +3369,7 @@ class Tensor3():
 
  
         self.tensor = Settings.broadcast(self.tensor)
+        self.tensor_sparse = None
         self.x_r_vector2 = Settings.broadcast(self.x_r_vector2)
         self.x_r_vector3 = Settings.broadcast(self.x_r_vector3)
         self.r_vector2 = Settings.broadcast(self.r_vector2)
@@ -2943,6 +3514,7 @@ class Tensor3():
                 print(" ============================================================")
  
         self.tensor = Settings.broadcast(self.tensor)
+        self.tensor_sparse = None
         self.x_r_vector2 = Settings.broadcast(self.x_r_vector2)
         self.x_r_vector3 = Settings.broadcast(self.x_r_vector3)
         self.r_vector2 = Settings.broadcast(self.r_vector2)
@@ -2951,3 +3523,274 @@ class Tensor3():
         self.n_sup = Settings.broadcast(self.n_sup)
  
  
+
+
+
+class Tensor3QFixed:
+    """
+    This class interpolates a third order force constant in (k, -q-k)
+    for a fixed q point. Use Tensor3.prepare_for_q to create it.
+
+    The phase factor of each block factorizes as
+
+    .. math::
+
+        e^{-2\\pi i [k\\cdot R_2 - (q + k)\\cdot R_3]} = e^{-2\\pi i k\\cdot(R_2 - R_3)} e^{2\\pi i q\\cdot R_3}
+
+    so the blocks sharing the same R_2 - R_3 are summed only once for each q.
+    Then the interpolation in k runs only over the distinct differences.
+    """
+
+    def __init__(self, tensor3, q):
+        """
+        Pre-contract the tensor on the fixed q point.
+
+        Parameters
+        ----------
+            tensor3 : Tensor3()
+                The centered third order force constant
+            q : ndarray(3)
+                The fixed q point
+        """
+
+        self.tensor3 = tensor3
+        self.q = np.array(q, dtype = np.double)
+        self.nat = tensor3.nat
+
+        n_R = tensor3.n_R
+        nat3 = 3 * self.nat
+
+        # Group the blocks with the same R2 - R3 difference
+        x_r_diff = np.array(tensor3.x_r_vector2[:, :n_R]) - np.array(tensor3.x_r_vector3[:, :n_R])
+        x_r_diff, i_diff = np.unique(x_r_diff, axis = 1, return_inverse = True)
+        i_diff = np.ravel(i_diff)
+
+        self.n_diff = x_r_diff.shape[1]
+        self.x_r_diff = x_r_diff
+        self.r_diff = tensor3.unitcell_structure.unit_cell.T.dot(x_r_diff)
+
+        # Sum the (local) blocks with the q phase
+        start, end = tensor3.get_local_blocks()
+        n_local = end - start
+        phase_q = np.exp(np.complex128(1j) * 2 * np.pi * self.q.dot(tensor3.r_vector3[:, start:end]))
+        phase_q = phase_q.astype(tensor3.get_complex_dtype(), copy = False)
+        sum_matrix = scipy.sparse.csr_matrix((phase_q, (i_diff[start:end], np.arange(n_local))), shape = (self.n_diff, n_local))
+
+        # If the tensor is sparse, also the pre-contracted one is kept sparse
+        if tensor3.tensor_sparse is not None:
+            self.tensor = sum_matrix.dot(tensor3.tensor_sparse)
+        else:
+            self.tensor = sum_matrix.dot(tensor3.tensor[:n_local, :, :, :].reshape((n_local, nat3**3)))
+
+        # Sum the contributions of all the shards,
+        # then each process can interpolate any k point
+        if tensor3.shard_range is not None:
+            if scipy.sparse.issparse(self.tensor):
+                self.tensor = self.tensor.toarray()
+            self.tensor = Settings.all_reduce(self.tensor, in_place = True)
+
+        if tensor3.verbose:
+            print("Tensor3 prepared for q = {}: {} blocks reduced to {}".format(self.q, n_R, self.n_diff))
+
+
+    def interpolate_k(self, k, asr = False, verbose = False):
+        """
+        Interpolate the third order force constant in (k, -q-k).
+        It is equivalent to tensor3.Interpolate(k, -q-k)
+
+        Parameters
+        ----------
+            k : ndarray(3)
+                The k point
+            asr : bool
+                If true, the Acoustic sum rule is applied directly in q space
+            verbose : bool
+                If true print debugging info
+
+        Results
+        -------
+            Phi3 : ndarray(size = (3*nat, 3*nat, 3*nat))
+                The third order force constant in the (k, -q-k) points.
+                atomic indices runs over the unit cell
+        """
+
+        nat3 = 3 * self.nat
+
+        phase = np.exp(np.complex128(-1j) * 2 * np.pi * k.dot(self.r_diff)).astype(self.tensor.dtype, copy = False)
+        if scipy.sparse.issparse(self.tensor):
+            final_fc = self.tensor.T.dot(phase)
+        else:
+            final_fc = phase.dot(self.tensor)
+        final_fc = final_fc.reshape((nat3, nat3, nat3))
+
+        if asr:
+            final_fc = self.tensor3.apply_asr_q(final_fc, k, -self.q - k, verbose = verbose)
+
+        return final_fc
+
+
+
+# ============================================================================================================================================ 
+# Binary format ============================================================================================================================== 
+# ============================================================================================================================================  
+
+__BINARY_FORMAT_VERSION__ = 1
+
+# Additional attributes of the Tensor2 saved in the binary header (if present)
+__BINARY_TENSOR2_EXTRA__ = ["effective_charges", "dielectric_tensor", "QE_alat", "QE_tau", "QE_zeu", "QE_bg", "QE_omega"]
+
+
+def get_structure_dict(structure):
+    """
+    Convert the structure in a dictionary that can be stored in a JSON file.
+    """
+    return {"unit_cell" : np.array(structure.unit_cell).tolist(),
+            "coords" : np.array(structure.coords).tolist(),
+            "atoms" : list(structure.atoms),
+            "masses" : {k : float(v) for k, v in structure.masses.items()}}
+
+
+def get_structure_from_dict(struct_dict):
+    """
+    Build the structure from a dictionary created by get_structure_dict.
+    """
+    structure = Structure.Structure(len(struct_dict["atoms"]))
+    structure.coords[:, :] = struct_dict["coords"]
+    structure.atoms = list(struct_dict["atoms"])
+    structure.unit_cell = np.array(struct_dict["unit_cell"], dtype = np.double)
+    structure.has_unit_cell = True
+    structure.masses = dict(struct_dict["masses"])
+    return structure
+
+
+def save_tensor_binary(fname, tensor):
+    """
+    SAVE THE TENSOR IN BINARY FORMAT
+    ================================
+
+    Save a Tensor2 or a Tensor3 in the native binary format.
+    Two files are written:
+        - fname.npy : the tensor as a raw numpy array (it can be memory mapped)
+        - fname.json : the header, with the version of the format, the lattice vectors,
+          the structures and the supercell size.
+
+    Parameters
+    ----------
+        fname : string
+            The prefix of the files.
+        tensor : Tensor2() or Tensor3()
+            The tensor to be saved.
+    """
+
+    if isinstance(tensor, Tensor3):
+        tensor_type = "Tensor3"
+    else:
+        tensor_type = "Tensor2"
+
+    if Settings.am_i_the_master():
+        header = {"version" : __BINARY_FORMAT_VERSION__,
+                  "tensor_type" : tensor_type,
+                  "nat" : int(tensor.nat),
+                  "n_R" : int(tensor.n_R),
+                  "supercell_size" : [int(x) for x in tensor.supercell_size],
+                  "dtype" : str(tensor.tensor.dtype),
+                  "shape" : list(tensor.tensor.shape),
+                  "x_r_vector2" : np.array(tensor.x_r_vector2).tolist(),
+                  "unitcell_structure" : get_structure_dict(tensor.unitcell_structure),
+                  "supercell_structure" : get_structure_dict(tensor.supercell_structure)}
+
+        if tensor_type == "Tensor3":
+            header["x_r_vector3"] = np.array(tensor.x_r_vector3).tolist()
+        else:
+            for key in __BINARY_TENSOR2_EXTRA__:
+                value = getattr(tensor, key)
+                if value is not None:
+                    header[key] = np.array(value).tolist()
+
+        with open(fname + ".json", "w") as fp:
+            json.dump(header, fp, indent = 2)
+
+        np.save(fname + ".npy", np.ascontiguousarray(tensor.tensor))
+
+    Settings.barrier()
+
+
+def load_binary_header(fname):
+    """
+    Read the header of a tensor saved with save_tensor_binary.
+
+    Parameters
+    ----------
+        fname : string
+            The prefix of the files.
+
+    Results
+    -------
+        header : dict
+            The content of the header. The structures can be rebuilt with get_structure_from_dict.
+    """
+
+    with open(fname + ".json", "r") as fp:
+        header = json.load(fp)
+
+    if header["version"] > __BINARY_FORMAT_VERSION__:
+        raise ValueError("Error, the file {} has the binary format version {}, but only up to {} is supported.".format(fname, header["version"], __BINARY_FORMAT_VERSION__))
+
+    return header
+
+
+def load_tensor_binary(fname, tensor, memmap = False):
+    """
+    LOAD THE TENSOR IN BINARY FORMAT
+    ================================
+
+    Load a Tensor2 or a Tensor3 saved with save_tensor_binary.
+    Each process reads the files, so no broadcast is needed.
+
+    Parameters
+    ----------
+        fname : string
+            The prefix of the files.
+        tensor : Tensor2() or Tensor3()
+            The tensor to be filled.
+        memmap : bool
+            If True, the tensor is memory mapped in read-only mode instead of being loaded.
+            All the processes on the same node share the same physical memory.
+    """
+
+    header = load_binary_header(fname)
+
+    if isinstance(tensor, Tensor3):
+        tensor_type = "Tensor3"
+    else:
+        tensor_type = "Tensor2"
+
+    if header["tensor_type"] != tensor_type:
+        raise ValueError("Error, the file {} contains a {}, cannot load it in a {}".format(fname, header["tensor_type"], tensor_type))
+    if header["nat"] != tensor.nat:
+        raise ValueError("Error, the file {} has {} atoms in the unit cell, the tensor {}".format(fname, header["nat"], tensor.nat))
+    if list(header["supercell_size"]) != [int(x) for x in tensor.supercell_size]:
+        raise ValueError("Error, the file {} has the supercell {}, the tensor {}".format(fname, header["supercell_size"], list(tensor.supercell_size)))
+
+    if memmap:
+        tensor.tensor = np.load(fname + ".npy", mmap_mode = "r")
+    else:
+        tensor.tensor = np.load(fname + ".npy")
+
+    tensor.n_R = header["n_R"]
+    unit_cell = tensor.unitcell_structure.unit_cell
+
+    tensor.x_r_vector2 = np.array(header["x_r_vector2"], dtype = np.intc, order = "F")
+    tensor.r_vector2 = np.asfortranarray(unit_cell.T.dot(tensor.x_r_vector2))
+
+    if tensor_type == "Tensor3":
+        tensor.x_r_vector3 = np.array(header["x_r_vector3"], dtype = np.intc, order = "F")
+        tensor.r_vector3 = np.asfortranarray(unit_cell.T.dot(tensor.x_r_vector3))
+        tensor.tensor_sparse = None
+    else:
+        for key in __BINARY_TENSOR2_EXTRA__:
+            if key in header:
+                value = np.array(header[key], order = "F")
+                if value.ndim == 0:
+                    value = float(value)
+                setattr(tensor, key, value)
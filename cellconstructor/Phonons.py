@@ -1621,27 +1621,15 @@ class Phonons:
         """
         Generate the dynamical matrix ready for the Fast Fourier Transform.
         This is an alternative way to go in real space.
-        NOTE: Use only for debug purpouses
-        """
-
-        s1, s2, s3 = self.GetSupercell() 
-        nat = self.structure.N_atoms
-        output_dyn = np.zeros((s1, s2, s3, 3 * nat, 3 * nat), dtype = np.complex128, order = "F")
 
-        super_struct = self.structure.generate_supercell((s1,s2,s3))
-        bg = super_struct.get_reciprocal_vectors() / (2 * np.pi)
-
-        for iq, q in enumerate(self.q_tot):
-            x_vect = Methods.covariant_coordinates(bg, q)
-            x1 = int((x_vect[0] + s1) % s1 + .5)
-            x2 = int((x_vect[1] + s2) % s2 + .5)
-            x3 = int((x_vect[2] + s3) % s3 + .5)
-
-            #print("Q = ", q, "| xv:", x_vect, "x = ", x1, x2,x3)
-
-            output_dyn[x1, x2, x3, :, :] = self.dynmats[iq]
+        Results
+        -------
+            output_dyn : ndarray(size = (s1, s2, s3, 3*nat, 3*nat), dtype = np.complex128)
+                The dynamical matrix on the q grid. The first three indices are the
+                crystal coordinates of the q point in units of the reciprocal supercell.
+        """
 
-        return output_dyn            
+        return GetDynQGridFFT(np.array(self.dynmats), np.array(self.q_tot), self.structure.unit_cell, self.GetSupercell())
 
             
     def ExtractRandomStructures(self, size=1, T=0, isolate_atoms = [], project_on_vectors = None):
@@ -3364,10 +3352,35 @@ def GetSupercellFCFromDyn(dynmat, q_tot, unit_cell_structure, supercell_structur
         
     if itau is None:
         itau = supercell_structure.get_itau(unit_cell_structure)-1
+    itau = np.array(itau)
     
-    #dynmat = np.zeros( (nq, 3*nat, 3*nat), dtype = np.complex128, order = "F")
-    fc = np.zeros((3*nat_sc, 3*nat_sc), dtype = np.complex128)
+    # Try the FFT: it works if the q points are a complete grid
+    # and the supercell atoms are in the lattice positions
+    supercell_size = symmetries.GetSupercellFromQlist(q_tot, unit_cell_structure.unit_cell)
+    R_cryst = Methods.covariant_coordinates(unit_cell_structure.unit_cell, 
+                                            supercell_structure.coords - unit_cell_structure.coords[itau, :])
+    x_cell = np.rint(R_cryst).astype(int)
+
+    if np.prod(supercell_size) == nq and np.max(np.abs(R_cryst - x_cell)) < __EPSILON__:
+        try:
+            # The imaginary part of each block is repeated nq times in the supercell
+            fc_blocks, x_r = GetRealSpaceFCBlocksFFT(dynmat, q_tot, unit_cell_structure.unit_cell, 
+                                                     supercell_size, img_thr = img_thr / np.sqrt(nq))
+        except ValueError:
+            fc_blocks = None
+    
+        if fc_blocks is not None:
+            s1, s2, s3 = supercell_size
 
+            # Get the block of each couple of atoms C(a, b) = C(0, b - a)
+            dx = (x_cell[np.newaxis, :, :] - x_cell[:, np.newaxis, :]) % np.array(supercell_size)
+            i_block = (dx[:, :, 0] * s2 + dx[:, :, 1]) * s3 + dx[:, :, 2]
+
+            fc_blocks = fc_blocks.reshape((nq, nat, 3, nat, 3))
+            fc = fc_blocks[i_block, itau[:, np.newaxis], :, itau[np.newaxis, :], :]
+            fc = np.einsum("ijab -> iajb", fc).reshape((3*nat_sc, 3*nat_sc))
+
+            return np.complex128(fc)
 
     fc = symph.fast_ft_real_space_from_dynq(unit_cell_structure.coords, supercell_structure.coords, itau+1, np.array(q_tot), dynmat, unit_cell_structure.N_atoms, supercell_structure.N_atoms, q_tot.shape[0])
 
@@ -3419,6 +3432,118 @@ def GetSupercellFCFromDyn(dynmat, q_tot, unit_cell_structure, supercell_structur
 
 
 
+def GetDynQGridFFT(dynmat, q_tot, unit_cell, supercell_size):
+    """
+    GET THE DYNAMICAL MATRIX ON THE FFT GRID
+    ========================================
+
+    Arrange the dynamical matrices in the layout required by the numpy FFT.
+    The q point of crystal coordinates (x1/s1, x2/s2, x3/s3) 
+    (in units of the reciprocal unit cell vectors) is stored in the [x1, x2, x3] element.
+
+    Parameters
+    ----------
+        dynmat : ndarray (nq, 3nat, 3nat, dtype = np.complex128)
+            The dynamical matrix at each q point. Note nq must be complete, not only the irreducible.
+        q_tot : ndarray ( nq, 3)
+            The q vectors in 2pi/Angstrom
+        unit_cell : ndarray(3,3)
+            The unit cell of the structure (rows are the vectors)
+        supercell_size : list of 3 int
+            The size of the q grid
+
+    Results
+    -------
+        dynq_grid : ndarray(size = (s1, s2, s3, 3*nat, 3*nat), dtype = np.complex128)
+            The dynamical matrices on the q grid
+    """
+
+    s1, s2, s3 = supercell_size
+    nq = len(q_tot)
+    nat3 = np.shape(dynmat)[1]
+
+    if nq != s1 * s2 * s3:
+        raise ValueError("Error, the number of q points {} does not match the supercell {}".format(nq, supercell_size))
+
+    # Get the integer coordinates of the q points in the grid
+    x_q = np.array(q_tot).dot(np.array(unit_cell).T) * np.array(supercell_size)
+    x_int = np.rint(x_q).astype(int)
+
+    if np.max(np.abs(x_q - x_int)) > __EPSILON__:
+        raise ValueError("Error, the q points are not commensurate with the supercell {}".format(supercell_size))
+
+    x_int %= np.array(supercell_size)
+
+    # Check that each point of the grid is present only once
+    i_grid = (x_int[:, 0] * s2 + x_int[:, 1]) * s3 + x_int[:, 2]
+    if len(np.unique(i_grid)) != nq:
+        raise ValueError("Error, the q points do not cover the whole {} grid.".format(supercell_size))
+
+    dynq_grid = np.zeros((s1, s2, s3, nat3, nat3), dtype = np.complex128)
+    dynq_grid[x_int[:, 0], x_int[:, 1], x_int[:, 2], :, :] = dynmat
+
+    return dynq_grid
+
+
+def GetRealSpaceFCBlocksFFT(dynmat, q_tot, unit_cell, supercell_size, img_thr = 1e-6):
+    r"""
+    GET THE REAL SPACE FORCE CONSTANT BLOCKS WITH FFT
+    =================================================
+
+    Compute the real space force constant with the fast fourier transform.
+    Instead of the whole supercell matrix, it returns only the blocks
+    between the unit cell and each lattice vector :math:`\vec R_b`
+
+    .. math::
+
+        C_{k\alpha,k'\beta}(0, b) = \frac{1}{N_q} \sum_q \tilde C_{k\alpha k'\beta}(q) e^{-i\vec q \cdot \vec R_b}
+
+    This is the same convension of GetSupercellFCFromDyn and of the Tensor2 class.
+    The cost is :math:`O(N_q \log N_q n_{at}^2)`.
+
+    Parameters
+    ----------
+        dynmat : ndarray (nq, 3nat, 3nat, dtype = np.complex128)
+            The dynamical matrix at each q point. Note nq must be complete, not only the irreducible.
+        q_tot : ndarray ( nq, 3)
+            The q vectors in 2pi/Angstrom
+        unit_cell : ndarray(3,3)
+            The unit cell of the structure (rows are the vectors)
+        supercell_size : list of 3 int
+            The size of the q grid
+        img_thr : float
+            The threshold on the imaginary part of the result
+
+    Results
+    -------
+        fc_blocks : ndarray(size = (s1*s2*s3, 3*nat, 3*nat), dtype = np.double)
+            The real space force constant. The first index is
+            the lattice vector R = (i_x, i_y, i_z) in crystal coordinates, 
+            with i_block = s2*s3*i_x + s3*i_y + i_z
+        x_r_vectors : ndarray(size = (s1*s2*s3, 3), dtype = np.intc)
+            The crystal coordinates of the lattice vectors of each block
+    """
+
+    dynq_grid = GetDynQGridFFT(dynmat, q_tot, unit_cell, supercell_size)
+    nq = np.prod(supercell_size)
+    nat3 = dynq_grid.shape[-1]
+
+    fc_blocks = np.fft.fftn(dynq_grid, axes = (0,1,2)) / nq
+    fc_blocks = fc_blocks.reshape((nq, nat3, nat3))
+
+    # Check the imaginary part
+    imag = np.sqrt(np.sum(np.imag(fc_blocks)**2))
+    ASSERT_ERROR = """
+    Error, the imaginary part of the real space force constant 
+    is not zero. IMAG={}
+    """
+    assert imag < img_thr, ASSERT_ERROR.format(imag)
+
+    x_r_vectors = np.array(list(itertools.product(*[range(s) for s in supercell_size])), dtype = np.intc)
+
+    return np.real(fc_blocks), x_r_vectors
+
+
 def GetDynQFromFCSupercell(fc_supercell, q_tot, unit_cell_structure, supercell_structure, itau = None):
     r"""
     GET THE DYNAMICAL MATRICES
@@ -10,29 +10,100 @@ try:
     import mpi4py.MPI
     __PARALLEL_TYPE__ = "mpi4py"
 except:
-    try:
-        __PARALLEL_TYPE__ = "serial"
-        import multiprocessing as mp
-    except:
-        __PARALLEL_TYPE__ = "serial"
+    __PARALLEL_TYPE__ = "serial"
 
+# The process pool needs to fork the workers,
+# so that they inherit the data without pickling it
+try:
+    import multiprocessing as mp
+    __FORK_AVAILABLE__ = "fork" in mp.get_all_start_methods()
+except:
+    __FORK_AVAILABLE__ = False
+
+import os
+import time
+import mmap
+import contextlib
+import numpy as np
 
 
 __SUPPORTED_LIBS__ = ["mp", "serial", "mpi4py"]
 __MPI_LIBRARIES__ = ["mpi4py"]
 __NPROC__ = 1
 
+# The communicator of the parallel functions (see process_groups)
+__COMM__ = None
+if __PARALLEL_TYPE__ == "mpi4py":
+    __COMM__ = mpi4py.MPI.COMM_WORLD
+
 def ParallelPrint(*args, **kwargs):
     """
-    Print only if I am the master
+    Print only if I am the master (of all the processes)
     """
-    if am_i_the_master():
+    if __PARALLEL_TYPE__ != "mpi4py" or mpi4py.MPI.COMM_WORLD.Get_rank() == 0:
         print(*args, **kwargs)
 
+def get_communicator():
+    """
+    Get the MPI communicator used by all the parallel functions of the module.
+    It is COMM_WORLD, unless the processes are split in groups (see process_groups).
+    """
+    return __COMM__
+
+@contextlib.contextmanager
+def process_groups(n_groups):
+    """
+    PROCESS GROUPS
+    ==============
+
+    Split the MPI processes in groups of contiguous ranks.
+    Inside the with block, all the parallel functions of the module
+    (GoParallel, broadcast, all_reduce, am_i_the_master...) work within
+    the group of the process, so that different groups can run
+    independent calculations. 
+    Without MPI there is only one group.
+    This function must be called by all the processes.
+
+        >>> with process_groups(4) as (group, n_groups):
+        >>>     for i in range(group, n_tasks, n_groups):
+        >>>         results[i] = GoParallel(...)
+
+    Parameters
+    ----------
+        n_groups : int
+            The number of groups (limited to the number of processes).
+
+    Results
+    -------
+        group : int
+            The index of the group of this process.
+        n_groups : int
+            The actual number of groups.
+    """
+
+    global __COMM__
+
+    if __PARALLEL_TYPE__ != "mpi4py":
+        yield 0, 1
+        return
+
+    old_comm = __COMM__
+    size = old_comm.Get_size()
+    rank = old_comm.Get_rank()
+    n_groups = max(1, min(int(n_groups), size))
+
+    group = (rank * n_groups) // size
+    __COMM__ = old_comm.Split(group, rank)
+    try:
+        yield group, n_groups
+    finally:
+        __COMM__.Free()
+        __COMM__ = old_comm
+
 
 def am_i_the_master():
     if __PARALLEL_TYPE__ == "mpi4py":
-        comm = mpi4py.MPI.COMM_WORLD
+        comm = get_communicator()
         rank = comm.Get_rank()
         if rank == 0:
             return True
@@ -45,9 +116,9 @@ def get_rank():
     Get the rank of the process
     """
     if __PARALLEL_TYPE__ == "mpi4py":
-        comm = mpi4py.MPI.COMM_WORLD
+        comm = get_communicator()
         return comm.Get_rank()
-    elif __PARALLEL_TYPE__ == "serial":
+    elif __PARALLEL_TYPE__ in ["serial", "mp"]:
         return 0
     else:
         raise NotImplementedError("Error, I do not know what is the rank with the {} parallelization".format(__PARALLEL_TYPE__))
@@ -56,12 +127,27 @@ def broadcast(list_of_values):
     """
     Broadcast the list to all the processors from the master.
     It returns a list equal for all the processors from the master
+
+    If the master sends a numpy array, it is transferred with
+    broadcast_array, without pickling it.
     """
 
     if __PARALLEL_TYPE__ == "mpi4py":
-        comm = mpi4py.MPI.COMM_WORLD
-        return comm.bcast(list_of_values, root = 0)
-    elif __PARALLEL_TYPE__ == "serial":
+        comm = get_communicator()
+
+        # Send the metadata of the arrays, or directly the object
+        info = None
+        if am_i_the_master():
+            if _is_buffer_array(list_of_values):
+                info = ("array", list_of_values.shape, list_of_values.dtype.str)
+            else:
+                info = ("object", list_of_values)
+        info = comm.bcast(info, root = 0)
+
+        if info[0] == "object":
+            return info[1]
+        return broadcast_array(list_of_values, info[1:])
+    elif __PARALLEL_TYPE__ in ["serial", "mp"]:
         return list_of_values
     else:
         raise NotImplementedError("broadcast not implemented for {} parallelization.".format(__PARALLEL_TYPE__))
@@ -74,17 +160,340 @@ def barrier():
     """
 
     if __PARALLEL_TYPE__ == "mpi4py":
-        comm = mpi4py.MPI.COMM_WORLD
+        comm = get_communicator()
         comm.barrier()
 
-def SetupParallel(n_processors=1):
+# The maximum number of bytes sent by a single MPI call
+__MPI_CHUNK_BYTES__ = 2**30
+
+def _is_buffer_array(array):
+    """
+    True if the object is a numpy array that can be sent as a buffer
+    """
+    return isinstance(array, np.ndarray) and not array.dtype.hasobject
+
+def _bcast_buffer(comm, array):
+    """
+    Broadcast in place the content of a contiguous array from the process 0
+    of the communicator, in chunks of __MPI_CHUNK_BYTES__.
+    """
+    raw = array.reshape(-1).view(np.uint8)
+    for start in range(0, raw.size, __MPI_CHUNK_BYTES__):
+        comm.Bcast(raw[start : start + __MPI_CHUNK_BYTES__], root = 0)
+
+def broadcast_array(array, info = None):
+    """
+    BROADCAST A NUMPY ARRAY
+    =======================
+
+    Broadcast a numpy array from the master with the buffer interface of MPI.
+    Only the shape and the dtype are pickled, the data is sent in chunks
+    of __MPI_CHUNK_BYTES__, directly from the array of the master into
+    the array allocated by the other processes.
+    This function must be called by all the processes.
+
+    Parameters
+    ----------
+        array : ndarray
+            The array to be sent. Only the value of the master is used.
+        info : tuple
+            The shape and the dtype string of the array, if already known
+            by all the processes.
+
+    Results
+    -------
+        array : ndarray
+            The array of the master
+            (the master gets its own array, if it is C contiguous).
+    """
+
+    if __PARALLEL_TYPE__ != "mpi4py":
+        return array
+
+    comm = get_communicator()
+    if info is None:
+        if am_i_the_master():
+            info = (array.shape, array.dtype.str)
+        info = comm.bcast(info, root = 0)
+    shape, dtype = info
+
+    if am_i_the_master():
+        array = np.ascontiguousarray(array)
+    else:
+        array = np.empty(shape, dtype = np.dtype(dtype))
+
+    _bcast_buffer(comm, array)
+    return array
+
+def broadcast_shared(array):
+    """
+    BROADCAST IN SHARED MEMORY
+    ==========================
+
+    Broadcast a numpy array from the master so that only one copy is stored
+    for each node. The array is allocated in a MPI-3 shared memory window,
+    filled by the first process of each node, and all the other processes
+    of the node get a view on it.
+
+    The returned array must be treated as read-only.
+    Without MPI the array is returned as it is.
+    This function must be called by all the processes.
+
+    Parameters
+    ----------
+        array : ndarray
+            The array to be shared. Only the value of the master is used.
+
+    Results
+    -------
+        shared_array : ndarray
+            The array in the node shared memory.
+        window : mpi4py.MPI.Win
+            The shared memory window (None without MPI).
+            It must be kept alive as long as the array is used,
+            and released with free_shared.
+    """
+
+    if __PARALLEL_TYPE__ != "mpi4py":
+        return array, None
+
+    comm = get_communicator()
+    info = None
+    if am_i_the_master():
+        array = np.ascontiguousarray(array)
+        info = (array.shape, array.dtype.str)
+    shape, dtype = comm.bcast(info, root = 0)
+    dtype = np.dtype(dtype)
+
+    # The communicator of the processes on the same node
+    # and the one of the first process of each node
+    # (the master is the first process of its node)
+    node_comm = comm.Split_type(mpi4py.MPI.COMM_TYPE_SHARED, key = comm.Get_rank())
+    node_rank = node_comm.Get_rank()
+    color = 0 if node_rank == 0 else mpi4py.MPI.UNDEFINED
+    leader_comm = comm.Split(color, comm.Get_rank())
+
+    n_bytes = int(np.prod(shape)) * dtype.itemsize
+    if node_rank != 0:
+        n_bytes = 0
+    window = mpi4py.MPI.Win.Allocate_shared(n_bytes, dtype.itemsize, comm = node_comm)
+    buf, itemsize = window.Shared_query(0)
+    shared_array = np.ndarray(buffer = buf, dtype = dtype, shape = shape)
+
+    if node_rank == 0:
+        if am_i_the_master():
+            shared_array[...] = array
+
+        # Send the data to the other nodes
+        _bcast_buffer(leader_comm, shared_array)
+        leader_comm.Free()
+
+    node_comm.Barrier()
+    node_comm.Free()
+
+    return shared_array, window
+
+def free_shared(window):
+    """
+    Release a shared memory window created by broadcast_shared.
+    The arrays that point to the window cannot be used anymore.
+    This function must be called by all the processes.
+    """
+    if window is not None:
+        window.Free()
+
+def scatter_blocks(array):
+    """
+    SCATTER THE BLOCKS
+    ==================
+
+    Split an array of the master along the first axis in contiguous slices,
+    and send each slice to a different process.
+    This function must be called by all the processes.
+
+    Parameters
+    ----------
+        array : ndarray
+            The array to be split. Only the value of the master is used.
+
+    Results
+    -------
+        local_array : ndarray
+            The slice of the array owned by this process
+        start, end : int
+            The local array is array[start:end]
+    """
+
+    if __PARALLEL_TYPE__ != "mpi4py":
+        return array, 0, len(array)
+
+    comm = get_communicator()
+    n_proc = comm.Get_size()
+    rank = comm.Get_rank()
+
+    info = None
+    if am_i_the_master():
+        info = (array.shape, array.dtype.str)
+    shape, dtype = comm.bcast(info, root = 0)
+
+    bounds = [(i * shape[0]) // n_proc for i in range(n_proc + 1)]
+    start = bounds[rank]
+    end = bounds[rank + 1]
+
+    if am_i_the_master():
+        for i in range(1, n_proc):
+            comm.Send(np.ascontiguousarray(array[bounds[i] : bounds[i+1]]), dest = i, tag = i)
+        local_array = np.array(array[start:end], order = "C")
+    else:
+        local_array = np.empty((end - start,) + tuple(shape[1:]), dtype = np.dtype(dtype))
+        comm.Recv(local_array, source = 0, tag = rank)
+
+    return local_array, start, end
+
+def gather_blocks(local_array):
+    """
+    Collect on the master the slices distributed by scatter_blocks.
+    The master gets the full array, the other processes None.
+    This function must be called by all the processes.
+    """
+
+    if __PARALLEL_TYPE__ != "mpi4py":
+        return local_array
+
+    comm = get_communicator()
+    n_proc = comm.Get_size()
+    shapes = comm.gather(local_array.shape, root = 0)
+
+    if not am_i_the_master():
+        comm.Send(np.ascontiguousarray(local_array), dest = 0, tag = comm.Get_rank())
+        return None
+
+    slices = [np.array(local_array)]
+    for i in range(1, n_proc):
+        buf = np.empty(shapes[i], dtype = local_array.dtype)
+        comm.Recv(buf, source = i, tag = i)
+        slices.append(buf)
+
+    return np.concatenate(slices, axis = 0)
+
+def _get_mpi_op(reduce_op):
+    """
+    Get the MPI operator of the reduction
+    """
+
+    if reduce_op == "+":
+        return mpi4py.MPI.SUM
+    elif reduce_op == "*":
+        return mpi4py.MPI.PROD
+    raise NotImplementedError("Error, reduction '{}' not implemented.".format(reduce_op))
+
+def _chunks(array):
+    """
+    Iterate over the flattened contiguous array in chunks of at most
+    __MPI_CHUNK_BYTES__ (the element count of a MPI call is a 32 bit integer)
+    """
+    flat = array.reshape(-1)
+    step = max(1, __MPI_CHUNK_BYTES__ // max(1, array.dtype.itemsize))
+    for start in range(0, flat.size, step):
+        yield flat[start : start + step]
+
+def all_reduce(array, reduce_op = "+", in_place = False):
+    """
+    ALL REDUCE
+    ==========
+
+    Reduce a numpy array among all the processes with the buffer
+    interface of MPI. The result is returned to all of them.
+
+    Parameters
+    ----------
+        array : ndarray
+            The local array. It must have the same shape and dtype
+            in all the processes.
+        reduce_op : string
+            Accepted operators are "+" and "*".
+        in_place : bool
+            If True and the array is C contiguous, the result is written
+            in the array itself, avoiding a copy.
+
+    Results
+    -------
+        result : ndarray
+            The reduced array.
+    """
+
+    if not reduce_op in ["+", "*"]:
+        raise NotImplementedError("Error, reduction '{}' not implemented.".format(reduce_op))
+
+    if __PARALLEL_TYPE__ != "mpi4py":
+        return array
+
+    op = _get_mpi_op(reduce_op)
+    comm = get_communicator()
+
+    if in_place and isinstance(array, np.ndarray) and array.flags.c_contiguous and array.flags.writeable:
+        result = array
+    else:
+        result = np.array(array, order = "C")
+
+    for chunk in _chunks(result):
+        comm.Allreduce(mpi4py.MPI.IN_PLACE, chunk, op = op)
+    return result
+
+def reduce_array(array, reduce_op = "+"):
+    """
+    REDUCE ON THE MASTER
+    ====================
+
+    Reduce a numpy array among all the processes with the buffer
+    interface of MPI. Only the master gets the result, so the other
+    processes do not need to allocate it.
+    This function must be called by all the processes.
+
+    Parameters
+    ----------
+        array : ndarray
+            The local array. It must have the same shape and dtype
+            in all the processes.
+        reduce_op : string
+            Accepted operators are "+" and "*".
+
+    Results
+    -------
+        result : ndarray
+            The reduced array on the master, None on the other processes.
+    """
+
+    if not reduce_op in ["+", "*"]:
+        raise NotImplementedError("Error, reduction '{}' not implemented.".format(reduce_op))
+
+    if __PARALLEL_TYPE__ != "mpi4py":
+        return array
+
+    op = _get_mpi_op(reduce_op)
+    comm = get_communicator()
+
+    if am_i_the_master():
+        result = np.array(array, order = "C")
+        for chunk in _chunks(result):
+            comm.Reduce(mpi4py.MPI.IN_PLACE, chunk, op = op, root = 0)
+        return result
+
+    for chunk in _chunks(np.ascontiguousarray(array)):
+        comm.Reduce(chunk, None, op = op, root = 0)
+    return None
+
+def SetupParallel(n_processors=None):
     """
     SETUP THE MODULE FOR PARALLEL EXECUTION
     =======================================
     
     This method initialize the parallelization of the module.
     For serial execution use n_processors = 1.
-    Note that this kind of parallelization is implemented in single nodes.
+    Note that this kind of parallelization is implemented in single nodes:
+    if n_processors > 1 the work of GoParallel is split among a pool of
+    processes forked from the current one. In this case, limit the threads
+    of the numerical libraries (OMP_NUM_THREADS) to avoid oversubscription.
     
     Parameters
     ----------
@@ -92,6 +501,7 @@ def SetupParallel(n_processors=1):
             The number of processors to be used for the heavy parallel
             executions. If negative or zero, the system tries to determine 
             automatically the number of aveabile.
+            If None, the current setting is kept (serial by default).
             It is useless if the parallelization is done with MPI
     """
     
@@ -103,12 +513,25 @@ def SetupParallel(n_processors=1):
         __NPROC__ = comm.Get_size()
         if __NPROC__ == 1:
             __PARALLEL_TYPE__ = "serial"
+        else:
+            return
+
+    if n_processors is None:
+        n_processors = __NPROC__
+    elif n_processors < 1:
+        try:
+            n_processors = len(os.sched_getaffinity(0))
+        except AttributeError:
+            n_processors = mp.cpu_count()
+
+    if n_processors > 1 and not __FORK_AVAILABLE__:
+        raise ValueError("Error, trying to setup a parallel computation without MPI and without fork support")
 
     __NPROC__ = n_processors
-    if n_processors > 1 and __PARALLEL_TYPE__ == "serial":
-        raise ValueError("Error, trying to setup a parallel computation with a 'serial' library")
-    if n_processors < 1:
-        raise ValueError("Error, the number of processors must be 1 or higher")
+    if n_processors > 1:
+        __PARALLEL_TYPE__ = "mp"
+    else:
+        __PARALLEL_TYPE__ = "serial"
     
 def GetNProc():
     """
@@ -121,37 +544,343 @@ def GetNProc():
     """
 
     if __PARALLEL_TYPE__ == "mpi4py":
-        return mpi4py.MPI.COMM_WORLD.Get_size()
+        return get_communicator().Get_size()
     
     return __NPROC__
     
-def GoParallel(function, list_of_inputs, reduce_op = None):
+def _reduce_values(result, values, reduce_op):
     """
-    GO PARALLEL
-    ===========
-    
-    Perform a parallel evaluation of the provided function with the spawned
-    list of inputs, and returns a list of output
-    
+    Reduce in place the list of values into the list result.
+    """
+    for j in range(len(result)):
+        if reduce_op == "+":
+            result[j] += values[j]
+        else:
+            result[j] *= values[j]
+
+def _fold(iterator, reduce_op):
+    """
+    FOLD THE RESULTS
+    ================
+
+    Reduce the tuples of values produced by the iterator as soon as they
+    are generated, so that only the accumulator is kept in memory.
+
+    Parameters
+    ----------
+        iterator : generator
+            It yields the tuples of values to be reduced.
+        reduce_op : string
+            The reduction, "+" or "*".
+
+    Results
+    -------
+        result : list
+            The reduction of the values, None if the iterator is empty.
+    """
+
+    result = None
+    for values in iterator:
+        if result is None:
+            # Copy the arrays, so the function outputs are not modified
+            result = [np.array(x) if isinstance(x, np.ndarray) else x for x in values]
+        else:
+            _reduce_values(result, values, reduce_op)
+    return result
+
+def _all_reduce_values(result, reduce_op):
+    """
+    REDUCE THE RESULTS AMONG THE PROCESSES
+    ======================================
+
+    Reduce the accumulators of GoParallel among all the MPI processes.
+    The numpy arrays are reduced in place with the buffer based Allreduce,
+    the other objects are gathered and reduced by each process.
+
+    Parameters
+    ----------
+        result : list
+            The local accumulator, None if the process had no input.
+        reduce_op : string
+            The reduction, "+" or "*".
+
+    Results
+    -------
+        result : list
+            The total reduction, None if no process had any input.
+    """
+
+    comm = get_communicator()
+
+    info = None
+    if result is not None:
+        info = [(x.shape, x.dtype.str) if _is_buffer_array(x) else None for x in result]
+    infos = [x for x in comm.allgather(info) if x is not None]
+    if len(infos) == 0:
+        return None
+
+    reduced = []
+    for j in range(len(infos[0])):
+        if all([x[j] is not None for x in infos]):
+            if result is None:
+                # The identity of the reduction
+                shape, dtype = infos[0][j]
+                if reduce_op == "+":
+                    value = np.zeros(shape, dtype = np.dtype(dtype))
+                else:
+                    value = np.ones(shape, dtype = np.dtype(dtype))
+            else:
+                value = result[j]
+            value = all_reduce(value, reduce_op, in_place = True)
+        else:
+            local = None
+            if result is not None:
+                local = result[j]
+            values = [x for x in comm.allgather(local) if x is not None]
+            value = values[0]
+            for x in values[1:]:
+                if reduce_op == "+":
+                    value += x
+                else:
+                    value *= x
+        reduced.append(value)
+
+    return reduced
+
+def get_task_timings():
+    """
+    GET THE TIMINGS OF THE LAST PARALLEL EXECUTION
+    ==============================================
+
+    Get the time spent on each input by the last call of GoParallel
+    or GoParallelTuple, useful to check the load balancing
+    (see the schedule argument of GoParallel).
+
+    Results
+    -------
+        times : ndarray(n_inputs)
+            The seconds spent by the function on each input.
+        owners : ndarray(n_inputs, dtype = int)
+            The process (MPI rank or worker of the pool) that computed each input.
+    """
+    return __TASK_TIMES__, __TASK_OWNERS__
+
+# The timings of the last parallel execution
+__TASK_TIMES__ = None
+__TASK_OWNERS__ = None
+
+__SCHEDULES__ = ["static", "dynamic"]
+
+def _get_chunk_size(n_inputs, n_proc, chunk_size):
+    """
+    The number of inputs assigned at once by the dynamic schedule.
+    By default each process gets about 8 chunks.
+    """
+    if chunk_size is None:
+        chunk_size = n_inputs // (8 * n_proc)
+    return max(1, int(chunk_size))
+
+def _run_tasks(function, list_of_inputs, indices, times, owners, rank):
+    """
+    Generate the results of the function on the given indices of the inputs,
+    recording the time spent on each of them.
+    """
+    for i in indices:
+        t1 = time.time()
+        values = function(list_of_inputs[i])
+        times[i] = time.time() - t1
+        owners[i] = rank
+        yield values
+
+def _mpi_dynamic_indices(n_inputs, chunk_size):
+    """
+    DYNAMIC SCHEDULE WITH MPI
+    =========================
+
+    Generate the indices of the inputs to be computed by this process.
+    The next free chunk is taken from a counter stored on the master,
+    which is atomically incremented with a one-sided MPI operation,
+    so that faster processes steal the work of the slower ones.
+    All the processes must consume the generator up to the end.
+    With a single process there is nothing to balance, and the inputs are
+    taken in order (the MPI window cannot be created by a singleton).
+    """
+
+    comm = get_communicator()
+
+    if comm.Get_size() == 1:
+        for i in range(n_inputs):
+            yield i
+        return
+
+    counter = np.zeros(1 if am_i_the_master() else 0, dtype = np.int64)
+    window = mpi4py.MPI.Win.Create(counter, disp_unit = counter.itemsize, comm = comm)
+
+    increment = np.array([chunk_size], dtype = np.int64)
+    start = np.zeros(1, dtype = np.int64)
+    try:
+        while True:
+            window.Lock(0, mpi4py.MPI.LOCK_SHARED)
+            window.Fetch_and_op(increment, start, 0, 0, op = mpi4py.MPI.SUM)
+            window.Unlock(0)
+
+            if start[0] >= n_inputs:
+                break
+            for i in range(int(start[0]), min(int(start[0]) + chunk_size, n_inputs)):
+                yield i
+    finally:
+        window.Free()
+
+def _go_parallel_mp(function, list_of_inputs, reduce_op, schedule = "static", chunk_size = None):
+    """
+    PROCESS POOL BACKEND
+    ====================
+
+    Evaluate the function on the list of inputs with a pool of __NPROC__
+    processes, and reduce the results.
+
+    The workers are forked, so they inherit the function, the inputs and
+    everything they refer to (as the force constant tensors) without any
+    pickling. With the static schedule each worker gets a contiguous chunk
+    of the inputs, with the dynamic one the workers take the next chunk
+    from a shared counter when they are free.
+    Each worker reduces its results and sends them to the master with a pipe.
+    The master reduces the results of the workers at the end.
+
+    The master does not evaluate the function: all the workers are forked
+    before any input is computed. The thread pool of OpenMP does not survive
+    a fork, so a worker forked after an OpenMP kernel ran in the master
+    would hang in the next parallel region of the kernel.
+    For the same reason, the OpenMP kernels called by the script before
+    GoParallel should run with OMP_NUM_THREADS=1 when using the process pool.
+
     Parameters
     ----------
         function : pointer to function
-            The function to be executed in parallel
+            It must return a tuple of numbers or numpy arrays, with the
+            same shape for all the inputs.
         list_of_inputs : list
-            A list containing the inputs to be passed to the function.
+            The inputs of the function.
         reduce_op : string
-            If a reduction must be performed on output, specify the operator, 
-            accepted are "+", "*". For now this is implemented only with MPI
-            
+            The reduction, "+" or "*".
+        schedule : string
+            "static" or "dynamic"
+        chunk_size : int
+            The inputs assigned at once by the dynamic schedule.
+
+    Results
+    -------
+        result : list
+            The reduction of each element of the tuple returned by function.
+        times, owners : ndarray
+            The timing of each input (see get_task_timings).
+    """
+
+    n_inputs = len(list_of_inputs)
+    if n_inputs == 0:
+        raise ValueError("Error, the list of inputs is empty")
+
+    # The timings are written by all the workers
+    timing_buffer = mmap.mmap(-1, 16 * n_inputs)
+    times = np.ndarray(n_inputs, dtype = np.float64, buffer = timing_buffer)
+    owners = np.ndarray(n_inputs, dtype = np.int64, buffer = timing_buffer, offset = 8 * n_inputs)
+
+    n_proc = min(__NPROC__, n_inputs)
+    if n_proc < 2:
+        # Nothing to fork
+        result = _fold(_run_tasks(function, list_of_inputs, range(n_inputs), times, owners, 0), reduce_op)
+        return [np.array(x)[()] for x in result], np.array(times), np.array(owners)
+
+    ctx = mp.get_context("fork")
+    bounds = [(i * n_inputs) // n_proc for i in range(n_proc + 1)]
+    chunk_size = _get_chunk_size(n_inputs, n_proc, chunk_size)
+    counter = ctx.Value("q", 0)
+
+    def get_indices(i):
+        if schedule == "static":
+            for k in range(bounds[i], bounds[i+1]):
+                yield k
+            return
+
+        while True:
+            with counter.get_lock():
+                start = counter.value
+                counter.value += chunk_size
+            if start >= n_inputs:
+                return
+            for k in range(start, min(start + chunk_size, n_inputs)):
+                yield k
+
+    def work(i, connection):
+        # A dynamic worker may get no input (None is sent)
+        partial = _fold(_run_tasks(function, list_of_inputs, get_indices(i), times, owners, i), reduce_op)
+        connection.send(partial)
+        connection.close()
+
+    processes = []
+    connections = []
+    for i in range(n_proc):
+        receiver, sender = ctx.Pipe(duplex = False)
+        processes.append(ctx.Process(target = work, args = (i, sender)))
+        connections.append(receiver)
+        processes[-1].start()
+        # Only the worker keeps the sending end, so a failure is seen as the end of the pipe
+        sender.close()
+
+    # Receive before joining, a worker cannot exit until its results are read
+    partials = []
+    try:
+        for connection in connections:
+            try:
+                partials.append(connection.recv())
+            except EOFError:
+                partials.append(None)
+            connection.close()
+    finally:
+        for p in processes:
+            p.join()
+
+    for i, p in enumerate(processes):
+        if p.exitcode != 0:
+            raise RuntimeError("Error, the process {} of the pool failed with exit code {}".format(i, p.exitcode))
+
+    result = None
+    for partial in partials:
+        if partial is None:
+            continue
+        if result is None:
+            result = partial
+        else:
+            _reduce_values(result, partial, reduce_op)
+
+    return [np.array(x)[()] for x in result], np.array(times), np.array(owners)
+
+def _go_parallel(function, list_of_inputs, reduce_op, schedule, chunk_size):
+    """
+    The parallel evaluation and reduction of GoParallelTuple.
     """
+
+    global __TASK_TIMES__
+    global __TASK_OWNERS__
+
     if not __PARALLEL_TYPE__ in __SUPPORTED_LIBS__:
         raise ValueError("Error, wrong parallelization type: %s\nSupported types: %s" % (__PARALLEL_TYPE__, " ".join(__SUPPORTED_LIBS__)))
-        
-    
+
+    if not schedule in __SCHEDULES__:
+        raise ValueError("Error, unknown schedule '{}', use one of: {}".format(schedule, " ".join(__SCHEDULES__)))
+
+    if __PARALLEL_TYPE__ == "mp":
+        if not reduce_op in ["*", "+"]:
+            raise NotImplementedError("Error, for now parallelization with the process pool implemented only with reduction")
+
+        result, __TASK_TIMES__, __TASK_OWNERS__ = _go_parallel_mp(function, list_of_inputs, reduce_op, schedule, chunk_size)
+        return result
+
     if __PARALLEL_TYPE__ in __MPI_LIBRARIES__ or __PARALLEL_TYPE__ == "serial":
-        if not reduce_op is None:
-            if not reduce_op in ["*", "+"]:
-                raise NotImplementedError("Error, reduction '{}' not implemented.".format(reduce_op))
+        if reduce_op is None:
+            raise NotImplementedError("Error, for now parallelization with MPI implemented only with reduction")
+        if not reduce_op in ["*", "+"]:
+            raise NotImplementedError("Error, reduction '{}' not implemented.".format(reduce_op))
 
         # Here we create the poll manually
         n_proc = GetNProc()
@@ -159,62 +888,69 @@ def GoParallel(function, list_of_inputs, reduce_op = None):
 
         # broadcast the values
         list_of_inputs = broadcast(list_of_inputs)
+        n_inputs = len(list_of_inputs)
 
-        # Prepare the work for the current processor
-        # TODO: Use a generator
-        computing_list = []
-        for i in range(rank, len(list_of_inputs), n_proc):
-            computing_list.append(list_of_inputs[i])
+        # Choose the inputs of the current processor
+        if schedule == "dynamic" and __PARALLEL_TYPE__ == "mpi4py":
+            indices = _mpi_dynamic_indices(n_inputs, _get_chunk_size(n_inputs, n_proc, chunk_size))
+        else:
+            indices = range(rank, n_inputs, n_proc)
 
-        #print("Rank {} is computing {} elements".format(rank, len(computing_list)))
-        
-        # Work!
-        results = [function(x) for x in computing_list]
+        # Work, each result is reduced as soon as it is computed
+        times = np.zeros(n_inputs, dtype = np.float64)
+        owners = np.zeros(n_inputs, dtype = np.int64)
+        result = _fold(_run_tasks(function, list_of_inputs, indices, times, owners, rank), reduce_op)
 
-        # Perform the reduction
-        if reduce_op == "+":
-            result = results[0]
-            for i in range(1,len(results)):
-                result+= results[i]
-
-        elif reduce_op == "*":
-            result = results[0]
-            for i in range(1,len(results)):
-                result*= results[i]
-
-        # If a reduction must be done, return
-        if not reduce_op is None:
-            if __PARALLEL_TYPE__ == "mpi4py":
-                comm = mpi4py.MPI.COMM_WORLD
-                results = comm.allgather(result) 
-            elif __PARALLEL_TYPE__ == "serial":
-                return result
-            else:
-                raise NotImplementedError("Error, not implemented {}".format(__PARALLEL_TYPE__))
-
-            result = results[0]
-            # Perform the last reduction
-            if reduce_op == "+":
-                for i in range(1,len(results)):
-                    result+= results[i]
-            elif reduce_op == "*":
-                for i in range(1,len(results)):
-                    result*= results[i]
-
-            return result 
-        else:
-            raise NotImplementedError("Error, for now parallelization with MPI implemented only with reduction")
+        # Perform the last reduction among the processors
+        if __PARALLEL_TYPE__ == "mpi4py":
+            result = _all_reduce_values(result, reduce_op)
+            times = all_reduce(times, in_place = True)
+            owners = all_reduce(owners, in_place = True)
+
+        __TASK_TIMES__ = times
+        __TASK_OWNERS__ = owners
+
+        if result is None:
+            raise ValueError("Error, the list of inputs is empty")
+
+        return result
     else:
         raise NotImplementedError("Something went wrong: {}".format(__PARALLEL_TYPE__))
 
-    #elif __PARALLEL_TYPE__ == "mp":
-        #p = mp.Pool(__NPROC__)
-        #return p.map(function, list_of_inputs)
-    #elif __PARALLEL_TYPE__ == "serial":
-        #return map(function, list_of_inputs)
-        
     
-def GoParallelTuple(function, list_of_inputs, reduce_op = None):
+def GoParallel(function, list_of_inputs, reduce_op = None, schedule = "static", chunk_size = None):
+    """
+    GO PARALLEL
+    ===========
+    
+    Perform a parallel evaluation of the provided function with the spawned
+    list of inputs, and returns a list of output
+    
+    Parameters
+    ----------
+        function : pointer to function
+            The function to be executed in parallel
+        list_of_inputs : list
+            A list containing the inputs to be passed to the function.
+        reduce_op : string
+            If a reduction must be performed on output, specify the operator, 
+            accepted are "+", "*". For now this is implemented only with MPI
+            and the process pool (see SetupParallel).
+        schedule : string
+            How the inputs are split among the processes.
+            "static" assigns them in advance (round-robin with MPI);
+            "dynamic" gives the next chunk of inputs to the first free process,
+            which balances the load when the cost of the inputs is uneven.
+            The time spent on each input is available from get_task_timings.
+        chunk_size : int
+            The number of inputs assigned at once by the dynamic schedule.
+            If None, each process gets about 8 chunks.
+            
+    """
+
+    return _go_parallel(lambda x : (function(x),), list_of_inputs, reduce_op, schedule, chunk_size)[0]
+    
+def GoParallelTuple(function, list_of_inputs, reduce_op = None, schedule = "static", chunk_size = None):
     """
     GO PARALLEL TUPLE
     ==================
@@ -231,82 +967,12 @@ def GoParallelTuple(function, list_of_inputs, reduce_op = None):
         reduce_op : string
             If a reduction must be performed on output, specify the operator, 
             accepted are "+", "*". For now this is implemented only with MPI
+            and the process pool (see SetupParallel).
+        schedule : string
+            "static" or "dynamic", see GoParallel.
+        chunk_size : int
+            The number of inputs assigned at once by the dynamic schedule.
             
     """
-    if not __PARALLEL_TYPE__ in __SUPPORTED_LIBS__:
-        raise ValueError("Error, wrong parallelization type: %s\nSupported types: %s" % (__PARALLEL_TYPE__, " ".join(__SUPPORTED_LIBS__)))
-        
-    
-    if __PARALLEL_TYPE__ in __MPI_LIBRARIES__ or __PARALLEL_TYPE__ == "serial":
-        if not reduce_op is None:
-            if not reduce_op in ["*", "+"]:
-                raise NotImplementedError("Error, reduction '{}' not implemented.".format(reduce_op))
-
-        # Here we create the poll manually
-        n_proc = GetNProc()
-        rank = get_rank()
-
-        # broadcast the values
-        list_of_inputs = broadcast(list_of_inputs)
-
-        # Prepare the work for the current processor
-        # TODO: Use a generator
-        computing_list = []
-        for i in range(rank, len(list_of_inputs), n_proc):
-            computing_list.append(list_of_inputs[i])
-
-        #print("Rank {} is computing {} elements".format(rank, len(computing_list)))
-        
-        # Work!
-        results = [function(x) for x in computing_list]
-
-        # Perform the reduction
-        if reduce_op == "+":
-            result = list(results[0])
-            for i in range(1,len(results)):
-                for j in range(len(results[i])):
-                    result[j] += results[i][j]
-
-        if reduce_op == "*":
-            result = list(results[0])
-            for i in range(1,len(results)):
-                for j in range(len(results[i])):
-                    result[j] *= results[i][j]
-
-
-        # If a reduction must be done, return
-        if not reduce_op is None:
-            if __PARALLEL_TYPE__ == "mpi4py":
-                comm = mpi4py.MPI.COMM_WORLD
-                results = []
-                for i in range(len(result)):
-                    results.append(comm.allgather(result[i]))
-
-            elif __PARALLEL_TYPE__ == "serial":
-                return result
-            else:
-                raise NotImplementedError("Error, not implemented {}".format(__PARALLEL_TYPE__))
-
-
-            result = results[0]
-            for j in range(len(results)):
-                # Perform the last reduction
-                if reduce_op == "+":
-                    for i in range(1,len(results[j])):
-                        result[j]+= results[j][i]
-                elif reduce_op == "*":
-                    for i in range(1,len(results[j])):
-                        result[j]*= results[j][i]
-
-            return result 
-        else:
-            raise NotImplementedError("Error, for now parallelization with MPI implemented only with reduction")
-    else:
-        raise NotImplementedError("Something went wrong: {}".format(__PARALLEL_TYPE__))
 
-    #elif __PARALLEL_TYPE__ == "mp":
-        #p = mp.Pool(__NPROC__)
-        #return p.map(function, list_of_inputs)
-    #elif __PARALLEL_TYPE__ == "serial":
-        #return map(function, list_of_inputs)
-        
\ No newline at end of file
+    return _go_parallel(function, list_of_inputs, reduce_op, schedule, chunk_size)
@@ -7,7 +7,9 @@ import cellconstructor.symmetries as symmetries
 
 import numpy as np
 
+import os
 import itertools
+import collections
 
 import symph
 import thirdorder
@@ -28,9 +30,797 @@ In this module we compute the Spectral function
 using the interpolation on the third order force constant matrix
 """
 
+# ========================== K POINTS ================================================
+
+def get_k_points(structure, k_grid, q, use_symmetries = False):
+    """
+    GET THE INTEGRATION POINTS
+    ==========================
+
+    Get the k points of the integration grid, with their weights.
+    If use_symmetries is True, the grid is reduced to the points irreducible 
+    under the small group of q, plus the time reversal combined with the symmetries
+    that send q in -q. Each point is weighted by the number of points in its star.
+    The sum over the reduced grid must be symmetrized with symmetrize_bubble
+    (or averaged over the degenerate modes of q, see average_degenerate_modes).
+
+    Parameters
+    ----------
+        structure : Structure()
+            The unit cell structure
+        k_grid : (nk1, nk2, nk3)
+            The grid of k points to be used for the integration
+        q : ndarray(size = 3)
+            The q point at which the bubble is computed.
+        use_symmetries : bool
+            If True, the grid is reduced by symmetries.
+
+    Results
+    -------
+        k_points : list of ndarray(size = 3)
+            The integration points
+        k_weights : ndarray(size = len(k_points))
+            The weights of the points (their sum is the number of points of the full grid)
+        qe_sym : QE_Symmetry()
+            The symmetries of the small group of q (None if use_symmetries is False)
+    """
+
+    k_points = CC.symmetries.GetQGrid(structure.unit_cell, k_grid)
+    nk = len(k_points)
+
+    if not use_symmetries:
+        return k_points, np.ones(nk, dtype = np.double), None
+
+    qe_sym = CC.symmetries.QE_Symmetry(structure)
+    qe_sym.SetupQPoint(q)
+
+    # The symmetries act on the crystal coordinates of the q vectors
+    bg = qe_sym.QE_bg.T
+    aq = Methods.covariant_coordinates(bg, q)
+    rotations = [qe_sym.QE_s[:, :, i] for i in range(qe_sym.QE_nsymq)]
+    if qe_sym.QE_minus_q:
+        for i in range(qe_sym.QE_nsym):
+            new_q = qe_sym.QE_s[:, :, i].dot(aq)
+            if Methods.get_min_dist_into_cell(np.eye(3), -new_q, aq) < CC.symmetries.__EPSILON__:
+                rotations.append(-qe_sym.QE_s[:, :, i])
+
+    # Get the index of each k point in the grid
+    n_grid = np.array(k_grid, dtype = int)
+    k_cryst = Methods.covariant_coordinates(bg, np.array(k_points))
+    k_int = np.rint(k_cryst * n_grid).astype(int) % n_grid
+    grid_index = np.zeros(nk, dtype = int)
+    grid_index[(k_int[:, 0] * n_grid[1] + k_int[:, 1]) * n_grid[2] + k_int[:, 2]] = np.arange(nk)
+
+    # Get the image of each k point for each symmetry
+    images = np.zeros((len(rotations), nk), dtype = int)
+    for i, rot in enumerate(rotations):
+        new_k = rot.dot(k_cryst.T).T * n_grid
+        if np.max(np.abs(new_k - np.rint(new_k))) > CC.symmetries.__EPSILON__:
+            raise ValueError("Error, the k grid {} is not compatible with the symmetries of the crystal.\nUse a different grid or use_symmetries = False.".format(k_grid))
+        new_k = np.rint(new_k).astype(int) % n_grid
+        images[i, :] = grid_index[(new_k[:, 0] * n_grid[1] + new_k[:, 1]) * n_grid[2] + new_k[:, 2]]
+
+    # Pick one point for each star
+    star_index = -np.ones(nk, dtype = int)
+    irr_points = []
+    k_weights = []
+    for ik in range(nk):
+        if star_index[ik] >= 0:
+            continue
+        star = np.unique(images[:, ik])
+        star_index[star] = len(irr_points)
+        irr_points.append(k_points[ik])
+        k_weights.append(len(star))
+
+    k_weights = np.array(k_weights, dtype = np.double)
+    assert int(np.sum(k_weights)) == nk
+
+    print(" k points reduced by symmetries from {} to {} ({} symmetries)".format(nk, len(irr_points), len(rotations)))
+
+    return irr_points, k_weights, qe_sym
+
+
+def symmetrize_bubble(qe_sym, bubble, q):
+    """
+    Symmetrize the bubble (in cartesian coordinates, divided by the masses) 
+    on the small group of q, with the QE_Symmetry machinery.
+    The hermitian and the antihermitian parts are symmetrized separately,
+    as the time reversal acts on the self-energy as a transposition.
+
+    Parameters
+    ----------
+        qe_sym : QE_Symmetry()
+            The symmetries returned by get_k_points
+        bubble : ndarray(size = (3*nat, 3*nat), dtype = np.complex128)
+            The bubble summed over the reduced grid
+        q : ndarray(size = 3)
+            The q point
+
+    Results
+    -------
+        bubble : ndarray(size = (3*nat, 3*nat), dtype = np.complex128)
+            The symmetrized bubble
+    """
+
+    herm = np.array(0.5 * (bubble + np.conj(bubble.T)), dtype = np.complex128)
+    antiherm = np.array(-0.5j * (bubble - np.conj(bubble.T)), dtype = np.complex128)
+
+    qe_sym.SymmetrizeDynQ(herm, q)
+    qe_sym.SymmetrizeDynQ(antiherm, q)
+
+    return herm + 1j * antiherm
+
+
+def average_degenerate_modes(values, w_q, axis = 0, modes = None):
+    """
+    Average the self-energy of the modes of q on the degenerate subspaces.
+    It replaces the symmetrization when only the diagonal of the bubble is computed.
+
+    Parameters
+    ----------
+        values : ndarray
+            The values for each mode of q
+        w_q : ndarray(size = 3*nat)
+            The frequencies of q
+        axis : int
+            The axis of values that runs over the modes
+        modes : list of int
+            The modes of q of the values along axis (default: all the modes).
+            They must contain complete degenerate subspaces (see get_modes).
+
+    Results
+    -------
+        values : ndarray
+            The averaged values
+    """
+
+    if modes is None:
+        modes = np.arange(len(w_q))
+    position = {mu : i for i, mu in enumerate(modes)}
+    degeneracies = CC.symmetries.get_degeneracies(w_q)
+
+    values = np.moveaxis(values, axis, 0)
+    new_values = np.zeros_like(values)
+    for i, mu in enumerate(modes):
+        new_values[i] = np.mean(values[[position[nu] for nu in degeneracies[mu]]], axis = 0)
+
+    return np.moveaxis(new_values, 0, axis)
+
+
+def get_modes(modes, w_q, complete_degeneracies = False):
+    """
+    The indices of the selected modes of q.
+    The bubbles computed on a selection of modes only contract
+    the third order force constants with the polarization vectors
+    of these modes, so the cost is proportional to the number of selected modes.
+
+    Parameters
+    ----------
+        modes : list of int
+            The selected modes of q (sorted by frequency, starting from 0).
+            If None, all the modes are selected.
+        w_q : ndarray(size = 3*nat)
+            The frequencies of q
+        complete_degeneracies : bool
+            If True, the selection must contain all the modes degenerate with the
+            selected ones (needed to average on the degenerate subspaces
+            when the k points are reduced by symmetries).
+
+    Results
+    -------
+        modes : ndarray(dtype = np.intc)
+            The indices of the selected modes
+    """
+
+    n_mod = len(w_q)
+    if modes is None:
+        return np.arange(n_mod, dtype = np.intc)
+
+    modes = np.atleast_1d(np.array(modes, dtype = np.intc))
+    if modes.ndim != 1 or len(modes) == 0:
+        raise ValueError("Error, modes must be a non empty list of mode indices")
+    if np.any(modes < 0) or np.any(modes >= n_mod):
+        raise ValueError("Error, the modes must be between 0 and {}".format(n_mod - 1))
+    if len(np.unique(modes)) != len(modes):
+        raise ValueError("Error, the modes must not be repeated")
+
+    if complete_degeneracies:
+        for mu in modes:
+            missing = np.setdiff1d(CC.symmetries.get_degeneracies(w_q)[mu], modes)
+            if len(missing):
+                raise ValueError("Error, the mode {} is degenerate with {} that are not selected.\n".format(mu, list(missing)) +
+                                 "Select all the degenerate modes, or use_symmetries = False")
+
+    return modes
+
+
+# ========================== TEMPERATURES ============================================
+
+def _get_temperatures(T):
+    """
+    The temperatures as an array, and True if T is a single temperature.
+    The bubbles computed for an array of temperatures have an extra first axis.
+    """
+    is_scalar = np.ndim(T) == 0
+    return np.atleast_1d(np.array(T, dtype = np.double)), is_scalar
+
+
+def _get_temperature_name(T, is_scalar):
+    """
+    The suffix of the output files for the temperature T
+    (empty for the calculations with a single temperature).
+    """
+    if is_scalar:
+        return ""
+    return "_T" + "{:7.1f}".format(T).strip()
+
+
+# ========================== ENERGY GRID =============================================
+
+def get_adaptive_energies(function, e0, e1, n_energies, w_q = None, n_start = None, n_iter = 3, axis = 0,
+                          floor = 0.05):
+    """
+    ADAPTIVE ENERGY GRID
+    ====================
+
+    Build a non uniform grid of n_energies energies between e0 and e1,
+    dense where the spectral function has its peaks and coarse in the featureless regions.
+    The calculation starts from a coarse uniform grid (plus the frequencies w_q),
+    then the intervals with the largest spectral weight are split in n_iter passes.
+    Each pass computes the function only on the new energies.
+    The number of energies is always n_energies, so the grids of different q points
+    have the same size.
+
+    Parameters
+    ----------
+        function : function
+            It takes an array of energies and returns a tuple of arrays,
+            with the energies along axis. The first one (the spectral function) drives the refinement.
+        e0, e1 : float
+            The range of the energies
+        n_energies : int
+            The number of energies of the final grid
+        w_q : ndarray
+            The frequencies of q (optional), added to the starting grid.
+        n_start : int
+            The size of the starting uniform grid (default n_energies // 4)
+        n_iter : int
+            The number of refinement passes.
+        axis : int
+            The axis of the energies in the results of function.
+        floor : float
+            The weight of the intervals without spectral weight, relative to the peaks.
+
+    Results
+    -------
+        energies : ndarray(size = n_energies)
+            The sorted energies
+        results : tuple
+            The results of function on the energies.
+    """
+
+    if n_start is None:
+        n_start = max(2, n_energies // 4)
+
+    seeds = np.zeros(0, dtype = np.double)
+    if w_q is not None:
+        w_q = np.asarray(w_q, dtype = np.double)
+        seeds = w_q[(w_q > e0) & (w_q < e1)]
+    energies = np.union1d(np.linspace(e0, e1, max(2, n_start - len(seeds))), seeds)
+    if len(energies) > n_energies:
+        raise ValueError("Error, {} energies are not enough for the adaptive grid (at least {} are needed)".format(n_energies, len(energies)))
+
+    results = [np.asarray(x) for x in function(energies)]
+
+    n_pass = 0
+    while len(energies) < n_energies:
+        # The spectral weight of each interval, with each component normalized to its peak
+        values = np.abs(np.moveaxis(results[0], axis, 0)).reshape((len(energies), -1))
+        peaks = np.max(values, axis = 0)
+        values = np.divide(values, peaks, out = np.zeros_like(values), where = peaks > 0)
+        height = np.max(np.maximum(values[1:], values[:-1]), axis = 1)
+        weight = np.diff(energies) * (height + floor)
+
+        # Split the heaviest intervals
+        n_left = n_energies - len(energies)
+        n_add = min(len(energies) - 1, max(1, n_left // max(1, n_iter - n_pass)))
+        split = np.sort(np.argsort(-weight, kind = "stable")[:n_add])
+        new_energies = 0.5 * (energies[split] + energies[split + 1])
+
+        new_results = function(new_energies)
+        order = np.argsort(np.concatenate((energies, new_energies)), kind = "stable")
+        energies = np.concatenate((energies, new_energies))[order]
+        results = [np.take(np.concatenate((x, np.asarray(y)), axis = axis), order, axis = axis)
+                   for x, y in zip(results, new_results)]
+        n_pass += 1
+
+    return energies, tuple(results)
+
+
+def interpolate_energies(energies, values, new_energies, axis = 0):
+    """
+    Linearly interpolate values computed on a (non uniform) grid of energies
+    on new_energies. Outside the grid the values on the edges are used.
+
+    Parameters
+    ----------
+        energies : ndarray(size = ne)
+            The sorted energies
+        values : ndarray
+            The values, with the energies along axis (also complex)
+        new_energies : ndarray(size = n_new)
+            The energies where the values are needed
+        axis : int
+            The axis of the energies
+
+    Results
+    -------
+        new_values : ndarray
+            The interpolated values, with n_new energies along axis.
+    """
+
+    energies = np.asarray(energies, dtype = np.double)
+    new_energies = np.asarray(new_energies, dtype = np.double)
+    values = np.moveaxis(np.asarray(values), axis, 0)
+
+    index = np.clip(np.searchsorted(energies, new_energies), 1, len(energies) - 1)
+    e_a = energies[index - 1]
+    e_b = energies[index]
+    x = np.clip((new_energies - e_a) / (e_b - e_a), 0, 1)
+    x = x.reshape(x.shape + (1,) * (values.ndim - 1))
+
+    new_values = (1 - x) * values[index - 1] + x * values[index]
+    return np.moveaxis(new_values, 0, axis)
+
+
+# ========================== PHONON CACHE ============================================
+
+class PhononGridCache:
+    """
+    PHONON GRID CACHE
+    =================
+
+    Cache of the phonon frequencies and polarization vectors interpolated from a Tensor2.
+    The points are identified by their crystal coordinates reduced in the first cell,
+    so the same object can be shared among the q points of a path and among the
+    static, dynamic and perturbative bubbles: the k points of the integration grid
+    are diagonalized only once.
+    The least recently used points are discarded when the memory exceeds max_memory.
+    """
+
+    def __init__(self, tensor2, max_memory = 1.0, decimals = 6):
+        """
+        Parameters
+        ----------
+            tensor2 : ForceTensor.Tensor2()
+                The second order force constant
+            max_memory : float
+                The memory (in Gb) allowed for the cached polarization vectors.
+            decimals : int
+                The crystal coordinates are rounded to this number of decimals
+                to identify the same point.
+        """
+
+        self.tensor2 = tensor2
+        self.structure = tensor2.unitcell_structure
+        self.decimals = decimals
+
+        n_mod = 3 * self.structure.N_atoms
+        bytes_per_point = 16 * n_mod**2 + 8 * n_mod
+        self.max_size = max(1, int(max_memory * 1024.**3 / bytes_per_point))
+
+        m = np.tile(self.structure.get_masses_array(), (3,1)).T.ravel()
+        self.mm_inv_mat = 1 / np.sqrt(np.outer(m, m))
+        self.bg = self.structure.get_reciprocal_vectors() / (2 * np.pi)
+
+        self.phonons = collections.OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get_key(self, k):
+        """
+        Get the crystal coordinates of k reduced in the first cell (as integers).
+        """
+        n = 10**self.decimals
+        x_k = Methods.covariant_coordinates(self.bg, k)
+        return tuple(np.rint(x_k * n).astype(int) % n)
+
+    def get_phonons(self, k):
+        """
+        GET THE PHONONS
+        ===============
+
+        Get the frequencies and the polarization vectors in k,
+        interpolating and diagonalizing the dynamical matrix only if k is not cached.
+        The returned arrays must not be modified.
+
+        Parameters
+        ----------
+            k : ndarray(size = 3)
+                The k point (2pi/Angstrom)
+
+        Results
+        -------
+            w_k : ndarray(size = 3*nat)
+                The frequencies (the acoustic ones are set to 0 in Gamma)
+            pols_k : ndarray(size = (3*nat, 3*nat), dtype = np.complex128)
+                The polarization vectors (columns)
+            is_k_gamma : bool
+                If k is Gamma
+        """
+
+        key = self.get_key(k)
+        if key in self.phonons:
+            self.hits += 1
+            # Move the point at the end (most recently used)
+            value = self.phonons.pop(key)
+            self.phonons[key] = value
+            return value
+
+        self.misses += 1
+
+        phi2_k = self.tensor2.Interpolate(k, asr = False)
+        d2_k = phi2_k * self.mm_inv_mat
+        w2_k, pols_k = np.linalg.eigh(d2_k)
+
+        is_k_gamma = CC.Methods.is_gamma(self.structure.unit_cell, k)
+        if is_k_gamma:
+            w2_k[0:3]=0.0
+        if not (w2_k >= 0.0).all():
+            print('k= ',k, '    (2pi/A)')
+            print('w(k)= ',np.sign(w2_k)*np.sqrt(np.abs(w2_k))*CC.Units.RY_TO_CM,'  (cm-1)')
+            print('Cannot continue with SSCHA negative frequencies')
+            exit()
+        w_k=np.sqrt(w2_k)
+
+        value = (w_k, pols_k, is_k_gamma)
+        self.phonons[key] = value
+        if len(self.phonons) > self.max_size:
+            self.phonons.popitem(last = False)
+
+        return value
+
+
+# ========================== D3 IN MODE COMPONENTS ===================================
+
+class D3Rotation:
+    """
+    ROTATE THE THIRD ORDER IN MODE COMPONENTS
+    =========================================
+
+    Divide the third order force constant in (q, k, -q-k) by the square root
+    of the masses, and rotate it on the polarization vectors, for a fixed q and many k.
+
+    The masses are folded in the polarization vectors, and the three contractions
+    are matrix-matrix multiplications (GEMM) on workspaces allocated once
+    and reused for all the k points, so no temporary of size (3*nat)^3 is created.
+    The result is stored in Fortran order, so it is passed to the bubble
+    kernels without copies.
+    The result has the precision of phi3: complex64 if the Tensor3
+    is in single precision (see ForceTensor.Tensor3.SetPrecision).
+    """
+
+    def __init__(self, m, pols_q):
+        """
+        Parameters
+        ----------
+            m : ndarray(size = 3*nat)
+                The mass of each cartesian component
+            pols_q : ndarray(size = (3*nat, n_modes_q))
+                The polarization vectors (columns) in q.
+                They can be only some of the modes of q.
+        """
+
+        self.inv_sqrt_m = 1 / np.sqrt(m)
+        self.n_mod = len(m)
+        self.n_modes_q = pols_q.shape[1]
+
+        # The masses of the first index are folded in the fixed polarization vectors of q
+        self.pols_q_m_t_double = np.ascontiguousarray((pols_q * self.inv_sqrt_m[:, None]).T)
+
+        self.dtype = None
+        self.pols_q_m_t = None
+        self.work1 = None
+        self.work2 = None
+        self.d3_pols = None
+
+    def allocate(self, dtype):
+        """
+        Allocate the workspaces (and convert the q polarization vectors) for the given complex dtype.
+        """
+
+        n_mod = self.n_mod
+        self.dtype = np.dtype(dtype)
+        self.pols_q_m_t = self.pols_q_m_t_double.astype(self.dtype)
+        self.work1 = np.empty((self.n_modes_q, n_mod * n_mod), dtype = self.dtype)
+        self.work2 = np.empty((self.n_modes_q * n_mod, n_mod), dtype = self.dtype)
+        self.d3_pols = np.empty((self.n_modes_q, n_mod, n_mod), dtype = self.dtype, order = "F")
+
+    def rotate(self, phi3, pols_k, pols_mq_mk):
+        """
+        Rotate the third order force constant interpolated in (q, k, -q-k).
+        The result is stored in a workspace, so it is overwritten by the next call
+        (copy it to keep it).
+
+        Parameters
+        ----------
+            phi3 : ndarray(size = (3*nat, 3*nat, 3*nat))
+                The interpolated third order force constant
+            pols_k, pols_mq_mk : ndarray(size = (3*nat, 3*nat))
+                The polarization vectors (columns) in k and -q-k
+
+        Results
+        -------
+            d3_pols : ndarray(size = (n_modes_q, 3*nat, 3*nat))
+                The third order in mode components
+        """
+
+        n_mod = self.n_mod
+        n_modes_q = self.n_modes_q
+        dtype = np.result_type(phi3.dtype, np.complex64)
+        if dtype != self.dtype:
+            self.allocate(dtype)
+
+        # Fold the masses in the polarization vectors
+        pols_k_m_t = (pols_k * self.inv_sqrt_m[:, None]).T.astype(self.dtype)
+        pols_mq_mk_m = (pols_mq_mk * self.inv_sqrt_m[:, None]).astype(self.dtype)
+
+        # abc, ai -> ibc
+        np.dot(self.pols_q_m_t, np.ascontiguousarray(phi3).reshape((n_mod, n_mod * n_mod)), out = self.work1)
+
+        # ibc, ck -> ibk
+        np.dot(self.work1.reshape((n_modes_q * n_mod, n_mod)), pols_mq_mk_m, out = self.work2)
+
+        # ibk, bj -> ijk
+        d3_pols = self.work1.reshape((n_modes_q, n_mod, n_mod))
+        np.matmul(pols_k_m_t, self.work2.reshape((n_modes_q, n_mod, n_mod)), out = d3_pols)
+
+        self.d3_pols[...] = d3_pols
+        return self.d3_pols
+
+
+def rotate_d3(phi3, m, pols_q, pols_k, pols_mq_mk):
+    """
+    Rotate the third order force constant in (q, k, -q-k) in mode components
+    for a single k point (see D3Rotation to reuse the workspaces for many k).
+
+    Parameters
+    ----------
+        phi3 : ndarray(size = (3*nat, 3*nat, 3*nat))
+            The interpolated third order force constant
+        m : ndarray(size = 3*nat)
+            The mass of each cartesian component
+        pols_q, pols_k, pols_mq_mk : ndarray(size = (3*nat, n_modes))
+            The polarization vectors (columns) in q, k and -q-k.
+            pols_q can contain only some of the modes of q.
+
+    Results
+    -------
+        d3_pols : ndarray(size = (n_modes_q, 3*nat, 3*nat))
+            The third order in mode components
+    """
+
+    return D3Rotation(m, pols_q).rotate(phi3, pols_k, pols_mq_mk)
+
+
+# ========================== CHECKPOINT ==============================================
+
+class PathCheckpoint:
+    """
+    CHECKPOINT OF A PATH
+    ====================
+
+    Store the results of each q point of a path in a binary numpy file
+    (q_#####.npz) inside a directory, as soon as they are computed.
+    A calculation restarted from the same directory skips the q points
+    already done.
+    The parameters of the calculation are saved with each q point, and
+    a restart with different parameters is refused.
+    Only the master writes, so all the processes must call the methods.
+    """
+
+    def __init__(self, directory, parameters = {}):
+        """
+        Parameters
+        ----------
+            directory : string
+                The directory of the checkpoint (created if needed).
+            parameters : dict
+                The parameters that must match to reuse a q point
+                (numbers or arrays).
+        """
+
+        self.directory = directory
+        self.parameters = {}
+        for key in parameters:
+            self.parameters[key] = np.asarray(parameters[key])
+
+        if CC.Settings.am_i_the_master():
+            if not os.path.isdir(directory):
+                os.makedirs(directory)
+        CC.Settings.barrier()
+
+    def get_filename(self, iq):
+        """
+        The file of the q point with index iq in the path
+        """
+        return os.path.join(self.directory, "q_{:05d}.npz".format(iq))
+
+    def save(self, iq, q, results):
+        """
+        Save the results (a tuple of arrays) of the q point iq.
+        The file is written atomically, so an interrupted job never leaves
+        a corrupted q point.
+        """
+
+        if not CC.Settings.am_i_the_master():
+            return
+
+        data = {"q" : np.asarray(q), "n_results" : len(results)}
+        for key in self.parameters:
+            data["par_" + key] = self.parameters[key]
+        for i, x in enumerate(results):
+            data["result_{:d}".format(i)] = np.asarray(x)
+
+        filename = self.get_filename(iq)
+        with open(filename + ".tmp", "wb") as fp:
+            np.savez(fp, **data)
+        os.replace(filename + ".tmp", filename)
+
+    def load(self, iq, q):
+        """
+        Load the results of the q point iq, if already computed.
+
+        Results
+        -------
+            results : tuple
+                The saved arrays, or None if the q point must be computed.
+        """
+
+        error = None
+        results = None
+        filename = self.get_filename(iq)
+        if CC.Settings.am_i_the_master() and os.path.exists(filename):
+            with np.load(filename) as data:
+                if np.max(np.abs(data["q"] - np.asarray(q))) > 1e-8:
+                    error = "Error, the q point {} in {} does not match the path".format(iq, filename)
+                for key in self.parameters:
+                    if not "par_" + key in data.files or \
+                       data["par_" + key].shape != self.parameters[key].shape or \
+                       np.any(data["par_" + key] != self.parameters[key]):
+                        error = "Error, the parameter '{}' in {} does not match the calculation".format(key, filename)
+                if error is None:
+                    results = tuple(data["result_{:d}".format(i)] for i in range(int(data["n_results"])))
+
+        error, results = CC.Settings.broadcast((error, results))
+        if error is not None:
+            raise ValueError(error)
+        return results
+
+
+def get_q_groups(n_q, n_k, n_proc = None):
+    """
+    GET THE NUMBER OF q GROUPS
+    ==========================
+
+    Choose in how many groups the processes are split to work on different
+    q points, each group summing over the k points in parallel.
+    The number of groups minimizes the estimated time
+    ceil(n_q / n_groups) * ceil(n_k / processes_per_group),
+    preferring the smallest number of groups (more parallelism over k) among equals.
+
+    Parameters
+    ----------
+        n_q : int
+            The number of q points
+        n_k : int
+            The number of k points of each q
+        n_proc : int
+            The number of processes (by default all the MPI processes)
+
+    Results
+    -------
+        n_groups : int
+            The number of groups.
+    """
+
+    if n_proc is None:
+        n_proc = 1
+        if CC.Settings.__PARALLEL_TYPE__ == "mpi4py":
+            n_proc = CC.Settings.GetNProc()
+
+    best = 1
+    best_cost = None
+    for n_groups in range(1, max(1, min(n_q, n_proc)) + 1):
+        procs_per_group = n_proc // n_groups
+        cost = (-(-n_q // n_groups)) * (-(-n_k // procs_per_group))
+        if best_cost is None or cost < best_cost:
+            best = n_groups
+            best_cost = cost
+    return best
+
+
+def compute_along_path(q_path, compute_q, checkpoint_dir = None, parameters = {}, n_groups = 1):
+    """
+    COMPUTE ALONG THE PATH
+    ======================
+
+    Evaluate a function on each q point of a path, saving the results
+    with a PathCheckpoint, if required.
+    With MPI the processes can be split in groups working on different q points,
+    while the parallel functions called by compute_q run within each group
+    (see Settings.process_groups).
+
+    Parameters
+    ----------
+        q_path : ndarray(size = (n_q, 3))
+            The q points.
+        compute_q : function
+            It takes a q point and returns a tuple of arrays
+            (with the same shapes for all the q points).
+        checkpoint_dir : string
+            If not None, the results of each q point are saved in this
+            directory, and the q points already saved are not computed again.
+        parameters : dict
+            The parameters of the calculation, stored in the checkpoint.
+        n_groups : int
+            The number of groups of processes working on different q points.
+            If None, it is chosen by get_q_groups with the "n_k" parameter
+            (if any) as the number of k points.
+
+    Results
+    -------
+        results : list
+            The tuple of results for each q point, for all the processes.
+    """
+
+    checkpoint = None
+    if checkpoint_dir is not None:
+        checkpoint = PathCheckpoint(checkpoint_dir, parameters)
+
+    if n_groups is None:
+        n_groups = get_q_groups(len(q_path), int(np.prod(parameters.get("k_grid", 1))))
+    n_groups = max(1, min(n_groups, len(q_path)))
+
+    results = [None] * len(q_path)
+    with CC.Settings.process_groups(n_groups) as (group, n_groups):
+        is_group_master = CC.Settings.am_i_the_master()
+
+        for iq in range(group, len(q_path), n_groups):
+            q = q_path[iq]
+            values = None
+            if checkpoint is not None:
+                values = checkpoint.load(iq, q)
+                if values is not None:
+                    print(" q point {} of {} read from {}".format(iq + 1, len(q_path), checkpoint.get_filename(iq)))
+
+            if values is None:
+                values = tuple(compute_q(np.array(q)))
+                if checkpoint is not None:
+                    checkpoint.save(iq, q, values)
+
+            results[iq] = values
+
+    if n_groups == 1:
+        return results
+
+    # Share the results of the groups (each q point is sent once by its group master)
+    template = results[group]
+    shared = []
+    for j in range(len(template)):
+        x = np.zeros((len(q_path),) + np.shape(template[j]), dtype = np.asarray(template[j]).dtype)
+        if is_group_master:
+            for iq in range(group, len(q_path), n_groups):
+                x[iq] = results[iq][j]
+        shared.append(CC.Settings.all_reduce(x, in_place = True))
+
+    return [tuple(x[iq] for x in shared) for iq in range(len(q_path))]
+
+
 # ========================== STATIC ==================================================
 
-def get_static_bubble(tensor2, tensor3, k_grid, q, T , verbose = False):
+def get_static_bubble(tensor2, tensor3, k_grid, q, T , verbose = False, use_symmetries = False, phonon_cache = None,
+                      schedule = "static"):
     """
     COMPUTE THE STATIC BUBBLE
     =========================
@@ -49,21 +839,40 @@ def get_static_bubble(tensor2, tensor3, k_grid, q, T , verbose = False):
             The grid of k points to be used for the integration
         q : ndarray(size = 3)
             The q point at which compute the bubble.
-        T : float
-            The tempearture of the calculation (default 0 K)
+        T : float or ndarray(size = nT)
+            The tempearture of the calculation (default 0 K).
+            With an array, all the temperatures are computed with one pass
+            over the k points.
         verbose : bool
             If true print debugging and timing info
+        use_symmetries : bool
+            If true, the integration runs only over the k points irreducible
+            under the small group of q (see get_k_points)
+        phonon_cache : PhononGridCache()
+            The phonons in the k points, it can be shared among different calls.
+            If None, a new one is created.
+        schedule : string
+            How the k points are split among the processes (see Settings.GoParallel).
+            "dynamic" balances the load when the cost of the k points is uneven.
             
     Results
     -------
         dynq : ndarray( size = (3*nat, 3*nat), dtype = np.complex128)
             The bubble matrix at the specified q point (only bubble).
+            If T is an array, the size is (nT, 3*nat, 3*nat).
     """
 
     structure = tensor2.unitcell_structure
+    temperatures, is_scalar = _get_temperatures(T)
     
     # Get the integration points 
-    k_points = CC.symmetries.GetQGrid(structure.unit_cell, k_grid)
+    k_points, k_weights, qe_sym = get_k_points(structure, k_grid, q, use_symmetries)
+
+    # The phonons in the integration points
+    if phonon_cache is None:
+        phonon_cache = PhononGridCache(tensor2)
+    elif phonon_cache.tensor2 is not tensor2:
+        raise ValueError("Error, the phonon_cache must be created with the same tensor2")
     
         
     # Get the phi2 in q
@@ -97,67 +906,36 @@ def get_static_bubble(tensor2, tensor3, k_grid, q, T , verbose = False):
     tmp_bubble = np.zeros((n_mod, n_mod),
                           dtype = np.complex128, order = "F")
     
+    # Pre-contract the third order force constant on the fixed q
+    tensor3_q = tensor3.prepare_for_q(q)
+
+    # The mass scaling and the rotation reuse the same workspaces for all the k points
+    d3_rotation = D3Rotation(m, pols_q)
+
     def compute_k(k):
         
         # phi3 in q, k, -q-k
         t1 = time.time()        
-        phi3=tensor3.Interpolate(k,-q-k, asr = False)
+        phi3=tensor3_q.interpolate_k(k)
         t2 = time.time()
  
-        # phi2 in k
-        phi2_k = tensor2.Interpolate(k, asr = False) 
-
-        # phi2 in -q-k
-        phi2_mq_mk = tensor2.Interpolate(-q-k, asr = False)
+        # phonons in k and -q-k
+        w_k, pols_k, is_k_gamma = phonon_cache.get_phonons(k)
+        w_mq_mk, pols_mq_mk, is_mq_mk_gamma = phonon_cache.get_phonons(-q-k)
 
         t3 = time.time()
         
-        # dynamical matrices (divide by the masses)
-        d2_k = phi2_k * mm_inv_mat
-        d2_mq_mk = phi2_mq_mk * mm_inv_mat
-        
-        # Diagonalize the dynamical matrices
-        w2_k, pols_k = np.linalg.eigh(d2_k)
-        w2_mq_mk, pols_mq_mk = np.linalg.eigh(d2_mq_mk)
-                
-        is_k_gamma = CC.Methods.is_gamma(structure.unit_cell, k)
-        is_mq_mk_gamma = CC.Methods.is_gamma(structure.unit_cell, -q-k)
-
-        if is_k_gamma:
-            w2_k[0:3]=0.0
-        if not (w2_k >= 0.0).all():
-            print('k= ',k, '    (2pi/A)')
-            print('w(k)= ',np.sign(w2_k)*np.sqrt(np.abs(w2_k))*CC.Units.RY_TO_CM,'  (cm-1)')
-            print('Cannot continue with SSCHA negative frequencies')
-            exit()
-        w_k=np.sqrt(w2_k)
-
-        if is_mq_mk_gamma:
-            w2_mq_mk[0:3]=0.0
-        if not (w2_mq_mk >= 0.0).all():
-            print('-q-k= ',-q-k, '    (2pi/A)')
-            print('w(-q-k)= ',np.sign(w2_mq_mk)*np.sqrt(np.abs(w2_mq_mk))*CC.Units.RY_TO_CM,'  (cm-1)')
-            print('Cannot continue with SSCHA negative frequencies')
-            exit()
-        w_mq_mk=np.sqrt(w2_mq_mk)
-        
-        # Dividing the phi3 by the sqare root of masses
-        d3 = np.einsum("abc, a, b, c -> abc", phi3, 1/np.sqrt(m), 1/np.sqrt(m), 1/np.sqrt(m))
-
         # d3 in mode components
-        # d3_pols = np.einsum("abc, ai, bj, ck -> ijk", d3, pols_mq, pols_k, pols_q_mk)
-        d3_pols = np.einsum("abc, ai -> ibc", d3, pols_q)
-        d3_pols = np.einsum("ibc, bj -> ijc", d3_pols, pols_k)
-        d3_pols = np.einsum("ijc, ck -> ijk", d3_pols, pols_mq_mk)
+        d3_pols = d3_rotation.rotate(phi3, pols_k, pols_mq_mk)
         
         t4 = time.time()
         
         # Fortran duty ====
 
-        tmp_bubble = thirdorder.third_order_bubble.compute_static_bubble(T,np.array([w_q,w_k,w_mq_mk]).T,
+        tmp_bubble = np.array([thirdorder.third_order_bubble.compute_static_bubble(T_i,np.array([w_q,w_k,w_mq_mk]).T,
                                                                        np.array([is_q_gamma,is_k_gamma,is_mq_mk_gamma]),
                                                                        d3_pols,
-                                                                       n_mod=n_mod)        
+                                                                       n_mod=n_mod) for T_i in temperatures])
         
         t5 = time.time()
         
@@ -171,19 +949,28 @@ def get_static_bubble(tensor2, tensor3, k_grid, q, T , verbose = False):
     
     
     CC.Settings.SetupParallel()
-    tmp_bubble = CC.Settings.GoParallel(compute_k, k_points, reduce_op = "+")
+    tmp_bubble = CC.Settings.GoParallel(lambda x: compute_k(x[0]) * x[1], list(zip(k_points, k_weights)), reduce_op = "+",
+                                        schedule = schedule)
     # divide by the N_k factor
-    tmp_bubble /= len(k_points) 
+    tmp_bubble /= np.sum(k_weights) 
     # bubble in cartesian  
     #d_bubble = np.einsum("ab, ia, jb -> ij", tmp_bubble, pols_q, np.conj(pols_q))
     
-    d_bubble = np.einsum("ij, ai -> aj", tmp_bubble, pols_q)
-    d_bubble = np.einsum("aj, bj -> ab", d_bubble, np.conj(pols_q))
+    d_bubble = np.einsum("tij, ai -> taj", tmp_bubble, pols_q)
+    d_bubble = np.einsum("taj, bj -> tab", d_bubble, np.conj(pols_q))
+
+    # Recover the contribution of the k points excluded by symmetries
+    if qe_sym is not None:
+        for iT in range(len(temperatures)):
+            d_bubble[iT] = symmetrize_bubble(qe_sym, d_bubble[iT], q)
 
     # add to the SSCHA dynamical matrix in q
     d2_final_q = d2_q + d_bubble  
     # and mutiply by the masses ( -> FC)
     phi2_final_q = d2_final_q * mm_mat
+
+    if is_scalar:
+        phi2_final_q = phi2_final_q[0]
  
     return phi2_final_q, w_q
         
@@ -259,7 +1046,10 @@ def get_static_correction_along_path(dyn,
                                      print_dyn = False,
                                      name_dyn = "sscha_plus_odd_dyn",
                                      d3_scale_factor = None,
-                                     tensor2 = None):
+                                     tensor2 = None,
+                                     use_symmetries = False,
+                                     phonon_cache = None,
+                                     schedule = "static"):
     """
     Get the dyn + static bubble correction along a given path and prints the SSCHA and the 
     corrected frequencies in the file filename_st (path length in 2pi/Angstrom, SSCHA frequencies (cm-1),
@@ -279,8 +1069,10 @@ def get_static_correction_along_path(dyn,
         Optional
         --------
         
-        T : float
-            The temperature 
+        T : float or list of floats
+            The temperature. With a list, all the temperatures are computed
+            with one pass over the k points, and the name of each output file
+            gets the suffix _T[temperature] after the prefix.
             (default: 0 K)
         q_path : list of triplets
                  Path of the q-points of the Brillouin Zone, in 2pi/Anstrom units,
@@ -319,6 +1111,19 @@ def get_static_correction_along_path(dyn,
                   If present, this 2nd order FC overwrites the one 
                   obtained from dyn.
                   (default: None)  
+        use_symmetries : logical
+                  If True, for each q point the integration runs only over the 
+                  k points irreducible under the small group of q.
+                  (default: False)
+        phonon_cache : PhononGridCache()
+                  The phonons in the k points, shared among the q points of the path.
+                  It can be shared also among different calculations with the same tensor2.
+                  If None, a new one is created.
+                  (default: None)
+        schedule : string
+                  How the k points are split among the processes, "static" or "dynamic"
+                  (see Settings.GoParallel).
+                  (default: "static")
         
     """
      
@@ -327,7 +1132,8 @@ def get_static_correction_along_path(dyn,
     print("      Bubble static correction       " ) 
     print(" ====================================" )
     print(" ") 
-    print(" T= {:>5.1f} K".format(T))
+    temperatures, is_scalar = _get_temperatures(T)
+    print(" T= " + ", ".join(["{:>5.1f}".format(T_i) for T_i in temperatures]) + " K")
     print(" k grid= {} x {} x {} ".format(*tuple(k_grid))) 
     print(" ")    
         
@@ -375,7 +1181,7 @@ def get_static_correction_along_path(dyn,
     # Allocate frequencies array
     nat=dyn.structure.N_atoms
     n_mod=3 * nat
-    frequencies = np.zeros((len(q_path), n_mod), dtype = np.float64 ) # SSCHA+odd freq
+    frequencies = np.zeros((len(temperatures), len(q_path), n_mod), dtype = np.float64 ) # SSCHA+odd freq
     v2_wq = np.zeros( (len(q_path), n_mod), dtype = np.float64 ) # pure SSCHA freq
         
     # =============== core calculation ===========================================
@@ -383,32 +1189,44 @@ def get_static_correction_along_path(dyn,
         print(" ")
         print(" dyn+odd dynamical matrices printed in "+name_dyn+"#q")
         print(" ")        
+    # The phonons in k are shared among the q points
+    if phonon_cache is None:
+        phonon_cache = PhononGridCache(tensor2)
     for iq, q in enumerate(q_path):
         dynq, v2_wq[iq,:] = get_static_bubble(tensor2=tensor2, tensor3=tensor3, 
                                               k_grid=k_grid, q=np.array(q), 
-                                         T=T, verbose = False)
+                                         T=temperatures, verbose = False, use_symmetries = use_symmetries,
+                                         phonon_cache = phonon_cache, schedule = schedule)
 
-        w2, pol = np.linalg.eigh(dynq / mm_mat)
-        frequencies[iq,:] = np.sign(w2)*np.sqrt(np.abs(w2))
+        for iT, T_i in enumerate(temperatures):
+            w2, pol = np.linalg.eigh(dynq[iT] / mm_mat)
+            frequencies[iT,iq,:] = np.sign(w2)*np.sqrt(np.abs(w2))
     
-        if print_dyn:            
-            Methods.save_qe(dyn,q,dynq,frequencies[iq,:],pol,fname=name_dyn+str(iq+1))
+            if print_dyn:            
+                Methods.save_qe(dyn,q,dynq[iT],frequencies[iT,iq,:],pol,
+                                fname=name_dyn+_get_temperature_name(T_i, is_scalar)+str(iq+1))
     # ============================================================================    
 
     # === print result ==================================
     frequencies *= CC.Units.RY_TO_CM
     v2_wq *= CC.Units.RY_TO_CM
-    result=np.hstack((x_length_exp.T,v2_wq,frequencies))     
     fmt_txt='%10.6f\t\t'+n_mod*'%11.7f\t'+'\t'+n_mod*'%11.7f\t'
-      
-    print(" ")
-    print(" Results printed in "+filename_st)
-    print(" ")
     head=("------------------------------------------------------------------------"
         "\nlen (2pi/Angstrom), sscha freq (cm-1), sscha + static bubble freq (cm-1)"  
         "\n------------------------------------------------------------------------")
-    
-    np.savetxt(filename_st,result,fmt=fmt_txt,header=head) 
+
+    for iT, T_i in enumerate(temperatures):
+        result=np.hstack((x_length_exp.T,v2_wq,frequencies[iT]))     
+
+        # The temperature goes before the extension
+        root, ext = os.path.splitext(filename_st)
+        filename_new = root + _get_temperature_name(T_i, is_scalar) + ext
+
+        print(" ")
+        print(" Results printed in "+filename_new)
+        print(" ")
+
+        np.savetxt(filename_new,result,fmt=fmt_txt,header=head) 
     # ==================================================================================   
  
 
@@ -429,7 +1247,8 @@ def get_full_dynamic_bubble(tensor2, tensor3, k_grid, q,
                             T,
                             static_limit, 
                             notransl, diag_approx,
-                            verbose = False ):
+                            verbose = False, use_symmetries = False,
+                            phonon_cache = None, schedule = "static" ):
     
 
     """
@@ -450,23 +1269,42 @@ def get_full_dynamic_bubble(tensor2, tensor3, k_grid, q,
             The grid of k points to be used for the integration
         q : ndarray(size = 3)
             The q point at which compute the bubble.
-        T : float
-            The tempearture of the calculation (default 0 K)
+        T : float or ndarray(size = nT)
+            The tempearture of the calculation (default 0 K).
+            With an array, all the temperatures are computed with one pass
+            over the k points.
         asr : bool
             If true, impose the acoustic sum rule during the Fourier transform
         verbose : bool
             If true print debugging and timing info
+        use_symmetries : bool
+            If true, the integration runs only over the k points irreducible
+            under the small group of q (see get_k_points)
+        phonon_cache : PhononGridCache()
+            The phonons in the k points, it can be shared among different calls.
+            If None, a new one is created.
+        schedule : string
+            How the k points are split among the processes (see Settings.GoParallel).
+            "dynamic" balances the load when the cost of the k points is uneven.
             
     Results
     -------
         dynq : ndarray( size = (3*nat, 3*nat), dtype = np.complex128)
             The bubble matrix at the specified q point (only bubble).
+            If T is an array, there is an extra first axis for the temperatures.
     """
  
     structure = tensor2.unitcell_structure
+    temperatures, is_scalar = _get_temperatures(T)
     
     # Get the integration points 
-    k_points = CC.symmetries.GetQGrid(structure.unit_cell, k_grid)
+    k_points, k_weights, qe_sym = get_k_points(structure, k_grid, q, use_symmetries)
+
+    # The phonons in the integration points
+    if phonon_cache is None:
+        phonon_cache = PhononGridCache(tensor2)
+    elif phonon_cache.tensor2 is not tensor2:
+        raise ValueError("Error, the phonon_cache must be created with the same tensor2")
     
         
     # Get the phi2 in q
@@ -502,65 +1340,34 @@ def get_full_dynamic_bubble(tensor2, tensor3, k_grid, q,
                           dtype = np.complex128, order = "F")
 
     
+    # Pre-contract the third order force constant on the fixed q
+    tensor3_q = tensor3.prepare_for_q(q)
+
+    # The mass scaling and the rotation reuse the same workspaces for all the k points
+    d3_rotation = D3Rotation(m, pols_q)
+
     def compute_k(k):
         # phi3 in q, k, -q - k
         t1 = time.time()        
-        phi3=tensor3.Interpolate(k,-q-k, asr = False)
+        phi3=tensor3_q.interpolate_k(k)
         t2 = time.time()
-        # phi2 in k
-        phi2_k = tensor2.Interpolate(k, asr = False) 
-
-        # phi2 in -q-k
-        phi2_mq_mk = tensor2.Interpolate(-q -k, asr = False)
+        # phonons in k and -q-k
+        w_k, pols_k, is_k_gamma = phonon_cache.get_phonons(k)
+        w_mq_mk, pols_mq_mk, is_mq_mk_gamma = phonon_cache.get_phonons(-q-k)
 
         t3 = time.time()
         
-        # dynamical matrices (divide by the masses)
-        d2_k = phi2_k * mm_inv_mat
-        d2_mq_mk = phi2_mq_mk * mm_inv_mat
-        
-        # Diagonalize the dynamical matrices
-        w2_k, pols_k = np.linalg.eigh(d2_k)
-        w2_mq_mk, pols_mq_mk = np.linalg.eigh(d2_mq_mk)
-        
-        
-        is_k_gamma = CC.Methods.is_gamma(structure.unit_cell, k)
-        is_mq_mk_gamma = CC.Methods.is_gamma(structure.unit_cell, -q-k)
-        
-        if is_k_gamma:
-            w2_k[0:3]=0.0
-        if not (w2_k >= 0.0).all():
-            print('k= ',k, '    (2pi/A)')
-            print('w(k)= ',np.sign(w2_k)*np.sqrt(np.abs(w2_k))*CC.Units.RY_TO_CM,'  (cm-1)')
-            print('Cannot continue with SSCHA negative frequencies')
-            exit()
-        w_k=np.sqrt(w2_k)
-
-        if is_mq_mk_gamma:
-            w2_mq_mk[0:3]=0.0
-        if not (w2_mq_mk >= 0.0).all():
-            print('-q-k= ',-q-k, '    (2pi/A)')
-            print('w(-q-k)= ',np.sign(w2_mq_mk)*np.sqrt(np.abs(w2_mq_mk))*CC.Units.RY_TO_CM,'  (cm-1)')
-            print('Cannot continue with SSCHA negative frequencies')
-            exit()
-        w_mq_mk=np.sqrt(w2_mq_mk)
-        
-        # Dividing the phi3 by the sqare root of masses
-        d3 = np.einsum("abc, a, b, c -> abc", phi3, 1/np.sqrt(m), 1/np.sqrt(m), 1/np.sqrt(m))
-
         # d3 in mode components
-        #d3_pols = np.einsum("abc, ai, bj, ck -> ijk", d3, pols_mq, pols_k, pols_q_mk)
-        d3_pols = np.einsum("abc, ai -> ibc", d3, pols_q)
-        d3_pols = np.einsum("abc, bi -> aic", d3_pols, pols_k)
-        d3_pols = np.einsum("abc, ci -> abi", d3_pols, pols_mq_mk)
+        d3_pols = d3_rotation.rotate(phi3, pols_k, pols_mq_mk)
                 
         t4 = time.time()
         
         # Fortran duty ====
-        tmp_bubble = thirdorder.third_order_bubble.compute_dynamic_bubble(energies,smear,static_limit,T,
+        tmp_bubble = np.array([thirdorder.third_order_bubble.compute_dynamic_bubble(energies,smear,static_limit,T_i,
                                                             np.array([w_q,w_k,w_mq_mk]).T,
                                                             np.array([is_q_gamma,is_k_gamma,is_mq_mk_gamma]),
-                                                            d3_pols,diag_approx,ne,nsm,n_mod=3*structure.N_atoms)        
+                                                            d3_pols,diag_approx,ne,nsm,n_mod=3*structure.N_atoms)
+                               for T_i in temperatures])
         
         t5 = time.time()
         
@@ -574,11 +1381,17 @@ def get_full_dynamic_bubble(tensor2, tensor3, k_grid, q,
     
     
     CC.Settings.SetupParallel()
-    d_bubble_mod = CC.Settings.GoParallel(compute_k, k_points, reduce_op = "+")
+    d_bubble_mod = CC.Settings.GoParallel(lambda x: compute_k(x[0]) * x[1], list(zip(k_points, k_weights)), reduce_op = "+",
+                                          schedule = schedule)
     # divide by the N_k factor
-    d_bubble_mod /= len(k_points) # (ne,nsmear,3nat,3nat)
+    d_bubble_mod /= np.sum(k_weights) # (nT,ne,nsmear,3nat,3nat)
     # the self-energy bubble in cartesian coord, divided by the sqare root of masses
-    d_bubble_cart = np.einsum("pqab, ia, jb -> pqij", d_bubble_mod, pols_q, np.conj(pols_q))
+    d_bubble_cart = np.einsum("tpqab, ia, jb -> tpqij", d_bubble_mod, pols_q, np.conj(pols_q))
+
+    # Recover the contribution of the k points excluded by symmetries
+    if qe_sym is not None:
+        for iT, ie, ism in itertools.product(range(len(temperatures)), range(ne), range(nsm)):
+            d_bubble_cart[iT, ie, ism, :, :] = symmetrize_bubble(qe_sym, d_bubble_cart[iT, ie, ism, :, :], q)
     # get the spectral function
     no_gamma_pick=bool(is_q_gamma*notransl)
     #
@@ -588,13 +1401,17 @@ def get_full_dynamic_bubble(tensor2, tensor3, k_grid, q,
         print(" ")
     #   
     # 
-    spectral_func=thirdorder.third_order_bubble.compute_spectralf(smear_id,
+    spectral_func=np.array([thirdorder.third_order_bubble.compute_spectralf(smear_id,
                                                                   energies,
                                                                   d2_q,
-                                                                  d_bubble_cart,
+                                                                  d_bubble_cart[iT],
                                                                   no_gamma_pick,
                                                               structure.get_masses_array(),
-                                                              structure.N_atoms,ne,nsm)  
+                                                              structure.N_atoms,ne,nsm)
+                            for iT in range(len(temperatures))])
+
+    if is_scalar:
+        spectral_func = spectral_func[0]
     
     return spectral_func
 
@@ -615,7 +1432,13 @@ def get_full_dynamic_correction_along_path(dyn,
                                            diag_approx = False, 
                                            filename_sp='full_spectral_func',
                                            d3_scale_factor=None,
-                                           tensor2 = None):
+                                           tensor2 = None,
+                                           use_symmetries = False,
+                                           phonon_cache = None,
+                                           schedule = "static",
+                                           checkpoint_dir = None,
+                                           q_groups = None,
+                                           adaptive_ne = None):
  
     """
     Get the spectral function for a list of energies, and several q along a given path.
@@ -647,8 +1470,10 @@ def get_full_dynamic_correction_along_path(dyn,
         nsm : integer
               Number of smearings to consider         
               (default = 1)
-        T : float
-            The temperature 
+        T : float or list of floats
+            The temperature. With a list, all the temperatures are computed
+            with one pass over the k points, and the name of each output file
+            gets the suffix _T[temperature] after the prefix.
             (default: 0 K)
         q_path : list of triplets
                  Path of the q-points of the Brillouin Zone, in 2pi/Anstrom units,
@@ -694,6 +1519,36 @@ def get_full_dynamic_correction_along_path(dyn,
                   If present, this 2nd order FC overwrites the one 
                   obtained from dyn.
                   (default: None)  
+        use_symmetries : logical
+                  If True, for each q point the integration runs only over the 
+                  k points irreducible under the small group of q.
+                  (default: False)
+        phonon_cache : PhononGridCache()
+                  The phonons in the k points, shared among the q points of the path.
+                  It can be shared also among different calculations with the same tensor2.
+                  If None, a new one is created.
+                  (default: None)
+        schedule : string
+                  How the k points are split among the processes, "static" or "dynamic"
+                  (see Settings.GoParallel).
+                  (default: "static")
+        checkpoint_dir : string
+                  If present, the results of each q point are saved in this directory
+                  as soon as they are computed. Running again the calculation with the
+                  same directory restarts it, skipping the q points already done.
+                  (default: None)
+        q_groups : int
+                  With MPI, the processes are split in q_groups groups working on
+                  different q points, each one parallel over the k points.
+                  If None, it is chosen from the number of q points, k points and processes
+                  (see get_q_groups). A sharded tensor3 always uses one group.
+                  (default: None)
+        adaptive_ne : int
+                  If present, the energies between e0 and e1 are a non uniform grid of
+                  adaptive_ne points for each q point, refined around the peaks of the 
+                  spectral function and the frequencies of q (see get_adaptive_energies).
+                  The energies of each q point are written in the output files (de is not used).
+                  (default: None)
         
     """
  
@@ -702,7 +1557,8 @@ def get_full_dynamic_correction_along_path(dyn,
     print("        Bubble full dynamic correction      " ) 
     print(" ===========================================" )
     print(" ") 
-    print(" T= {:>5.1f} K".format(T))
+    temperatures, is_scalar = _get_temperatures(T)
+    print(" T= " + ", ".join(["{:>5.1f}".format(T_i) for T_i in temperatures]) + " K")
     print(" k grid= {} x {} x {} ".format(*tuple(k_grid))) 
     if static_limit :
         print(" ")
@@ -769,13 +1625,42 @@ def get_full_dynamic_correction_along_path(dyn,
     # ==========================================================================================     
     #      
     #
-    spectralf = np.zeros( (len(q_path), ne, nsm), dtype = np.float64 )
+    if adaptive_ne is not None:
+        ne=adaptive_ne
+    spectralf = np.zeros( (len(temperatures), len(q_path), ne, nsm), dtype = np.float64 )
+    energies_path = np.zeros( (len(q_path), ne), dtype = np.float64 )
     #
-    for iq, q in enumerate(q_path):
-        spectralf[iq, :, :] = get_full_dynamic_bubble(tensor2, tensor3, k_grid, np.array(q),
-                                                      smear_id, smear, energies, T,   
-                                                      static_limit, notransl , 
-                                                      diag_approx, verbose=False )    
+    # The phonons in k are shared among the q points
+    if phonon_cache is None:
+        phonon_cache = PhononGridCache(tensor2)
+    def compute_energies(q, energies):
+        return (get_full_dynamic_bubble(tensor2, tensor3, k_grid, q,
+                                        smear_id, smear, energies, T,   
+                                        static_limit, notransl , 
+                                        diag_approx, verbose=False,
+                                        use_symmetries = use_symmetries,
+                                        phonon_cache = phonon_cache, schedule = schedule),)
+    def compute_q(q):
+        if adaptive_ne is None:
+            return compute_energies(q, energies)
+        new_energies, results = get_adaptive_energies(lambda x: compute_energies(q, x),
+                                                      e0/CC.Units.RY_TO_CM, e1/CC.Units.RY_TO_CM, adaptive_ne,
+                                                      phonon_cache.get_phonons(q)[0], axis = 0 if is_scalar else 1)
+        return results + (new_energies,)
+
+    parameters = {"k_grid" : k_grid, "T" : T, "energies" : energies, "smear" : smear, "smear_id" : smear_id,
+                  "static_limit" : static_limit, "notransl" : notransl, "diag_approx" : diag_approx,
+                  "d3_scale_factor" : 1.0 if d3_scale_factor is None else d3_scale_factor}
+    if adaptive_ne is not None:
+        parameters["adaptive_ne"] = adaptive_ne
+
+    # A sharded tensor3 needs all the processes for each q point
+    if tensor3.shard_range is not None:
+        q_groups = 1
+    results = compute_along_path(q_path, compute_q, checkpoint_dir, parameters, q_groups)
+    for iq in range(len(q_path)):
+        spectralf[:, iq, :, :] = results[iq][0]
+        energies_path[iq, :] = energies if adaptive_ne is None else results[iq][1]
     
     # convert from 1/Ry to 1/cm-1
     spectralf /= CC.Units.RY_TO_CM
@@ -783,27 +1668,29 @@ def get_full_dynamic_correction_along_path(dyn,
     smear *= CC.Units.RY_TO_CM 
     smear_id *= CC.Units.RY_TO_CM 
     energies *= CC.Units.RY_TO_CM 
+    energies_path *= CC.Units.RY_TO_CM 
     
 
     # ==================================================================================   
  
     # print the result
-    for  ism in range(nsm):
+    for iT, ism in itertools.product(range(len(temperatures)), range(nsm)):
         #
         name="{:5.2f}".format(smear_id[ism]).strip()+"_"+"{:6.1f}".format(smear[ism]).strip()
         #
-        filename_new=filename_sp+'_'+name+'.dat'
+        filename_new=filename_sp+_get_temperature_name(temperatures[iT], is_scalar)+'_'+name+'.dat'
         with open(filename_new,'w') as f:
             f.write(" # ------------------------------------------------------------- \n")
             f.write(" # len (2pi/Angstrom), energy (cm-1), spectral function (1/cm-1) \n")
             f.write(" # ------------------------------------------------------------- \n")
             for iq,leng in enumerate(x_length):
-             for ie, ene in enumerate(energies):
-                 f.write("{:>10.6f}\t{:>11.7f}\t{:>11.7f}\n".format(leng,ene,spectralf[iq,ie,ism]))
+             for ie, ene in enumerate(energies_path[iq]):
+                 f.write("{:>10.6f}\t{:>11.7f}\t{:>11.7f}\n".format(leng,ene,spectralf[iT,iq,ie,ism]))
              f.write("\n")
  
+    T_name = "" if is_scalar else "_T[T]"
     print(" ")
-    print(" Results printed in "+filename_sp+'_[id_smear]_[smear].dat')
+    print(" Results printed in "+filename_sp+T_name+'_[id_smear]_[smear].dat')
     print(" ")      
  
  
@@ -821,13 +1708,43 @@ def get_diag_dynamic_bubble(tensor2,
                             smear, 
                             energies,
                             T,
-                            verbose = False ):
-    
+                            verbose = False,
+                            use_symmetries = False,
+                            phonon_cache = None,
+                            schedule = "static",
+                            modes = None):
+    """
+    COMPUTE THE DIAGONAL DYNAMIC BUBBLE
+    ===================================
+
+    The diagonal (in the modes of q) of the dynamic bubble, and the spectral function.
+    With modes, only the selected modes of q are computed: the third order
+    force constants are contracted only with their polarization vectors,
+    so memory and time are proportional to the number of selected modes.
+
+    Results
+    -------
+        spectralf : ndarray(size = (ne, n_sel, nsmear))
+            The spectral function of the selected modes
+        z, z_pert : ndarray(size = (ne, nsmear, n_sel), dtype = np.complex128)
+            The Z function [PRB 97 214101 (A20)] and its perturbative limit
+        w_q : ndarray(size = n_sel)
+            The frequencies of the selected modes of q
+        
+        With an array of temperatures T, spectralf, z and z_pert have an extra first axis.
+    """
     
     structure = tensor2.unitcell_structure
+    temperatures, is_scalar = _get_temperatures(T)
     
     # Get the integration points 
-    k_points = CC.symmetries.GetQGrid(structure.unit_cell, k_grid)
+    k_points, k_weights, qe_sym = get_k_points(structure, k_grid, q, use_symmetries)
+
+    # The phonons in the integration points
+    if phonon_cache is None:
+        phonon_cache = PhononGridCache(tensor2)
+    elif phonon_cache.tensor2 is not tensor2:
+        raise ValueError("Error, the phonon_cache must be created with the same tensor2")
     
         
     # Get the phi2 in q
@@ -855,67 +1772,38 @@ def get_diag_dynamic_bubble(tensor2,
         print('Cannot continue with SSCHA negative frequencies')
         exit()
     w_q=np.sqrt(w2_q)   
+
+    # Only the selected modes of q are contracted and computed
+    modes = get_modes(modes, w_q, qe_sym is not None)
+    pols_q_sel = pols_q[:, modes]
     
     # Allocate the memory for the bubble
     ne=energies.shape[0]
     nsm=smear.shape[0]
     nat=structure.N_atoms
     n_mod=3*nat
-    tmp_bubble = np.zeros((ne,nsm,n_mod),
-                          dtype = np.complex128, order = "F")
+    n_sel=len(modes)
 
     
+    # Pre-contract the third order force constant on the fixed q
+    tensor3_q = tensor3.prepare_for_q(q)
+
+    # The mass scaling and the rotation reuse the same workspaces for all the k points
+    d3_rotation = D3Rotation(m, pols_q_sel)
+
     def compute_k(k):
         # phi3 in q, k, -q - k
         t1 = time.time()        
-        phi3=tensor3.Interpolate(k,-q-k, asr = False)
+        phi3=tensor3_q.interpolate_k(k)
         t2 = time.time()
-        # phi2 in k
-        phi2_k = tensor2.Interpolate(k, asr = False) 
-
-        # phi2 in -q-k
-        phi2_mq_mk = tensor2.Interpolate(-q -k, asr = False)
+        # phonons in k and -q-k
+        w_k, pols_k, is_k_gamma = phonon_cache.get_phonons(k)
+        w_mq_mk, pols_mq_mk, is_mq_mk_gamma = phonon_cache.get_phonons(-q-k)
 
         t3 = time.time()
         
-        # dynamical matrices (divide by the masses)
-        d2_k = phi2_k * mm_inv_mat
-        d2_mq_mk = phi2_mq_mk * mm_inv_mat
-        
-        # Diagonalize the dynamical matrices
-        w2_k, pols_k = np.linalg.eigh(d2_k)
-        w2_mq_mk, pols_mq_mk = np.linalg.eigh(d2_mq_mk)
-        
-        
-        is_k_gamma = CC.Methods.is_gamma(structure.unit_cell, k)
-        is_mq_mk_gamma = CC.Methods.is_gamma(structure.unit_cell, -q-k)
-        
-        if is_k_gamma:
-            w2_k[0:3]=0.0
-        if not (w2_k >= 0.0).all():
-            print('k= ',k, '    (2pi/A)')
-            print('w(k)= ',np.sign(w2_k)*np.sqrt(np.abs(w2_k))*CC.Units.RY_TO_CM,'  (cm-1)')
-            print('Cannot continue with SSCHA negative frequencies')
-            exit()
-        w_k=np.sqrt(w2_k)
-
-        if is_mq_mk_gamma:
-            w2_mq_mk[0:3]=0.0
-        if not (w2_mq_mk >= 0.0).all():
-            print('-q-k= ',-q-k, '    (2pi/A)')
-            print('w(-q-k)= ',np.sign(w2_mq_mk)*np.sqrt(np.abs(w2_mq_mk))*CC.Units.RY_TO_CM,'  (cm-1)')
-            print('Cannot continue with SSCHA negative frequencies')
-            exit()
-        w_mq_mk=np.sqrt(w2_mq_mk)
-        
-        # Dividing the phi3 by the sqare root of masses
-        d3 = np.einsum("abc, a, b, c -> abc", phi3, 1/np.sqrt(m), 1/np.sqrt(m), 1/np.sqrt(m))
-
         # d3 in mode components
-        #d3_pols = np.einsum("abc, ai, bj, ck -> ijk", d3, pols_mq, pols_k, pols_q_mk)
-        d3_pols = np.einsum("abc, ai -> ibc", d3, pols_q)
-        d3_pols = np.einsum("abc, bi -> aic", d3_pols, pols_k)
-        d3_pols = np.einsum("abc, ci -> abi", d3_pols, pols_mq_mk)
+        d3_pols = d3_rotation.rotate(phi3, pols_k, pols_mq_mk)
         
         t4 = time.time()
         
@@ -923,10 +1811,11 @@ def get_diag_dynamic_bubble(tensor2,
         # Fortran duty ====
         
         #
-        tmp_bubble  = thirdorder.third_order_bubble.compute_diag_dynamic_bubble(energies,smear,T,
+        tmp_bubble  = np.array([thirdorder.third_order_bubble.compute_diag_dynamic_bubble(energies,smear,T_i,
                                                             np.array([w_q,w_k,w_mq_mk]).T,
                                                             np.array([is_q_gamma,is_k_gamma,is_mq_mk_gamma]),
-                                                            d3_pols,ne,nsm,n_mod=n_mod)                
+                                                            d3_pols,ne,nsm,n_mod=n_mod)
+                                for T_i in temperatures])
 
         t5 = time.time()
         
@@ -940,16 +1829,29 @@ def get_diag_dynamic_bubble(tensor2,
     
     CC.Settings.SetupParallel()
 
-    d_bubble_mod =CC.Settings.GoParallel(compute_k, k_points, reduce_op = "+")
+    d_bubble_mod =CC.Settings.GoParallel(lambda x: compute_k(x[0]) * x[1], list(zip(k_points, k_weights)), reduce_op = "+",
+                                         schedule = schedule)
 
     # divide by the N_k factor
-    d_bubble_mod /= len(k_points) # (ne,nsmear,n_mod)
+    d_bubble_mod /= np.sum(k_weights) # (nT,ne,nsmear,n_sel)
+
+    # Recover the contribution of the k points excluded by symmetries
+    if qe_sym is not None:
+        d_bubble_mod = average_degenerate_modes(d_bubble_mod, w_q, axis = 3, modes = modes)
+
+    # From now on only the selected modes
+    w_q = w_q[modes]
+    w2_q = w2_q[modes]
     #
     #
-    spectralf=thirdorder.third_order_bubble.compute_spectralf_diag(smear_id,energies,w_q,
-                                                                   d_bubble_mod,
-                                                                   nat,ne,nsm)    
-                                                                    # (ne, n_mod, nsmear)
+    spectralf=np.array([thirdorder.third_order_bubble.compute_spectralf_diag(smear_id,energies,w_q,
+                                                                   d_bubble_mod[iT],
+                                                                   n_sel,ne,nsm)
+                        for iT in range(len(temperatures))])
+                                                                    # (nT, ne, n_sel, nsmear)
+    if is_scalar:
+        spectralf = spectralf[0]
+        d_bubble_mod = d_bubble_mod[0]
 
     w2_q_ext=w2_q[None,None,...]
     z=np.sqrt(d_bubble_mod + w2_q_ext) # (A20) PHYSICAL REVIEW B 97, 214101 (2018)
@@ -979,7 +1881,13 @@ def get_diag_dynamic_correction_along_path(dyn, tensor3,
                                            numiter=20,
                                            eps=1.0e-7,                                           
                                            d3_scale_factor=None,
-                                           tensor2 = None):                                           
+                                           tensor2 = None,
+                                           use_symmetries = False,
+                                           phonon_cache = None,
+                                           schedule = "static",
+                                           checkpoint_dir = None,
+                                           q_groups = None,
+                                           adaptive_ne = None):                                           
   
 
     """
@@ -1018,8 +1926,10 @@ def get_diag_dynamic_correction_along_path(dyn, tensor3,
         nsm : integer
               Number of smearings to consider         
               (default = 1)
-        T : float
-            The temperature 
+        T : float or list of floats
+            The temperature. With a list, all the temperatures are computed
+            with one pass over the k points, and the name of each output file
+            gets the suffix _T[temperature] after the prefix.
             (default: 0 K)
         q_path : list of triplets
                  Path of the q-points of the Brillouin Zone, in 2pi/Anstrom units,
@@ -1082,6 +1992,37 @@ def get_diag_dynamic_correction_along_path(dyn, tensor3,
                   If present, this 2nd order FC overwrites the one 
                   obtained from dyn.
                   (default: None)  
+        use_symmetries : logical
+                  If True, for each q point the integration runs only over the 
+                  k points irreducible under the small group of q.
+                  (default: False)
+        phonon_cache : PhononGridCache()
+                  The phonons in the k points, shared among the q points of the path.
+                  It can be shared also among different calculations with the same tensor2.
+                  If None, a new one is created.
+                  (default: None)
+        schedule : string
+                  How the k points are split among the processes, "static" or "dynamic"
+                  (see Settings.GoParallel).
+                  (default: "static")
+        checkpoint_dir : string
+                  If present, the results of each q point are saved in this directory
+                  as soon as they are computed. Running again the calculation with the
+                  same directory restarts it, skipping the q points already done.
+                  (default: None)
+        q_groups : int
+                  With MPI, the processes are split in q_groups groups working on
+                  different q points, each one parallel over the k points.
+                  If None, it is chosen from the number of q points, k points and processes
+                  (see get_q_groups). A sharded tensor3 always uses one group.
+                  (default: None)
+        adaptive_ne : int
+                  If present, the spectral function is computed on a non uniform grid of
+                  adaptive_ne energies between e0 and e1 for each q point, refined around
+                  its peaks and the frequencies of q (see get_adaptive_energies).
+                  The Z function is interpolated on the uniform grid for the 
+                  frequency shifts and linewidths.
+                  (default: None)
         
     """
  
@@ -1092,7 +2033,8 @@ def get_diag_dynamic_correction_along_path(dyn, tensor3,
     print("     Bubble diagonal dynamic correction     " ) 
     print(" ===========================================" )
     print(" ") 
-    print(" T= {:>5.1f} K".format(T))
+    temperatures, is_scalar = _get_temperatures(T)
+    print(" T= " + ", ".join(["{:>5.1f}".format(T_i) for T_i in temperatures]) + " K")
     print(" k grid= {} x {} x {} ".format(*tuple(k_grid))) 
  
  
@@ -1152,23 +2094,56 @@ def get_diag_dynamic_correction_along_path(dyn, tensor3,
     #
     n_mod=3*dyn.structure.N_atoms
     #
-    spectralf   = np.zeros( (len(q_path), ne, n_mod, nsm), dtype = np.float64 )
-    z           = np.zeros( (len(q_path), ne, nsm, n_mod), dtype = np.complex128 )
-    z_pert      = np.zeros( (len(q_path), ne, nsm, n_mod), dtype = np.complex128 )
+    nT=len(temperatures)
+    ne_sp=ne if adaptive_ne is None else adaptive_ne
+    spectralf   = np.zeros( (nT, len(q_path), ne_sp, n_mod, nsm), dtype = np.float64 )
+    energies_path = np.zeros( (len(q_path), ne_sp), dtype = np.float64 )
+    z           = np.zeros( (nT, len(q_path), ne, nsm, n_mod), dtype = np.complex128 )
+    z_pert      = np.zeros( (nT, len(q_path), ne, nsm, n_mod), dtype = np.complex128 )
     wq          = np.zeros( (len(q_path), n_mod), dtype = np.float64 )
     #
-    for iq, q in enumerate(q_path):
-
-        spectralf[iq, :, :, :], z[iq, :, :, :], z_pert[iq, :, :, :], wq[iq,:]  = get_diag_dynamic_bubble(tensor2, tensor3,
-                                                         k_grid, np.array(q),
-                                                         smear_id, smear, energies,
-                                                         T,  verbose=False )            
+    # The phonons in k are shared among the q points
+    if phonon_cache is None:
+        phonon_cache = PhononGridCache(tensor2)
+    def compute_energies(q, energies):
+        return get_diag_dynamic_bubble(tensor2, tensor3,
+                                       k_grid, q,
+                                       smear_id, smear, energies,
+                                       T,  verbose=False,
+                                       use_symmetries = use_symmetries,
+                                       phonon_cache = phonon_cache, schedule = schedule)
+    def compute_q(q):
+        if adaptive_ne is None:
+            return compute_energies(q, energies)
+        axis = 0 if is_scalar else 1
+        w_q = phonon_cache.get_phonons(q)[0]
+        new_energies, (spectralf_q, z_q, z_pert_q) = get_adaptive_energies(lambda x: compute_energies(q, x)[:3],
+                                                                           e0/CC.Units.RY_TO_CM, e1/CC.Units.RY_TO_CM,
+                                                                           adaptive_ne, w_q, axis = axis)
+        # The Z function is smooth, it is interpolated on the uniform grid
+        z_q = interpolate_energies(new_energies, z_q, energies, axis)
+        z_pert_q = interpolate_energies(new_energies, z_pert_q, energies, axis)
+        return spectralf_q, z_q, z_pert_q, w_q, new_energies
+
+    parameters = {"k_grid" : k_grid, "T" : T, "energies" : energies, "smear" : smear, "smear_id" : smear_id,
+                  "d3_scale_factor" : 1.0 if d3_scale_factor is None else d3_scale_factor}
+    if adaptive_ne is not None:
+        parameters["adaptive_ne"] = adaptive_ne
+
+    # A sharded tensor3 needs all the processes for each q point
+    if tensor3.shard_range is not None:
+        q_groups = 1
+    results = compute_along_path(q_path, compute_q, checkpoint_dir, parameters, q_groups)
+    for iq in range(len(q_path)):
+        spectralf[:, iq, :, :, :], z[:, iq, :, :, :], z_pert[:, iq, :, :, :], wq[iq,:] = results[iq][:4]
+        energies_path[iq, :] = energies if adaptive_ne is None else results[iq][4]
     
     #
     # convert from Ry to cm-1
     smear*=CC.Units.RY_TO_CM
     smear_id*=CC.Units.RY_TO_CM
     energies*=CC.Units.RY_TO_CM
+    energies_path*=CC.Units.RY_TO_CM
     #
     z*=CC.Units.RY_TO_CM
     z_pert*=CC.Units.RY_TO_CM
@@ -1227,8 +2202,13 @@ def get_diag_dynamic_correction_along_path(dyn, tensor3,
         print(" "+filename_sp+"_lorentz_[smear_id]_[smear].dat") 
         print(" ")
         print(" ")
+    if not is_scalar:
+        print(" The prefix of each file is followed by _T[T] for each temperature ")
+        print(" ")
         
-    for  ism in range(nsm):
+    for iT, ism in itertools.product(range(nT), range(nsm)):
+        #
+        T_name=_get_temperature_name(temperatures[iT], is_scalar)
         #
         # pre-name for writing data
         #
@@ -1238,21 +2218,21 @@ def get_diag_dynamic_correction_along_path(dyn, tensor3,
         #
         # spectral func
         #
-        filename_new=filename_sp+'_'+name+'.dat'
+        filename_new=filename_sp+T_name+'_'+name+'.dat'
         fmt="{:>10.6f}\t"+"\t{:>11.3f}"+"\t{:>11.7f}"*(n_mod+1)+"\n"
         with open(filename_new,'w') as f:
             f.write("# ---------------------------------------------------------------------------------------------------------\n")
             f.write("# len (2pi/Angstrom), energy (cm-1), spectral function (1/cm-1), spectral function mode components (1/cm-1)\n")
             f.write("# ---------------------------------------------------------------------------------------------------------\n")
             for iq,leng in enumerate(x_length):
-             for ie, ene in enumerate(energies):
-                 out=spectralf[iq,ie,:,ism]
+             for ie, ene in enumerate(energies_path[iq]):
+                 out=spectralf[iT,iq,ie,:,ism]
                  f.write(fmt.format(leng,ene,np.sum(out),*out))
              f.write("\n")    
         # =======
         # z func
         # =======
-        filename_new=filename_z+'_'+name+'.dat'
+        filename_new=filename_z+T_name+'_'+name+'.dat'
         fmt="{:>10.6f}\t"+"\t{:>11.3f}"+"\t{:>11.7f}"*(n_mod)+"\n"
         with open(filename_new,'w') as f:
             f.write("# ---------------------------------------------------- \n")
@@ -1260,7 +2240,7 @@ def get_diag_dynamic_correction_along_path(dyn, tensor3,
             f.write("# ---------------------------------------------------- \n")            
             for iq,leng in enumerate(x_length):
              for ie, ene in enumerate(energies):
-                 out=z[iq,ie,ism,:]
+                 out=z[iT,iq,ie,ism,:]
                  f.write(fmt.format(leng,ene,*out))                 
                                  
         # ======================================
@@ -1278,7 +2258,7 @@ def get_diag_dynamic_correction_along_path(dyn, tensor3,
                     for i in range(numiter):
                         x=findne(freqold,e0,de) 
                         if i==0: xtriv=x    
-                        freqshifted=np.real(z[iq,x-1,ism,ifreq]) # Re(z) is the shifted freq
+                        freqshifted=np.real(z[iT,iq,x-1,ism,ifreq]) # Re(z) is the shifted freq
                         if abs(freqshifted-freqold)<eps:
                             break
                         elif abs(freqshifted-freqoldold)<1.0e-10:                           
@@ -1290,13 +2270,13 @@ def get_diag_dynamic_correction_along_path(dyn, tensor3,
                             freqold=freqshifted
                     #
                     res[iq,ifreq,0]=freqshifted
-                    res[iq,ifreq,1]=-np.imag(z[iq,x-1,ism,ifreq])
+                    res[iq,ifreq,1]=-np.imag(z[iT,iq,x-1,ism,ifreq])
                     #
-                    res_os[iq,ifreq,0]=np.real(z[iq,xtriv-1,ism,ifreq])                 
-                    res_os[iq,ifreq,1]=-np.imag(z[iq,xtriv-1,ism,ifreq]) 
+                    res_os[iq,ifreq,0]=np.real(z[iT,iq,xtriv-1,ism,ifreq])                 
+                    res_os[iq,ifreq,1]=-np.imag(z[iT,iq,xtriv-1,ism,ifreq]) 
                     #
-                    res_pert[iq,ifreq,0]=np.real(z_pert[iq,xtriv-1,ism,ifreq])                 
-                    res_pert[iq,ifreq,1]=-np.imag(z_pert[iq,xtriv-1,ism,ifreq])                     
+                    res_pert[iq,ifreq,0]=np.real(z_pert[iT,iq,xtriv-1,ism,ifreq])                 
+                    res_pert[iq,ifreq,1]=-np.imag(z_pert[iT,iq,xtriv-1,ism,ifreq])                     
         else:
             res_os=np.zeros((len(q_path),n_mod,2),dtype=np.float64)   #   one-shot     shifted freq and  linewidth              
             res_pert=np.zeros((len(q_path),n_mod,2),dtype=np.float64) #   perturbative shifted freq and  linewidth        
@@ -1304,18 +2284,18 @@ def get_diag_dynamic_correction_along_path(dyn, tensor3,
                 for ifreq in range(n_mod):        
                     xtriv=findne(wq[iq,ifreq],e0,de)
                     #
-                    res_os[iq,ifreq,0]=np.real(z[iq,xtriv-1,ism,ifreq])                 
-                    res_os[iq,ifreq,1]=-np.imag(z[iq,xtriv-1,ism,ifreq]) 
+                    res_os[iq,ifreq,0]=np.real(z[iT,iq,xtriv-1,ism,ifreq])                 
+                    res_os[iq,ifreq,1]=-np.imag(z[iT,iq,xtriv-1,ism,ifreq]) 
                     #
-                    res_pert[iq,ifreq,0]=np.real(z_pert[iq,xtriv-1,ism,ifreq])                 
-                    res_pert[iq,ifreq,1]=-np.imag(z_pert[iq,xtriv-1,ism,ifreq])         
+                    res_pert[iq,ifreq,0]=np.real(z_pert[iT,iq,xtriv-1,ism,ifreq])                 
+                    res_pert[iq,ifreq,1]=-np.imag(z_pert[iT,iq,xtriv-1,ism,ifreq])         
         
         # =======================
         # v2_freq, shift, hwhm
         # =======================
         
         if self_consist:
-            filename_new=filename_shift_lw+'_'+name+'.dat'
+            filename_new=filename_shift_lw+T_name+'_'+name+'.dat'
             fmt="{:>10.6f}\t"+"\t{:>11.7f}"*(3*n_mod)+"\n"
             with open(filename_new,'w') as f:
                 f.write("# ----------------------------------------------------------------- \n")
@@ -1325,7 +2305,7 @@ def get_diag_dynamic_correction_along_path(dyn, tensor3,
                     out=np.concatenate((wq[iq,:],res[iq,:,0]-wq[iq,:], res[iq,:,1]))
                     f.write(fmt.format(leng,*out))                
         #         
-        filename_new=filename_shift_lw+'_one_shot_'+name+'.dat'
+        filename_new=filename_shift_lw+T_name+'_one_shot_'+name+'.dat'
         fmt="{:>10.6f}\t"+"\t{:>11.7f}"*(3*n_mod)+"\n"
         with open(filename_new,'w') as f:
             f.write("# ----------------------------------------------------------------- \n")
@@ -1335,7 +2315,7 @@ def get_diag_dynamic_correction_along_path(dyn, tensor3,
                  out=np.concatenate((wq[iq,:],res_os[iq,:,0]-wq[iq,:], res_os[iq,:,1]))
                  f.write(fmt.format(leng,*out))                         
         #         
-        filename_new=filename_shift_lw+'_perturb_'+name+'.dat'
+        filename_new=filename_shift_lw+T_name+'_perturb_'+name+'.dat'
         fmt="{:>10.6f}\t"+"\t{:>11.7f}"*(3*n_mod)+"\n"
         with open(filename_new,'w') as f:
             f.write("# ----------------------------------------------------------------- \n")
@@ -1363,7 +2343,7 @@ def get_diag_dynamic_correction_along_path(dyn, tensor3,
             #
             # freq, freq +/- hwhm
             #
-            filename_new=filename_freq_dyn+'_'+name+'.dat'
+            filename_new=filename_freq_dyn+T_name+'_'+name+'.dat'
             fmt="{:>10.6f}\t"+"\t{:>11.7f}"*(3*n_mod)+"\n"
             with open(filename_new,'w') as f:
                 f.write("# ------------------------------------------------------------------------------------------------------------------- \n")
@@ -1377,7 +2357,7 @@ def get_diag_dynamic_correction_along_path(dyn, tensor3,
             # 
             # Lorentzian spectral func 
             #
-            filename_new=filename_sp+'_lorentz_'+name+'.dat'
+            filename_new=filename_sp+T_name+'_lorentz_'+name+'.dat'
             fmt="{:>10.6f}\t"+"\t{:>11.3f}"+"\t{:>11.7f}"*(n_mod+1)+"\n"
             with open(filename_new,'w') as f:
                 f.write("# ---------------------------------------------------------------------------------------------------------\n")
@@ -1406,7 +2386,7 @@ def get_diag_dynamic_correction_along_path(dyn, tensor3,
         #
         # freq, freq +/- hwhm
         #
-        filename_new=filename_freq_dyn+'_one_shot_'+name+'.dat'
+        filename_new=filename_freq_dyn+T_name+'_one_shot_'+name+'.dat'
         fmt="{:>10.6f}\t"+"\t{:>11.7f}"*(3*n_mod)+"\n"
         with open(filename_new,'w') as f:
             f.write("# ------------------------------------------------------------------------------------------------------------------- \n")
@@ -1421,7 +2401,7 @@ def get_diag_dynamic_correction_along_path(dyn, tensor3,
         # 
         # Lorentzian spectral func 
         #
-        filename_new=filename_sp+'_lorentz_one_shot_'+name+'.dat'
+        filename_new=filename_sp+T_name+'_lorentz_one_shot_'+name+'.dat'
         fmt="{:>10.6f}\t"+"\t{:>11.3f}"+"\t{:>11.7f}"*(n_mod+1)+"\n"
         with open(filename_new,'w') as f:
             f.write("# --------------------------------------------------------------------------------------------------------- \n")
@@ -1450,7 +2430,7 @@ def get_diag_dynamic_correction_along_path(dyn, tensor3,
         #
         # freq, freq +/- hwhm
         #
-        filename_new=filename_freq_dyn+'_perturb_'+name+'.dat'
+        filename_new=filename_freq_dyn+T_name+'_perturb_'+name+'.dat'
         fmt="{:>10.6f}\t"+"\t{:>11.7f}"*(3*n_mod)+"\n"
         with open(filename_new,'w') as f:
             f.write("# ------------------------------------------------------------------------------------------------------------------- \n")
@@ -1465,7 +2445,7 @@ def get_diag_dynamic_correction_along_path(dyn, tensor3,
         # 
         # Lorentzian spectral func 
         #
-        filename_new=filename_sp+'_lorentz_perturb_'+name+'.dat'
+        filename_new=filename_sp+T_name+'_lorentz_perturb_'+name+'.dat'
         fmt="{:>10.6f}\t"+"\t{:>11.3f}"+"\t{:>11.7f}"*(n_mod+1)+"\n"
         with open(filename_new,'w') as f:
             f.write("# --------------------------------------------------------------------------------------------------------- \n")
@@ -1494,12 +2474,39 @@ def get_perturb_dynamic_selfnrg(tensor2, tensor3,
                             k_grid, q, 
                             smear,
                             T,
-                            verbose= False):
+                            verbose= False,
+                            use_symmetries = False,
+                            phonon_cache = None,
+                            schedule = "static",
+                            modes = None):
+    """
+    COMPUTE THE PERTURBATIVE SELF-ENERGY
+    ====================================
+
+    The shift and the linewidth of the modes of q, from the diagonal bubble
+    evaluated on the frequency of each mode.
+    With modes, only the selected modes of q are computed (see get_modes).
+
+    Results
+    -------
+        w_q : ndarray(size = n_sel)
+            The frequencies of the selected modes of q
+        shift, hwhm : ndarray(size = (n_sel, nsmear))
+            The frequency shift and the half width at half maximum.
+            With an array of temperatures T, they have an extra first axis.
+    """
         
     structure = tensor2.unitcell_structure
+    temperatures, is_scalar = _get_temperatures(T)
     
     # Get the integration points 
-    k_points = CC.symmetries.GetQGrid(structure.unit_cell, k_grid)
+    k_points, k_weights, qe_sym = get_k_points(structure, k_grid, q, use_symmetries)
+
+    # The phonons in the integration points
+    if phonon_cache is None:
+        phonon_cache = PhononGridCache(tensor2)
+    elif phonon_cache.tensor2 is not tensor2:
+        raise ValueError("Error, the phonon_cache must be created with the same tensor2")
     
         
     # Get the phi2 in q
@@ -1526,58 +2533,30 @@ def get_perturb_dynamic_selfnrg(tensor2, tensor3,
         print('Cannot continue with SSCHA negative frequencies')
         exit()
     w_q=np.sqrt(w2_q)   
+
+    # Only the selected modes of q are contracted and computed
+    modes = get_modes(modes, w_q, qe_sym is not None)
+    pols_q_sel = pols_q[:, modes]
     
+    # Pre-contract the third order force constant on the fixed q
+    tensor3_q = tensor3.prepare_for_q(q)
+
+    # The mass scaling and the rotation reuse the same workspaces for all the k points
+    d3_rotation = D3Rotation(m, pols_q_sel)
+
     def compute_k(k):
         # phi3 in q, k, -q - k
         t1 = time.time()        
-        phi3=tensor3.Interpolate(k,-q-k, asr = False)
+        phi3=tensor3_q.interpolate_k(k)
         t2 = time.time()
-        # phi2 in k
-        phi2_k = tensor2.Interpolate(k, asr = False) 
-
-        # phi2 in -q-k
-        phi2_mq_mk = tensor2.Interpolate(-q -k, asr = False)
+        # phonons in k and -q-k
+        w_k, pols_k, is_k_gamma = phonon_cache.get_phonons(k)
+        w_mq_mk, pols_mq_mk, is_mq_mk_gamma = phonon_cache.get_phonons(-q-k)
 
         t3 = time.time()
         
-        # dynamical matrices (divide by the masses)
-        d2_k = phi2_k * mm_inv_mat
-        d2_mq_mk = phi2_mq_mk * mm_inv_mat
-        
-        # Diagonalize the dynamical matrices
-        w2_k, pols_k = np.linalg.eigh(d2_k)
-        w2_mq_mk, pols_mq_mk = np.linalg.eigh(d2_mq_mk)
-        
-        
-        is_k_gamma = CC.Methods.is_gamma(structure.unit_cell, k)
-        is_mq_mk_gamma = CC.Methods.is_gamma(structure.unit_cell, -q-k)
-        
-        if is_k_gamma:
-            w2_k[0:3]=0.0
-        if not (w2_k >= 0.0).all():
-            print('k= ',k, '    (2pi/A)')
-            print('w(k)= ',np.sign(w2_k)*np.sqrt(np.abs(w2_k))*CC.Units.RY_TO_CM,'  (cm-1)')
-            print('Cannot continue with SSCHA negative frequencies')
-            exit()
-        w_k=np.sqrt(w2_k)
-
-        if is_mq_mk_gamma:
-            w2_mq_mk[0:3]=0.0
-        if not (w2_mq_mk >= 0.0).all():
-            print('-q-k= ',-q-k, '    (2pi/A)')
-            print('w(-q-k)= ',np.sign(w2_mq_mk)*np.sqrt(np.abs(w2_mq_mk))*CC.Units.RY_TO_CM,'  (cm-1)')
-            print('Cannot continue with SSCHA negative frequencies')
-            exit()
-        w_mq_mk=np.sqrt(w2_mq_mk)
-        
-        # Dividing the phi3 by the sqare root of masses
-        d3 = np.einsum("abc, a, b, c -> abc", phi3, 1/np.sqrt(m), 1/np.sqrt(m), 1/np.sqrt(m))
-
         # d3 in mode components
-        # d3_pols = np.einsum("abc, ai, bj, ck -> ijk", d3, pols_mq, pols_k, pols_q_mk)
-        d3_pols = np.einsum("abc, ai -> ibc", d3, pols_q)
-        d3_pols = np.einsum("abc, bi -> aic", d3_pols, pols_k)
-        d3_pols = np.einsum("abc, ci -> abi", d3_pols, pols_mq_mk)
+        d3_pols = d3_rotation.rotate(phi3, pols_k, pols_mq_mk)
         
         t4 = time.time()
         
@@ -1586,10 +2565,11 @@ def get_perturb_dynamic_selfnrg(tensor2, tensor3,
         n_mod=3*structure.N_atoms
         # Fortran duty ====
         
-        selfnrg  = thirdorder.third_order_bubble.compute_perturb_selfnrg(smear,T,
+        selfnrg  = np.array([thirdorder.third_order_bubble.compute_perturb_selfnrg(smear,T_i,
                                                             np.array([w_q,w_k,w_mq_mk]).T,
                                                             np.array([is_q_gamma,is_k_gamma,is_mq_mk_gamma]),
-                                                            d3_pols,nsm,n_mod)                
+                                                            d3_pols,modes+1,nsm,n_mod)
+                             for T_i in temperatures])
 
         t5 = time.time()
         
@@ -1603,10 +2583,20 @@ def get_perturb_dynamic_selfnrg(tensor2, tensor3,
     
     CC.Settings.SetupParallel()
 
-    selfnrg =CC.Settings.GoParallel(compute_k, k_points, reduce_op = "+")
+    selfnrg =CC.Settings.GoParallel(lambda x: compute_k(x[0]) * x[1], list(zip(k_points, k_weights)), reduce_op = "+",
+                                    schedule = schedule)
 
     # divide by the N_k factor
-    selfnrg /= len(k_points) # (n_mod,nsigma)
+    selfnrg /= np.sum(k_weights) # (nT,n_sel,nsigma)
+    if is_scalar:
+        selfnrg = selfnrg[0]
+
+    # Recover the contribution of the k points excluded by symmetries
+    if qe_sym is not None:
+        selfnrg = average_degenerate_modes(selfnrg, w_q, axis = -2, modes = modes)
+
+    # From now on only the selected modes
+    w_q = w_q[modes]
     
     w_q_ext=w_q[...,None]
         
@@ -1628,7 +2618,12 @@ def get_perturb_dynamic_correction_along_path(dyn, tensor3,
                                            filename_shift_lw  = 'v2_freq_shift_hwhm',                                           
                                            filename_freq_dyn = 'freq_dynamic',                                           
                                            d3_scale_factor=None,
-                                           tensor2= None):                                           
+                                           tensor2= None,
+                                           use_symmetries = False,
+                                           phonon_cache = None,
+                                           schedule = "static",
+                                           checkpoint_dir = None,
+                                           q_groups = None):                                           
 
 
     """
@@ -1653,8 +2648,10 @@ def get_perturb_dynamic_correction_along_path(dyn, tensor3,
         nsm : integer
               Number of smearings to consider         
               (default = 1)
-        T : float
-            The temperature 
+        T : float or list of floats
+            The temperature. With a list, all the temperatures are computed
+            with one pass over the k points, and the name of each output file
+            gets the suffix _T[temperature] after the prefix.
             (default: 0 K)
         q_path : list of triplets
                  Path of the q-points of the Brillouin Zone, in 2pi/Anstrom units,
@@ -1692,6 +2689,30 @@ def get_perturb_dynamic_correction_along_path(dyn, tensor3,
                   If present, this 2nd order FC overwrites the one 
                   obtained from dyn.
                   (default: None)  
+        use_symmetries : logical
+                  If True, for each q point the integration runs only over the 
+                  k points irreducible under the small group of q.
+                  (default: False)
+        phonon_cache : PhononGridCache()
+                  The phonons in the k points, shared among the q points of the path.
+                  It can be shared also among different calculations with the same tensor2.
+                  If None, a new one is created.
+                  (default: None)
+        schedule : string
+                  How the k points are split among the processes, "static" or "dynamic"
+                  (see Settings.GoParallel).
+                  (default: "static")
+        checkpoint_dir : string
+                  If present, the results of each q point are saved in this directory
+                  as soon as they are computed. Running again the calculation with the
+                  same directory restarts it, skipping the q points already done.
+                  (default: None)
+        q_groups : int
+                  With MPI, the processes are split in q_groups groups working on
+                  different q points, each one parallel over the k points.
+                  If None, it is chosen from the number of q points, k points and processes
+                  (see get_q_groups). A sharded tensor3 always uses one group.
+                  (default: None)
         
     """
 
@@ -1702,7 +2723,8 @@ def get_perturb_dynamic_correction_along_path(dyn, tensor3,
     print("   Bubble perturbative dynamic correction   " ) 
     print(" ===========================================" )
     print(" ") 
-    print(" T= {:>5.1f} K".format(T))
+    temperatures, is_scalar = _get_temperatures(T)
+    print(" T= " + ", ".join(["{:>5.1f}".format(T_i) for T_i in temperatures]) + " K")
     print(" k grid= {} x {} x {} ".format(*tuple(k_grid))) 
 
     if ( tensor2 == None ):
@@ -1751,15 +2773,31 @@ def get_perturb_dynamic_correction_along_path(dyn, tensor3,
     smear=np.linspace(sm0,sm1,nsm)/CC.Units.RY_TO_CM
     #  ======================== Calculation ==========================================        
     n_mod=3*dyn.structure.N_atoms
-    shift     = np.zeros( (len(q_path), n_mod, nsm), dtype = np.float64 ) # q-point,mode,smear
-    hwhm      = np.zeros( (len(q_path), n_mod, nsm), dtype = np.float64 ) # q-point,mode,smear
+    nT=len(temperatures)
+    shift     = np.zeros( (nT, len(q_path), n_mod, nsm), dtype = np.float64 ) # T,q-point,mode,smear
+    hwhm      = np.zeros( (nT, len(q_path), n_mod, nsm), dtype = np.float64 ) # T,q-point,mode,smear
     wq        = np.zeros( (len(q_path), n_mod), dtype = np.float64 )      # q-point,mode
     #
-    for iq, q in enumerate(q_path):        
-        wq[iq,:],shift[iq,:,:], hwhm[iq,:,:]  = get_perturb_dynamic_selfnrg(tensor2, tensor3,
-                                                   k_grid, np.array(q),
-                                                   smear, T, 
-                                                   verbose=False )            
+    # The phonons in k are shared among the q points
+    if phonon_cache is None:
+        phonon_cache = PhononGridCache(tensor2)
+    def compute_q(q):
+        return get_perturb_dynamic_selfnrg(tensor2, tensor3,
+                                           k_grid, q,
+                                           smear, T, 
+                                           verbose=False,
+                                           use_symmetries = use_symmetries,
+                                           phonon_cache = phonon_cache, schedule = schedule)
+
+    parameters = {"k_grid" : k_grid, "T" : T, "smear" : smear,
+                  "d3_scale_factor" : 1.0 if d3_scale_factor is None else d3_scale_factor}
+
+    # A sharded tensor3 needs all the processes for each q point
+    if tensor3.shard_range is not None:
+        q_groups = 1
+    results = compute_along_path(q_path, compute_q, checkpoint_dir, parameters, q_groups)
+    for iq in range(len(q_path)):
+        wq[iq,:],shift[:,iq,:,:], hwhm[:,iq,:,:] = results[iq]
     
     # print results
     wq*=CC.Units.RY_TO_CM
@@ -1769,50 +2807,545 @@ def get_perturb_dynamic_correction_along_path(dyn, tensor3,
     #==================== SORTING ===============================
     wq_shifted=wq[...,None]+shift
         
-    sortidx=np.argsort(wq_shifted,axis=1)
+    sortidx=np.argsort(wq_shifted,axis=2)
     
-    wq_shifted_sorted=np.take_along_axis(wq_shifted, sortidx, 1)
-    hwhm_sorted=np.take_along_axis(hwhm, sortidx, 1)
+    wq_shifted_sorted=np.take_along_axis(wq_shifted, sortidx, 2)
+    hwhm_sorted=np.take_along_axis(hwhm, sortidx, 2)
     #=============== Print Results ===============================    
     smear*=CC.Units.RY_TO_CM
     #
-    for  ism in range(nsm):
+    for iT, ism in itertools.product(range(nT), range(nsm)):
         #
+        T_name=_get_temperature_name(temperatures[iT], is_scalar)
         name="{:6.1f}".format(smear[ism]).strip()
         #
         # v2 freq, corresponding  shift & hwhm
         #
-        filename_new=filename_shift_lw+'_'+name+'.dat'
+        filename_new=filename_shift_lw+T_name+'_'+name+'.dat'
         fmt="{:>10.6f}\t"+"\t{:>11.7f}"*(3*n_mod)+"\n"
         with open(filename_new,'w') as f:
             f.write("# --------------------------------------------------------------------- \n")
             f.write("# len (2pi/Angstrom), sscha freq (cm-1), freq shift (cm-1), hwhm (cm-1) \n")
             f.write("# --------------------------------------------------------------------- \n")            
             for iq,leng in enumerate(x_length):
-                 out=np.concatenate((wq[iq,:],shift[iq,:,ism], 
-                                     hwhm[iq,:,ism]))
+                 out=np.concatenate((wq[iq,:],shift[iT,iq,:,ism], 
+                                     hwhm[iT,iq,:,ism]))
                  f.write(fmt.format(leng,*out))                                 
         #
         name="{:6.1f}".format(smear[ism]).strip()
         #
         # shifted freq sorted, corresponding hwhm 
         #
-        filename_new=filename_freq_dyn+'_'+name+'.dat'
+        filename_new=filename_freq_dyn+T_name+'_'+name+'.dat'
         fmt="{:>10.6f}\t"+"\t{:>11.7f}"*(2*n_mod)+"\n"
         with open(filename_new,'w') as f:
             f.write("# ----------------------------------------------------------------- \n")
             f.write("# len (2pi/Angstrom), sscha+shift freq (sorted) (cm-1), hwhm (cm-1) \n")            
             f.write("# ----------------------------------------------------------------- \n")
             for iq,leng in enumerate(x_length):
-                 out=np.concatenate((wq_shifted_sorted[iq,:,ism],
-                                     hwhm_sorted[iq,:,ism]))
+                 out=np.concatenate((wq_shifted_sorted[iT,iq,:,ism],
+                                     hwhm_sorted[iT,iq,:,ism]))
                  f.write(fmt.format(leng,*out))     
 
+    T_name = "" if is_scalar else "_T[T]"
     print(" ")
-    print(" Results printed in "+filename_shift_lw+'_'+'[smear].dat')
+    print(" Results printed in "+filename_shift_lw+T_name+'_'+'[smear].dat')
     print(" ")      
     print(" ")
-    print(" Results printed in "+filename_freq_dyn+'_'+'[smear].dat')
+    print(" Results printed in "+filename_freq_dyn+T_name+'_'+'[smear].dat')
     print(" ")      
 
+
+# ========================== TETRAHEDRON METHOD ======================================
+
+def get_tetrahedra(structure, k_grid):
+    """
+    GET THE TETRAHEDRA
+    ==================
+
+    Split the full grid of k points in tetrahedra for the linear tetrahedron method.
+    Each cell of the grid is divided in 6 tetrahedra sharing its shortest main diagonal,
+    so all the tetrahedra have the same volume and each point is a corner of 24 of them.
+
+    Parameters
+    ----------
+        structure : Structure()
+            The unit cell structure
+        k_grid : (nk1, nk2, nk3)
+            The grid of k points
+
+    Results
+    -------
+        k_points : ndarray(size = (nk, 3))
+            The points of the grid (2pi/Angstrom). 
+            The point (i1, i2, i3) has the index (i1 * nk2 + i2) * nk3 + i3
+        tetrahedra : ndarray(size = (6*nk, 4), dtype = int)
+            The indices of the corners of each tetrahedron
+    """
+
+    n_grid = np.array(k_grid, dtype = int)
+    bg = structure.get_reciprocal_vectors() / (2 * np.pi)
+
+    grid = np.array(list(itertools.product(*[range(n) for n in n_grid])), dtype = int)
+    k_points = (grid / n_grid).dot(bg)
+
+    # The corners of a cell (the bits of the index are the shifts along the three directions)
+    shifts = np.array([[(c >> 2) & 1, (c >> 1) & 1, c & 1] for c in range(8)], dtype = int)
+
+    # The shortest main diagonal goes from the corner start to 7 - start
+    lengths = [np.linalg.norm((shifts[7 - c] - shifts[c]).dot(bg / n_grid[:, None])) for c in range(4)]
+    start = int(np.argmin(lengths))
+
+    # The 6 paths along the edges of the cell from start to 7 - start
+    cell_tetrahedra = []
+    for axes in itertools.permutations(range(3)):
+        corners = [start]
+        for axis in axes[:2]:
+            corners.append(corners[-1] ^ (1 << (2 - axis)))
+        corners.append(start ^ 7)
+        cell_tetrahedra.append(corners)
+
+    tetrahedra = []
+    for corners in cell_tetrahedra:
+        index = (grid[:, None, :] + shifts[corners][None, :, :]) % n_grid
+        tetrahedra.append((index[:, :, 0] * n_grid[1] + index[:, :, 1]) * n_grid[2] + index[:, :, 2])
+
+    return k_points, np.concatenate(tetrahedra)
+
+
+def get_tetrahedron_weights(energies, corner_energies, corner = None, min_gap = 1e-10):
+    """
+    GET THE TETRAHEDRON WEIGHTS
+    ===========================
+
+    The weights of the linear tetrahedron method for the integral of a delta function.
+    If the energy and the integrand f are linear inside a tetrahedron,
+
+    .. math ::
+
+        \\frac{1}{V_T}\\int_T d^3k f(k) \\delta(E - e(k)) = \\sum_{c = 1}^{4} w_c(E) f_c
+
+    where the sum runs over the corners of the tetrahedron.
+    The weights are the derivative of the volume fraction below E (the density of states) 
+    times the barycentric coordinates of the centroid of the section at energy E.
+
+    Parameters
+    ----------
+        energies : ndarray(size = ne)
+            The energies E
+        corner_energies : ndarray(size = (..., 4))
+            The energies on the corners of each tetrahedron
+        corner : int
+            If present, only the weights of this corner are returned.
+        min_gap : float
+            The minimum separation between the sorted corner energies, to avoid the
+            divisions by zero of the degenerate corners.
+
+    Results
+    -------
+        weights : ndarray(size = (ne, ..., 4))
+            The weights of the corners for each energy
+            (the last axis is missing if corner is present).
+    """
+
+    energies = np.asarray(energies, dtype = np.double)
+    corner_energies = np.asarray(corner_energies, dtype = np.double)
+
+    # Sort the corners
+    order = np.argsort(corner_energies, axis = -1)
+    e = np.take_along_axis(corner_energies, order, axis = -1)
+    for i in range(1, 4):
+        e[..., i] = np.maximum(e[..., i], e[..., i - 1] + min_gap)
+
+    shape = energies.shape + e.shape[:-1]
+
+    # Compute the weights only where the energy crosses the tetrahedron
+    E = np.broadcast_to(energies.reshape(energies.shape + (1,) * (e.ndim - 1)), shape)
+    e = np.broadcast_to(e, shape + (4,))
+    active = (E > e[..., 0]) & (E < e[..., 3])
+    E = E[active]
+    e = e[active]
+    order = np.broadcast_to(order, shape + (4,))[active]
+
+    e1, e2, e3, e4 = e.T
+    e21, e31, e41, e32, e42, e43 = e2 - e1, e3 - e1, e4 - e1, e3 - e2, e4 - e2, e4 - e3
+
+    # E between e1 and e2: the section is a triangle on the edges 12, 13, 14
+    x = E - e1
+    t = np.array([x / e21, x / e31, x / e41])
+    dos = 3 * x**2 / (e21 * e31 * e41)
+    w_1 = dos / 3 * np.array([3 - np.sum(t, axis = 0), t[0], t[1], t[2]])
+
+    # E between e3 and e4: the section is a triangle on the edges 14, 24, 34
+    y = e4 - E
+    s = np.array([y / e41, y / e42, y / e43])
+    dos = 3 * y**2 / (e41 * e42 * e43)
+    w_3 = dos / 3 * np.array([s[0], s[1], s[2], 3 - np.sum(s, axis = 0)])
+
+    # E between e2 and e3: the section is the quadrilateral P13, P14, P24, P23 (Pij on the edge ij),
+    # split in the triangles (P13, P14, P24) and (P13, P24, P23)
+    x2 = E - e2
+    dos = 3 / (e31 * e41) * (e21 + 2 * x2 - (e31 + e42) * x2**2 / (e32 * e42))
+    t13, t14, t23, t24 = x / e31, x / e41, x2 / e32, x2 / e42
+    zero = np.zeros_like(E)
+    p13 = np.array([1 - t13, zero, t13, zero])
+    p14 = np.array([1 - t14, zero, zero, t14])
+    p24 = np.array([zero, 1 - t24, zero, t24])
+    p23 = np.array([zero, 1 - t23, t23, zero])
+
+    # The ratio of the areas does not depend on the shape of the tetrahedron:
+    # the last three barycentric coordinates are the positions in the reference one
+    area_a = np.linalg.norm(np.cross((p14 - p13)[1:].T, (p24 - p13)[1:].T), axis = -1)
+    area_b = np.linalg.norm(np.cross((p24 - p13)[1:].T, (p23 - p13)[1:].T), axis = -1)
+    area = area_a + area_b
+    area[area == 0] = 1
+    w_2 = dos / 3 * (area_a * (p13 + p14 + p24) + area_b * (p13 + p24 + p23)) / area
+
+    w_sorted = np.where(x < e21, w_1, np.where(E < e3, w_2, w_3)).T
+
+    # Back to the original order of the corners
+    w_active = np.zeros_like(w_sorted)
+    np.put_along_axis(w_active, order, w_sorted, axis = -1)
+
+    if corner is None:
+        weights = np.zeros(shape + (4,), dtype = np.double)
+        weights[active] = w_active
+    else:
+        weights = np.zeros(shape, dtype = np.double)
+        weights[active] = w_active[:, corner]
+
+    return weights
+
+
+def _get_bose(w, T):
+    """
+    The Bose-Einstein occupation of the frequencies w (Ry) at the temperature T (K).
+    It is zero at T = 0 and for the non positive frequencies.
+    """
+    w = np.asarray(w, dtype = np.double)
+    bose = np.zeros_like(w)
+    if T > 0:
+        positive = w > 0
+        bose[positive] = 1 / np.expm1(w[positive] * CC.Units.RY_TO_EV / (CC.Units.K_B * T))
+    return bose
+
+
+def _get_pair_weights(energies, w_grid, w_mq_grid, tetrahedra, corners):
+    """
+    The tetrahedron weights of a point k of the grid for the two phonon energies
+    w(-q-k) + w(k) and w(-q-k) - w(k), summed over the tetrahedra with corner k.
+    Each weight is antisymmetrized in the energy, w(E) - w(-E).
+
+    Parameters
+    ----------
+        energies : ndarray(size = ne)
+            The energies
+        w_grid, w_mq_grid : ndarray(size = (nk, n_mod))
+            The frequencies in k and -q-k on all the grid
+        tetrahedra : ndarray(size = (n_t, 4), dtype = int)
+            The tetrahedra with corner k
+        corners : ndarray(size = n_t, dtype = int)
+            The position of k in each tetrahedron
+
+    Results
+    -------
+        weights_plus, weights_minus : ndarray(size = (ne, n_mod, n_mod))
+            The weights of the sum and of the difference [energy, mode in k, mode in -q-k]
+    """
+
+    ne = len(energies)
+    n_mod = w_grid.shape[1]
+    all_energies = np.concatenate((energies, -energies))
+
+    weights_plus = np.zeros((ne, n_mod, n_mod), dtype = np.double)
+    weights_minus = np.zeros((ne, n_mod, n_mod), dtype = np.double)
+    for tetra, corner in zip(tetrahedra, corners):
+        w_k = w_grid[tetra][:, :, None]
+        w_mq_mk = w_mq_grid[tetra][:, None, :]
+        for omega, weights in [(w_mq_mk + w_k, weights_plus), (w_mq_mk - w_k, weights_minus)]:
+            w = get_tetrahedron_weights(all_energies, np.moveaxis(omega, 0, -1), corner)
+            weights += w[:ne] - w[ne:]
+
+    return weights_plus, weights_minus
+
+
+def _get_grid_phonons(phonon_cache, k_points, q):
+    """
+    The frequencies in k and -q-k on all the points of the grid
+    """
+    w_grid = np.array([phonon_cache.get_phonons(k)[0] for k in k_points])
+    w_mq_grid = np.array([phonon_cache.get_phonons(-q - k)[0] for k in k_points])
+    return w_grid, w_mq_grid
+
+
+def get_tetrahedron_diag_bubble(tensor2, tensor3, k_grid, q, energies, T,
+                                verbose = False,
+                                phonon_cache = None,
+                                schedule = "static"):
+    """
+    IMAGINARY PART OF THE DIAGONAL BUBBLE (TETRAHEDRA)
+    ==================================================
+
+    Compute the imaginary part of the diagonal bubble in q with the linear tetrahedron method.
+    The frequencies interpolated on the grid are linearly interpolated inside each tetrahedron,
+    and the delta functions of the energy conservation are integrated analytically:
+    there is no smearing and the result converges with much coarser k grids.
+    It is the limit smear -> 0 of the imaginary part of the bubble of get_diag_dynamic_bubble.
+
+    .. math ::
+
+        \\Im \\Pi_\\mu(E) = -\\frac{\\pi}{8 N_k}\\sum_{k\\rho_2\\rho_3}\\frac{|D^{(3)}_{\\mu\\rho_2\\rho_3}|^2}{\\omega_2\\omega_3}
+        \\left[(1 + n_2 + n_3)(\\delta(E - \\Omega_+) - \\delta(E + \\Omega_+))
+        - (n_3 - n_2)(\\delta(E - \\Omega_-) - \\delta(E + \\Omega_-))\\right]
+
+    with :math:`\\Omega_\\pm = \\omega_3 \\pm \\omega_2`, where 2 and 3 are the modes in k and -q-k.
+    The integration runs over the full grid (the symmetries are not used).
+
+    Parameters
+    ----------
+        tensor2 : ForceTensor.Tensor2()
+            The second order force constant
+        tensor3 : ForceTensor.Tensor3()
+            The third order force constant
+        k_grid : (nk1, nk2, nk3)
+            The integration grid
+        q : ndarray(size = 3)
+            The q point (2pi/Angstrom)
+        energies : ndarray(size = ne)
+            The energies (Ry). If None, each mode is computed at its own frequency w_q.
+        T : float or ndarray(size = nT)
+            The temperature (K). With an array, the tetrahedron weights are
+            computed once for all the temperatures.
+        verbose : bool
+            If True, print the timing of each k point.
+        phonon_cache : PhononGridCache()
+            The phonons in the k points (if None, a new one is created)
+        schedule : string
+            How the k points are split among the processes, "static" or "dynamic"
+            (see Settings.GoParallel).
+
+    Results
+    -------
+        im_bubble : ndarray(size = (ne, 3*nat))
+            The imaginary part of the bubble (Ry^2) for each energy and mode of q.
+            If energies is None, the size is 3*nat.
+            If T is an array, there is an extra first axis for the temperatures.
+        w_q : ndarray(size = 3*nat)
+            The frequencies in q (Ry)
+    """
+
+    structure = tensor2.unitcell_structure
+    temperatures, is_scalar = _get_temperatures(T)
+
+    # The phonons in the integration points
+    if phonon_cache is None:
+        phonon_cache = PhononGridCache(tensor2)
+    elif phonon_cache.tensor2 is not tensor2:
+        raise ValueError("Error, the phonon_cache must be created with the same tensor2")
+
+    k_points, tetrahedra = get_tetrahedra(structure, k_grid)
+    w_grid, w_mq_grid = _get_grid_phonons(phonon_cache, k_points, q)
+
+    # The phonons in q
+    m = np.tile(structure.get_masses_array(), (3,1)).T.ravel()
+    d2_q = tensor2.Interpolate(q, asr = False) / np.sqrt(np.outer(m, m))
+    w2_q, pols_q = np.linalg.eigh(d2_q)
+    if CC.Methods.is_gamma(structure.unit_cell, q):
+        w2_q[0:3] = 0.0
+    if not (w2_q >= 0.0).all():
+        print('q= ',q, '    (2pi/A)')
+        print('w(q)= ',np.sign(w2_q)*np.sqrt(np.abs(w2_q))*CC.Units.RY_TO_CM,'  (cm-1)')
+        print('Cannot continue with SSCHA negative frequencies')
+        exit()
+    w_q = np.sqrt(w2_q)
+
+    on_shell = energies is None
+    if on_shell:
+        energies = w_q
+    energies = np.asarray(energies, dtype = np.double)
+    n_mod = 3 * structure.N_atoms
+
+    # Pre-contract the third order force constant on the fixed q
+    tensor3_q = tensor3.prepare_for_q(q)
+
+    # The mass scaling and the rotation reuse the same workspaces for all the k points
+    d3_rotation = D3Rotation(m, pols_q)
+
+    def compute_k(ik):
+        k = k_points[ik]
+        t1 = time.time()
+        phi3 = tensor3_q.interpolate_k(k)
+        w_k, pols_k, is_k_gamma = phonon_cache.get_phonons(k)
+        w_mq_mk, pols_mq_mk, is_mq_mk_gamma = phonon_cache.get_phonons(-q-k)
+
+        # d3 in mode components
+        d3_pols = d3_rotation.rotate(phi3, pols_k, pols_mq_mk)
+
+        # The acoustic modes in Gamma do not contribute
+        w_k_inv = np.divide(1, w_k, out = np.zeros_like(w_k), where = w_k > 0)
+        w_mq_mk_inv = np.divide(1, w_mq_mk, out = np.zeros_like(w_mq_mk), where = w_mq_mk > 0)
+        vertex = np.abs(d3_pols)**2 * np.outer(w_k_inv, w_mq_mk_inv)[None, :, :] * np.pi / 8
+        t2 = time.time()
+
+        # The delta functions of the energy conservation
+        t_index, corners = np.nonzero(tetrahedra == ik)
+        weights_plus, weights_minus = _get_pair_weights(energies, w_grid, w_mq_grid, tetrahedra[t_index], corners)
+        t3 = time.time()
+
+        if verbose:
+            print("Time to compute the vertex: {} s".format(t2 - t1))
+            print("Time to compute the tetrahedron weights: {} s".format(t3 - t2))
+
+        im_bubble = []
+        for T_i in temperatures:
+            n_k = _get_bose(w_k, T_i)[:, None]
+            n_mq_mk = _get_bose(w_mq_mk, T_i)[None, :]
+            deltas = (1 + n_k + n_mq_mk) * weights_plus - (n_mq_mk - n_k) * weights_minus
+            if on_shell:
+                im_bubble.append(-np.einsum("ij, ij -> i", vertex.reshape((n_mod, -1)), deltas.reshape((n_mod, -1))))
+            else:
+                im_bubble.append(-deltas.reshape((len(energies), -1)).dot(vertex.reshape((n_mod, -1)).T))
+        return np.array(im_bubble)
+
+    CC.Settings.SetupParallel()
+
+    im_bubble = CC.Settings.GoParallel(compute_k, list(range(len(k_points))), reduce_op = "+",
+                                       schedule = schedule)
+
+    # The volume of each tetrahedron
+    im_bubble /= len(tetrahedra)
+
+    if is_scalar:
+        im_bubble = im_bubble[0]
+
+    return im_bubble, w_q
+
+
+def get_tetrahedron_linewidth(tensor2, tensor3, k_grid, q, T,
+                              verbose = False,
+                              phonon_cache = None,
+                              schedule = "static"):
+    """
+    PERTURBATIVE LINEWIDTH (TETRAHEDRA)
+    ===================================
+
+    The perturbative half width at half maximum of the phonons in q,
+    computed with the linear tetrahedron method (see get_tetrahedron_diag_bubble).
+    It is the limit smear -> 0 of the hwhm of get_perturb_dynamic_selfnrg.
+
+    Parameters
+    ----------
+        tensor2 : ForceTensor.Tensor2()
+            The second order force constant
+        tensor3 : ForceTensor.Tensor3()
+            The third order force constant
+        k_grid : (nk1, nk2, nk3)
+            The integration grid
+        q : ndarray(size = 3)
+            The q point (2pi/Angstrom)
+        T : float or ndarray(size = nT)
+            The temperature (K)
+        verbose, phonon_cache, schedule :
+            See get_tetrahedron_diag_bubble
+
+    Results
+    -------
+        w_q : ndarray(size = 3*nat)
+            The frequencies in q (Ry)
+        hwhm : ndarray(size = 3*nat)
+            The half width at half maximum (Ry).
+            If T is an array, the size is (nT, 3*nat).
+    """
+
+    im_bubble, w_q = get_tetrahedron_diag_bubble(tensor2, tensor3, k_grid, q, None, T,
+                                                 verbose = verbose, phonon_cache = phonon_cache,
+                                                 schedule = schedule)
+
+    hwhm = np.divide(-im_bubble, 2 * w_q, out = np.zeros_like(im_bubble), where = w_q != 0)
+
+    return w_q, hwhm
+
+
+def get_tetrahedron_two_phonon_dos(tensor2, k_grid, q, energies, T,
+                                   phonon_cache = None,
+                                   schedule = "static"):
+    """
+    TWO PHONON DOS (TETRAHEDRA)
+    ===========================
+
+    The two phonon density of states in q, integrated with the linear tetrahedron method
+
+    .. math ::
+
+        \\rho^{(2)}(E) = \\frac{1}{N_k}\\sum_{k\\rho_2\\rho_3}\\left[(1 + n_2 + n_3)(\\delta(E - \\Omega_+) - \\delta(E + \\Omega_+))
+        + (n_2 - n_3)(\\delta(E - \\Omega_-) - \\delta(E + \\Omega_-))\\right]
+
+    with :math:`\\Omega_\\pm = \\omega_3 \\pm \\omega_2`, where 2 and 3 are the modes in k and -q-k.
+    It is the density of the decay and scattering channels of the bubble (odd in E).
+    The acoustic modes in Gamma are excluded.
+
+    Parameters
+    ----------
+        tensor2 : ForceTensor.Tensor2()
+            The second order force constant
+        k_grid : (nk1, nk2, nk3)
+            The integration grid
+        q : ndarray(size = 3)
+            The q point (2pi/Angstrom)
+        energies : ndarray(size = ne)
+            The energies (Ry)
+        T : float or ndarray(size = nT)
+            The temperature (K)
+        phonon_cache : PhononGridCache()
+            The phonons in the k points (if None, a new one is created)
+        schedule : string
+            How the k points are split among the processes, "static" or "dynamic"
+            (see Settings.GoParallel).
+
+    Results
+    -------
+        dos : ndarray(size = ne)
+            The two phonon DOS (1/Ry).
+            If T is an array, the size is (nT, ne).
+    """
+
+    temperatures, is_scalar = _get_temperatures(T)
+
+    if phonon_cache is None:
+        phonon_cache = PhononGridCache(tensor2)
+    elif phonon_cache.tensor2 is not tensor2:
+        raise ValueError("Error, the phonon_cache must be created with the same tensor2")
+
+    k_points, tetrahedra = get_tetrahedra(tensor2.unitcell_structure, k_grid)
+    w_grid, w_mq_grid = _get_grid_phonons(phonon_cache, k_points, q)
+    energies = np.asarray(energies, dtype = np.double)
+
+    def compute_k(ik):
+        w_k = w_grid[ik][:, None]
+        w_mq_mk = w_mq_grid[ik][None, :]
+        t_index, corners = np.nonzero(tetrahedra == ik)
+        weights_plus, weights_minus = _get_pair_weights(energies, w_grid, w_mq_grid, tetrahedra[t_index], corners)
+
+        dos = []
+        for T_i in temperatures:
+            n_k = _get_bose(w_k, T_i)
+            n_mq_mk = _get_bose(w_mq_mk, T_i)
+            deltas = (1 + n_k + n_mq_mk) * weights_plus - (n_mq_mk - n_k) * weights_minus
+            dos.append(np.sum(deltas * ((w_k > 0) & (w_mq_mk > 0)), axis = (1, 2)))
+        return np.array(dos)
+
+    CC.Settings.SetupParallel()
+
+    dos = CC.Settings.GoParallel(compute_k, list(range(len(k_points))), reduce_op = "+",
+                                 schedule = schedule)
+
+    # The volume of each tetrahedron
+    dos /= len(tetrahedra)
+
+    if is_scalar:
+        dos = dos[0]
+
+    return dos
+
+
  # ================================================================================== 
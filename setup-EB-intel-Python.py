@@ -43,8 +43,8 @@ thirdorder_ext = Extension(name = "thirdorder",
                                  "FModules/third_order_ASR.f90",
                                  "FModules/third_order_interpol.f90",
                                  "FModules/third_order_dynbubble.f90"],
-                      extra_f90_compile_args = ["-fpp"],
-                      extra_link_args = ["-mkl"]
+                      extra_f90_compile_args = ["-fpp", "-qopenmp"],
+                      extra_link_args = ["-mkl", "-qopenmp"]
                       )
 
 
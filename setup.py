@@ -40,7 +40,8 @@ thirdorder_ext = Extension(name = "thirdorder",
                                  "FModules/third_order_interpol.f90",
                                  "FModules/third_order_dynbubble.f90"],
                       libraries= ["lapack", "blas"],
-                      extra_f90_compile_args = ["-cpp"]
+                      extra_f90_compile_args = ["-cpp", "-fopenmp"],
+                      extra_link_args = ["-fopenmp"]
                       )
 
 
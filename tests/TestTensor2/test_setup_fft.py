@@ -0,0 +1,51 @@
+from __future__ import print_function
+from __future__ import division
+
+import cellconstructor as CC
+import cellconstructor.Phonons
+import cellconstructor.ForceTensor
+
+import numpy as np
+import sys, os
+import pytest
+
+import symph
+
+
+def test_setup_from_phonons_fft():
+    # Move in the directory of the script
+    total_path = os.path.dirname(os.path.abspath(__file__))
+    os.chdir(total_path)
+
+    # Load the dynamical matrix
+    dyn = CC.Phonons.Phonons("../TestPhononSupercell/dynmat", 8)
+    supercell = dyn.GetSupercell()
+    super_structure = dyn.structure.generate_supercell(supercell)
+    itau = super_structure.get_itau(dyn.structure)
+
+    # Compute the real space force constant with the slow fourier transform
+    dynq = np.array(dyn.dynmats)
+    q_tot = np.array(dyn.q_tot)
+    fc_slow = symph.fast_ft_real_space_from_dynq(dyn.structure.coords, super_structure.coords, 
+                                                 itau, q_tot, dynq, dyn.structure.N_atoms,
+                                                 super_structure.N_atoms, len(q_tot))
+    
+    # The slow transform is accurate only to about 1e-9
+    fc_fft = dyn.GetRealSpaceFC(supercell)
+    dist = np.max(np.abs(fc_slow - fc_fft))
+    assert dist < 1e-8 * np.max(np.abs(fc_fft)), "Error, the FFT supercell force constant is wrong by {}".format(dist)
+
+    # Check the tensor setup
+    t2_fft = CC.ForceTensor.Tensor2(dyn.structure, super_structure, supercell)
+    t2_fft.SetupFromPhonons(dyn)
+
+    t2_slow = CC.ForceTensor.Tensor2(dyn.structure, super_structure, supercell)
+    t2_slow.SetupFromTensor(np.real(fc_slow))
+
+    assert np.max(np.abs(t2_fft.tensor - t2_slow.tensor)) < 1e-8 * np.max(np.abs(t2_slow.tensor))
+    assert np.max(np.abs(t2_fft.r_vector2 - t2_slow.r_vector2)) < 1e-10
+    assert np.all(t2_fft.x_r_vector2 == t2_slow.x_r_vector2)
+
+
+if __name__ == "__main__":
+    test_setup_from_phonons_fft()
@@ -0,0 +1,41 @@
+from __future__ import print_function
+from __future__ import division
+
+import cellconstructor as CC
+import cellconstructor.Phonons
+import cellconstructor.ForceTensor
+
+import numpy as np
+import sys, os
+import pytest
+
+
+def test_binary_tensor2(tmpdir):
+    # Move in the directory of the script
+    total_path = os.path.dirname(os.path.abspath(__file__))
+    os.chdir(total_path)
+
+    # Load the dynamical matrix with the effective charges
+    dyn = CC.Phonons.Phonons("../TestEffChargeInterp/dyn", 32)
+
+    t2 = CC.ForceTensor.Tensor2(dyn.structure, dyn.structure.generate_supercell(dyn.GetSupercell()), dyn.GetSupercell())
+    t2.verbose = False
+    t2.SetupFromPhonons(dyn)
+    t2.Center()
+
+    fname = os.path.join(str(tmpdir), "fc2")
+    t2.WriteOnFile(fname, file_format = "binary")
+
+    new_t2 = CC.ForceTensor.Tensor2(dyn.structure, dyn.structure.generate_supercell(dyn.GetSupercell()), dyn.GetSupercell())
+    new_t2.SetupFromFile(fname, file_format = "binary", memmap = True)
+
+    q = np.array([0.1, 0.2, 0.3]) / dyn.alat
+    fc = t2.Interpolate(q)
+    new_fc = new_t2.Interpolate(q)
+
+    assert np.max(np.abs(fc - new_fc)) / np.max(np.abs(fc)) < 1e-10
+
+
+if __name__ == "__main__":
+    import tempfile
+    test_binary_tensor2(tempfile.mkdtemp())
@@ -0,0 +1,68 @@
+from __future__ import print_function
+from __future__ import division
+
+import cellconstructor as CC
+import cellconstructor.Phonons
+import cellconstructor.ForceTensor
+
+import numpy as np
+import sys, os
+import pytest
+
+
+def test_interpolate_many():
+    # Move in the directory of the script
+    total_path = os.path.dirname(os.path.abspath(__file__))
+    os.chdir(total_path)
+
+    # Load the dynamical matrix
+    dyn = CC.Phonons.Phonons("../TestSymmetriesSupercell/SnSe.dyn.2x2x2", 3)
+
+    t2 = CC.ForceTensor.Tensor2(dyn.structure,
+                                dyn.structure.generate_supercell(dyn.GetSupercell()),
+                                dyn.GetSupercell())
+    t2.SetupFromPhonons(dyn)
+    t2.Center()
+
+    # Pick some random q points and the ones of the grid
+    bg = dyn.structure.get_reciprocal_vectors()
+    np.random.seed(0)
+    q_points = np.random.uniform(-1, 1, size = (10, 3)).dot(bg) / (2*np.pi)
+    q_points = np.concatenate((q_points, np.array(dyn.q_tot)))
+
+    for asr in [False, True]:
+        fc_many = t2.Interpolate_many(q_points, asr = asr)
+
+        assert fc_many.shape == (len(q_points), 3*dyn.structure.N_atoms, 3*dyn.structure.N_atoms)
+
+        for iq, q in enumerate(q_points):
+            fc_single = t2.Interpolate(q, asr = asr)
+            dist = np.max(np.abs(fc_single - fc_many[iq, :, :]))
+            assert dist < 1e-10, "Error, the q = {} is wrong by {} (asr = {}).".format(q, dist, asr)
+
+
+def test_interpolate_many_eff_charges():
+    # Move in the directory of the script
+    total_path = os.path.dirname(os.path.abspath(__file__))
+    os.chdir(total_path)
+
+    # Load the dynamical matrix with the effective charges
+    dyn = CC.Phonons.Phonons("../TestEffChargeInterp/dyn", 32)
+
+    t2 = CC.ForceTensor.Tensor2(dyn.structure, dyn.structure.generate_supercell(dyn.GetSupercell()), dyn.GetSupercell())
+    t2.verbose = False
+    t2.SetupFromPhonons(dyn)
+    t2.Center()
+
+    q_points = np.array([[0.25, 0, 0], [0.1, 0.2, 0.3], [0.5, 0.5, 0]]) / dyn.alat
+    fc_many = t2.Interpolate_many(q_points)
+
+    for iq, q in enumerate(q_points):
+        fc_single = t2.Interpolate(q)
+        dist = np.max(np.abs(fc_single - fc_many[iq, :, :])) / np.max(np.abs(fc_single))
+        assert dist < 1e-10, "Error, the q = {} is wrong by {}.".format(q, dist)
+
+
+if __name__ == "__main__":
+    test_interpolate_many()
+    test_interpolate_many_eff_charges()
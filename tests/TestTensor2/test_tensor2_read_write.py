@@ -0,0 +1,44 @@
+from __future__ import print_function
+from __future__ import division
+
+import cellconstructor as CC
+import cellconstructor.Phonons
+import cellconstructor.ForceTensor
+
+import numpy as np
+import sys, os
+import pytest
+
+
+@pytest.mark.parametrize("file_format", ["Phonopy", "D3Q"])
+def test_read_write_tensor2(file_format, tmpdir):
+    # Move in the directory of the script
+    total_path = os.path.dirname(os.path.abspath(__file__))
+    os.chdir(total_path)
+
+    dyn = CC.Phonons.Phonons("../TestSymmetriesSupercell/SnSe.dyn.2x2x2", 3)
+    supercell = dyn.GetSupercell()
+
+    t2 = CC.ForceTensor.Tensor2(dyn.structure, dyn.structure.generate_supercell(supercell), supercell)
+    t2.verbose = False
+    t2.SetupFromPhonons(dyn)
+    t2.Center()
+
+    fname = os.path.join(str(tmpdir), "fc2.dat")
+    t2.WriteOnFile(fname, file_format = file_format)
+
+    new_t2 = CC.ForceTensor.Tensor2(dyn.structure, dyn.structure.generate_supercell(supercell), supercell)
+    new_t2.verbose = False
+    new_t2.SetupFromFile(fname, file_format = file_format)
+
+    assert new_t2.n_R == t2.n_R
+    assert np.all(new_t2.x_r_vector2 == t2.x_r_vector2)
+
+    thr = 1e-8 * np.max(np.abs(t2.tensor))
+    assert np.max(np.abs(new_t2.tensor - t2.tensor)) < thr
+
+
+if __name__ == "__main__":
+    import tempfile
+    test_read_write_tensor2("Phonopy", tempfile.mkdtemp())
+    test_read_write_tensor2("D3Q", tempfile.mkdtemp())